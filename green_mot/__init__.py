@@ -0,0 +1,9 @@
+'''
+Shared helpers for the green MOT analysis scripts and the quick analysis tools.
+
+The scripts in the main directory and in "quick analysis tools" used to each carry their own copy of the
+folder walking, h5 reading and cropping code. The pieces that are needed by more than one script live here so
+they can be imported from lyse analysis files as well as from the standalone tools.
+
+Nothing heavy (numpy, h5py, cv2, matplotlib) is imported in this file on purpose, import the submodule you need.
+'''
@@ -0,0 +1,4 @@
+# python -m green_mot <command>, the same as the green-mot command, see green_mot/cli.py
+from green_mot.cli import main
+
+main()
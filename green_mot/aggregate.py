@@ -0,0 +1,267 @@
+'''
+Running one metric over every day folder in data/
+
+Each script is locked to one main_folder_path, this runs a metric over every experiment folder of every day
+(data/<day>/<experiment>) and merges the results into one table with a row per shot, keyed by day, experiment and
+shot file name. Experiments are processed in parallel worker processes. The metric of every shot is cached under
+the content hash of the shot, so running again after a new day was added only decodes the new day, and a shot
+that was copied into several folders is decoded once.
+
+Only the experiment folders are aggregated by default. folder_role() tells them from the background folders
+(background1, backgrounds2, ...), the zeeman slower reference shots and folders without shots (Videos), the
+roles argument takes those in as well and the role column of the table says which is which.
+
+A metric is a function metric(file_paths, roi, background) -> {column name: array with one value per file}, the
+available ones are in the metrics dict. pixel_sum and peak use the raw frames. signal_sum subtracts the
+background of the day first: the mean frame of every background folder of the day, added up, like the "mean"
+strategy of green_mot/pipeline.py. It is NaN on days without background folders. Run from the repository root with
+    python -m green_mot.aggregate pixel_sum top bottom left right [output.csv]
+'''
+
+import csv
+import hashlib
+import os
+import pickle
+import re
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+
+import numpy as np
+
+from green_mot.catalog import build_catalog, globals_column
+from green_mot.prefetch import PrefetchLoader
+from green_mot.shots import cache_directory, data_directory, list_shot_files, load_roi_stack
+
+aggregate_directory = os.path.join(cache_directory, 'aggregate')
+
+
+def metric_pixel_sum(file_paths, roi, background=None):
+    # Sum of the cropped frame in float64, no background subtraction
+    sums = np.full(len(file_paths), np.nan)
+    index = {file_path: i for i, file_path in enumerate(file_paths)}
+    for file_path, frame, _ in PrefetchLoader(file_paths, roi, with_globals=False):
+        sums[index[file_path]] = frame.sum(dtype=np.float64)
+    return {'pixel_sum': sums}
+
+
+def metric_peak(file_paths, roi, background=None):
+    # Brightest pixel and mean of the crop
+    peak = np.full(len(file_paths), np.nan)
+    mean = np.full(len(file_paths), np.nan)
+    index = {file_path: i for i, file_path in enumerate(file_paths)}
+    for file_path, frame, _ in PrefetchLoader(file_paths, roi, with_globals=False):
+        peak[index[file_path]] = frame.max()
+        mean[index[file_path]] = frame.mean(dtype=np.float64)
+    return {'peak': peak, 'mean': mean}
+
+
+def metric_signal_sum(file_paths, roi, background=None):
+    # Sum of the cropped frame minus the day's background crop, clipped at zero, NaN without a background
+    sums = np.full(len(file_paths), np.nan)
+    if background is None:
+        return {'signal_sum': sums}
+    index = {file_path: i for i, file_path in enumerate(file_paths)}
+    for file_path, frame, _ in PrefetchLoader(file_paths, roi, with_globals=False):
+        sums[index[file_path]] = np.clip(frame.astype(np.float32) - background, 0, None).sum(dtype=np.float64)
+    return {'signal_sum': sums}
+
+
+metrics = {
+    'pixel_sum': metric_pixel_sum,
+    'peak': metric_peak,
+    'signal_sum': metric_signal_sum,
+}
+
+# Metrics that get the background of the day
+background_metrics = ('signal_sum',)
+
+
+def day_folders(root=data_directory):
+    # Folders named like 20250110_first_data, in date order
+    return sorted(os.path.join(root, name) for name in os.listdir(root)
+                  if re.match(r"\d{8}", name) and os.path.isdir(os.path.join(root, name)))
+
+
+def folder_role(folder_path):
+    # 'background', 'zeeman' (reference shots of the zeeman slower), 'empty' (no shots, e.g. Videos) or 'experiment'
+    name = os.path.basename(os.path.normpath(folder_path)).lower()
+    if 'background' in name:
+        return 'background'
+    if 'zeeman' in name:
+        return 'zeeman'
+    if not list_shot_files(folder_path, recursive=True):
+        return 'empty'
+    return 'experiment'
+
+
+def experiment_folders(day_folder, roles=('experiment',)):
+    # Subfolders of a day whose folder_role() is in roles
+    folders = sorted(os.path.join(day_folder, name) for name in os.listdir(day_folder)
+                     if os.path.isdir(os.path.join(day_folder, name)))
+    return [folder for folder in folders if folder_role(folder) in roles]
+
+
+def day_of(file_path, root=data_directory):
+    # Day folder a shot belongs to, the first folder below root on its path
+    relative = os.path.relpath(os.path.abspath(file_path), root)
+    return os.path.join(root, relative.split(os.sep)[0])
+
+
+@lru_cache(maxsize=16)
+def day_background(day_folder, roi):
+    '''
+    (background crop, key) of a day: the mean cropped frame of every background folder, added up, float32.
+    key is a hash of the content of the background shots. (None, '') when the day has no background shots.
+    Kept per process, roi must be a tuple.
+    '''
+    background = None
+    digests = []
+    for folder in experiment_folders(day_folder, roles=('background',)):
+        catalog = build_catalog(folder, recursive=True)
+        stack, used_paths = load_roi_stack([p for p, f in zip(catalog['file_path'], catalog['has_frame']) if f], roi)
+        if stack is None:
+            continue
+        mean = stack.mean(axis=0, dtype=np.float32)
+        background = mean if background is None else background + mean
+        hashes = dict(zip(catalog['file_path'], catalog['content_hash']))
+        digests.extend(hashes[p] for p in used_paths)
+    if background is None:
+        return None, ''
+    return background, hashlib.sha1('|'.join(digests).encode()).hexdigest()
+
+
+def _experiment_shots(experiment_folder):
+    # Catalog columns of one experiment folder that aggregate() needs, runs in a worker process
+    catalog = build_catalog(experiment_folder, recursive=True)
+    rows = [i for i, has_frame in enumerate(catalog['has_frame']) if has_frame]
+    t_wait = globals_column(catalog, 'T_WAIT')
+    return {
+        'file_path': [catalog['file_path'][i] for i in rows],
+        'content_hash': [catalog['content_hash'][i] for i in rows],
+        't_wait': t_wait[rows],
+    }
+
+
+def _metric_rows(metric_name, file_paths, roi, background=None):
+    # {file path: {column: value}} of a metric over some shots, runs in a worker process
+    columns = metrics[metric_name](file_paths, roi, background)
+    return {file_path: {name: values[i] for name, values in columns.items()} for i, file_path in enumerate(file_paths)}
+
+
+def _shot_results_path(metric_name, roi):
+    key = hashlib.sha1(f"{metric_name}|{tuple(roi) if roi else None}".encode()).hexdigest()
+    return os.path.join(aggregate_directory, f"{metric_name}-{key}.pickle")
+
+
+def aggregate(metric_name, roi=None, days=None, workers=None, roles=('experiment',)):
+    '''
+    Run a metric over every experiment of every day folder and return one merged table (dict of columns) with
+    the columns day, experiment, role, shot, file_path, t_wait and the metric columns, sorted by day, experiment,
+    shot. days limits the run to some day folder names, workers is the number of processes (all cores by
+    default), roles the folder roles that are included (see folder_role).
+
+    The metric values are cached per shot content (green_mot/catalog.py) for every metric and roi, so a shot is
+    only analysed once however many folders hold a copy of it, and a new day only costs its new shots. Metrics
+    that subtract the background are cached per shot and background content.
+    '''
+    if metric_name not in metrics:
+        raise ValueError(f"Unknown metric '{metric_name}', available: {', '.join(metrics)}")
+
+    tasks = []
+    backgrounds = {}  # day -> (background crop, key)
+    for day_folder in day_folders():
+        day = os.path.basename(day_folder)
+        if days is not None and day not in days:
+            continue
+        if metric_name in background_metrics:
+            backgrounds[day] = day_background(day_folder, tuple(roi))
+            if backgrounds[day][0] is None:
+                print(f"Warning: {day} has no background folders, {metric_name} is NaN for its shots")
+        for experiment_folder in experiment_folders(day_folder, roles):
+            tasks.append((day, os.path.basename(experiment_folder), experiment_folder))
+
+    results_path = _shot_results_path(metric_name, roi)
+    shot_results = {}  # content hash -> {column: value}
+    if os.path.exists(results_path):
+        with open(results_path, 'rb') as f:
+            shot_results = pickle.load(f)
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        experiments = list(pool.map(_experiment_shots, [folder for _, _, folder in tasks]))
+
+        # Every shot that is not cached yet is analysed once, in the first experiment folder that has it. The
+        # results are keyed by the shot content, and by the background content for the background metrics
+        missing = {}
+        for (day, _, _), shots in zip(tasks, experiments):
+            background_key = backgrounds[day][1] if day in backgrounds else ''
+            for file_path, digest in zip(shots['file_path'], shots['content_hash']):
+                key = f"{digest}:{background_key}" if background_key else digest
+                if key not in shot_results:
+                    missing.setdefault(key, (file_path, day))
+        by_folder = {}
+        for key, (file_path, day) in missing.items():
+            by_folder.setdefault((os.path.dirname(file_path), day), []).append(file_path)
+        futures = [pool.submit(_metric_rows, metric_name, file_paths, roi,
+                               backgrounds[day][0] if day in backgrounds else None)
+                   for (_, day), file_paths in by_folder.items()]
+        values_by_path = {}
+        for future in futures:
+            values_by_path.update(future.result())
+
+    if missing:
+        for key, (file_path, _) in missing.items():
+            shot_results[key] = values_by_path[file_path]
+        os.makedirs(aggregate_directory, exist_ok=True)
+        temporary_path = results_path + '.tmp'
+        with open(temporary_path, 'wb') as f:
+            pickle.dump(shot_results, f)
+        os.replace(temporary_path, results_path)
+    print(f"{metric_name}: {len(missing)} shots analysed, the others were cached or copies")
+
+    merged = {'day': [], 'experiment': [], 'role': [], 'shot': [], 'file_path': [], 't_wait': []}
+    metric_columns = []
+    for (day, experiment, experiment_folder), shots in zip(tasks, experiments):
+        background_key = backgrounds[day][1] if day in backgrounds else ''
+        role = folder_role(experiment_folder)
+        for file_path, digest, t_wait in zip(shots['file_path'], shots['content_hash'], shots['t_wait']):
+            merged['day'].append(day)
+            merged['experiment'].append(experiment)
+            merged['role'].append(role)
+            merged['shot'].append(os.path.relpath(file_path, experiment_folder))
+            merged['file_path'].append(file_path)
+            merged['t_wait'].append(t_wait)
+            key = f"{digest}:{background_key}" if background_key else digest
+            for name, value in shot_results[key].items():
+                if name not in metric_columns:
+                    metric_columns.append(name)
+                merged.setdefault(name, []).append(value)
+
+    for name in ['t_wait'] + metric_columns:
+        merged[name] = np.asarray(merged[name], dtype=np.float64)
+    return merged
+
+
+def row_index(table):
+    # (day, experiment, shot) -> row number
+    return {key: i for i, key in enumerate(zip(table['day'], table['experiment'], table['shot']))}
+
+
+def write_csv(table, output_path):
+    names = list(table)
+    with open(output_path, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(names)
+        for row in zip(*(table[name] for name in names)):
+            writer.writerow(row)
+    print(f"Wrote {len(table['file_path'])} rows to {output_path}")
+
+
+if __name__ == '__main__':
+    import sys
+
+    if len(sys.argv) not in (6, 7):
+        print("usage: python -m green_mot.aggregate <metric> <top> <bottom> <left> <right> [output.csv]")
+        print(f"  metrics: {', '.join(metrics)}")
+        sys.exit(1)
+    table = aggregate(sys.argv[1], tuple(int(v) for v in sys.argv[2:6]))
+    write_csv(table, sys.argv[6] if len(sys.argv) == 7 else f"aggregate_{sys.argv[1]}.csv")
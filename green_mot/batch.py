@@ -0,0 +1,243 @@
+'''
+Resumable batch runs
+
+A reanalysis of every day in data/ takes long, and the scripts keep everything in memory until the end, so one
+corrupt shot file or a Ctrl-C means starting again. run_batch() splits the work into units (one metric of one
+shot, one video of one folder, ...) and appends a line to a journal file (JSON lines) as soon as a unit finishes
+or fails. Started again with the same journal, it skips every unit that is already done. A unit that raised is
+recorded with its error and the run goes on with the next one, the failures are listed in an error report at the
+end (and retried with retry_failed=True).
+
+A unit is a tuple (key, signature, function, args). key names the unit, signature describes its inputs (e.g.
+mtime and size of the shot file): a unit is only skipped if it was done with the same signature, so a shot that
+changed since is analysed again. function(*args) must return something json can store.
+
+Run a full reanalysis from the repository root with
+    python -m green_mot.batch <journal.jsonl> <metric> <top> <bottom> <left> <right> [--videos] [--retry-failed]
+                              [--executor inline|process|tcp] [--workers <n>] [--listen <host>:<port>]
+which journals one unit per shot and metric (and one per experiment folder for the videos) over every day folder
+and writes the metric table next to the journal as csv. With --executor tcp the units are handed out to workers
+started with python -m green_mot.executors worker <host>:<port> on any machine that sees the data folder.
+'''
+
+import json
+import os
+import time
+import traceback
+
+import numpy as np
+
+from green_mot.shots import shot_stat
+
+
+def _json_value(value):
+    # numpy results as plain python values for the journal
+    if isinstance(value, dict):
+        return {str(k): _json_value(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_json_value(v) for v in value]
+    if isinstance(value, np.ndarray):
+        return _json_value(value.tolist())
+    if isinstance(value, np.generic):
+        return value.item()
+    return value
+
+
+class Journal:
+    '''
+    Append only record of finished units. Every record is one json line that is flushed and synced to disk
+    before the next unit starts, a line cut short by a crash is ignored when the journal is read again.
+    '''
+
+    def __init__(self, journal_path):
+        self.journal_path = journal_path
+        self.records = {}  # key -> last record of that unit
+        if os.path.exists(journal_path):
+            with open(journal_path) as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except json.JSONDecodeError:
+                        continue
+                    self.records[record['key']] = record
+        os.makedirs(os.path.dirname(os.path.abspath(journal_path)), exist_ok=True)
+        self._file = open(journal_path, 'a')
+
+    def is_done(self, key, signature):
+        record = self.records.get(key)
+        return record is not None and record['status'] == 'done' and record['signature'] == signature
+
+    def has_failed(self, key, signature):
+        record = self.records.get(key)
+        return record is not None and record['status'] == 'failed' and record['signature'] == signature
+
+    def append(self, record):
+        self.records[record['key']] = record
+        self._file.write(json.dumps(record) + '\n')
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+    def failures(self):
+        return [record for record in self.records.values() if record['status'] == 'failed']
+
+    def close(self):
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def run_unit(function, args):
+    # (status, result, error) of one unit, the error as the last lines of the traceback
+    try:
+        return 'done', _json_value(function(*args)), None
+    except Exception as error:
+        lines = traceback.format_exception(type(error), error, error.__traceback__)
+        return 'failed', None, ''.join(lines[-2:]).strip()
+
+
+def run_batch(units, journal_path, retry_failed=False, executor=None):
+    '''
+    Run every unit that is not done yet and journal it. Returns {key: result} of all units that are done, from
+    this run and from earlier runs with the same journal. Ctrl-C stops after the journal is written, the next run
+    starts with the units that were interrupted.
+    executor runs the units, one after the other in this process by default, see green_mot/executors.py.
+    '''
+    from green_mot.executors import InlineExecutor
+
+    executor = executor or InlineExecutor()
+    with Journal(journal_path) as journal:
+        pending = [unit for unit in units if not journal.is_done(unit[0], unit[1])
+                   and (retry_failed or not journal.has_failed(unit[0], unit[1]))]
+        print(f"{len(units) - len(pending)} of {len(units)} units already done or failed before, "
+              f"{len(pending)} to run")
+
+        start = time.time()
+        for i, ((key, signature, _, _), status, result, error) in enumerate(executor.run(pending)):
+            journal.append({'key': key, 'signature': signature, 'status': status, 'result': result, 'error': error,
+                            'time': time.time()})
+            if error is not None:
+                print(f"Warning: {key} failed: {error.splitlines()[-1]}")
+            if (i + 1) % 50 == 0 or i + 1 == len(pending):
+                print(f"{i + 1} / {len(pending)} units in {time.time() - start:.1f} s")
+
+        write_error_report(journal, os.path.splitext(journal_path)[0] + '_errors.txt')
+        keys = {unit[0] for unit in units}
+        return {key: record['result'] for key, record in journal.records.items()
+                if key in keys and record['status'] == 'done'}
+
+
+def write_error_report(journal, report_path):
+    # One block per failed unit, the report is removed once nothing fails anymore
+    failures = journal.failures()
+    if not failures:
+        if os.path.exists(report_path):
+            os.remove(report_path)
+        return
+    with open(report_path, 'w') as f:
+        for record in failures:
+            f.write(f"{record['key']}\n{record['error']}\n\n")
+    print(f"{len(failures)} units failed, see {report_path}")
+
+
+def shot_signature(file_path):
+    stat = shot_stat(file_path)
+    return [stat.st_mtime_ns, stat.st_size]
+
+
+def shot_metric(metric_name, file_path, roi):
+    # One metric of one shot, {column: value}
+    from green_mot.aggregate import background_metrics, day_background, day_of, metrics
+
+    background = day_background(day_of(file_path), tuple(roi))[0] if metric_name in background_metrics else None
+    result = {'file_path': file_path}
+    result.update({name: values[0] for name, values in metrics[metric_name]([file_path], roi, background).items()})
+    return result
+
+
+def folder_video(folder_path, output_path, roi):
+    from green_mot.videos import render_folder_video
+
+    return render_folder_video(folder_path, output_path, roi)[1]
+
+
+def reanalysis_units(metric_name, roi, videos=False):
+    '''
+    Units for a metric of every shot of every experiment folder of every day folder, plus one video per
+    experiment folder when videos=True. Unit keys are "<metric>:<day>/<experiment>/<shot>" and
+    "video:<day>/<experiment>".
+    '''
+    from green_mot.aggregate import day_folders, experiment_folders
+    from green_mot.shots import list_shot_files
+
+    units = []
+    for day_folder in day_folders():
+        for experiment_folder in experiment_folders(day_folder):
+            relative = f"{os.path.basename(day_folder)}/{os.path.basename(experiment_folder)}"
+            shot_files = list_shot_files(experiment_folder, recursive=True)
+            for file_path in shot_files:
+                key = f"{metric_name}:{relative}/{os.path.relpath(file_path, experiment_folder)}"
+                units.append((key, shot_signature(file_path) + [list(roi)], shot_metric,
+                              (metric_name, file_path, roi)))
+            if videos and shot_files:
+                output_path = os.path.join(experiment_folder, f"{os.path.basename(experiment_folder)}.mp4")
+                signature = [shot_signature(p) for p in shot_files] + [list(roi)]
+                units.append((f"video:{relative}", signature, folder_video, (experiment_folder, output_path, roi)))
+    return units
+
+
+def results_table(results, metric_name):
+    # Column table of the per shot metric results, one row per shot
+    table = {'day': [], 'experiment': [], 'shot': [], 'file_path': []}
+    prefix = f"{metric_name}:"
+    for key, result in sorted(results.items()):
+        if not key.startswith(prefix):
+            continue
+        day, experiment, shot = key[len(prefix):].split('/', 2)
+        table['day'].append(day)
+        table['experiment'].append(experiment)
+        table['shot'].append(shot)
+        for name, value in result.items():
+            table.setdefault(name, []).append(np.nan if value is None else value)
+    return table
+
+
+if __name__ == '__main__':
+    import sys
+
+    # The units must refer to green_mot.batch, not __main__, so that worker processes can unpickle them
+    from green_mot import batch
+    from green_mot.aggregate import metrics, write_csv
+    from green_mot.executors import default_address, make_executor, parse_address
+
+    flags = ('--videos', '--retry-failed')
+    options = {'--executor': 'inline', '--workers': None, '--listen': None}
+    arguments = []
+    remaining = sys.argv[1:]
+    while remaining:
+        argument = remaining.pop(0)
+        if argument in options and remaining:
+            options[argument] = remaining.pop(0)
+        elif argument not in flags:
+            arguments.append(argument)
+    if len(arguments) != 6:
+        print("usage: python -m green_mot.batch <journal.jsonl> <metric> <top> <bottom> <left> <right> "
+              "[--videos] [--retry-failed] [--executor inline|process|tcp] [--workers <n>] [--listen <host>:<port>]")
+        print(f"  metrics: {', '.join(metrics)}")
+        print("  --videos        also render the video of every experiment folder")
+        print("  --retry-failed  run the units that failed in an earlier run again")
+        print("  --executor      inline (default), process (pool on this machine) or tcp (workers on several machines)")
+        print("  --workers       processes of the pool, or for tcp the number of workers to start on this machine")
+        print(f"  --listen        address the tcp coordinator listens on, default {default_address[0]}:"
+              f"{default_address[1]}, other than localhost it needs the same secret GREEN_MOT_AUTHKEY as the workers")
+        sys.exit(1)
+    journal_path, metric_name = arguments[:2]
+    roi = tuple(int(v) for v in arguments[2:6])
+    workers = int(options['--workers']) if options['--workers'] else None
+    address = parse_address(options['--listen']) if options['--listen'] else default_address
+    results = batch.run_batch(batch.reanalysis_units(metric_name, roi, '--videos' in sys.argv), journal_path,
+                              '--retry-failed' in sys.argv, make_executor(options['--executor'], workers, address))
+    write_csv(batch.results_table(results, metric_name), os.path.splitext(journal_path)[0] + '.csv')
@@ -0,0 +1,85 @@
+'''
+Converting pixel sums to atom numbers
+
+A pixel sum is in camera counts. With the camera and imaging parameters it becomes a number of atoms:
+
+    photoelectrons     = counts * camera_gain                       (camera_gain in electrons per count)
+    photons on camera  = photoelectrons / quantum_efficiency
+    photons scattered  = photons on camera * 4 pi / collection_solid_angle
+    atoms              = photons scattered / (scattering_rate * exposure)
+
+Every parameter is taken per shot from the labscript globals if the shot has it (the global names are in
+global_names), otherwise from the calibration config, a plain dict with the same keys. The conversion is done on
+whole columns in float64, so a day of shots is converted in one call and the numbers can be compared across
+folders and days even when the exposure or the probe detuning changed in between.
+'''
+
+import numpy as np
+
+from green_mot.catalog import globals_column, num_rows
+
+# Calibration parameter -> labscript global that overrides the config value for a shot
+global_names = {
+    'camera_gain': 'CAMERA_GAIN',
+    'quantum_efficiency': 'QUANTUM_EFFICIENCY',
+    'exposure': 'EXPOSURE_TIME',
+    'collection_solid_angle': 'COLLECTION_SOLID_ANGLE',
+    'scattering_rate': 'SCATTERING_RATE',
+}
+
+# Natural linewidth of the 556 nm 1S0 - 3P1 line of Yb, in rad/s
+green_linewidth = 2 * np.pi * 182e3
+
+
+def scattering_rate(saturation_parameter, detuning=0.0, linewidth=green_linewidth):
+    # Photons scattered per atom per second, detuning in rad/s
+    s = np.asarray(saturation_parameter, dtype=np.float64)
+    delta = np.asarray(detuning, dtype=np.float64)
+    return linewidth / 2 * s / (1 + s + 4 * delta ** 2 / linewidth ** 2)
+
+
+def solid_angle_from_na(numerical_aperture):
+    # Solid angle in sr collected by a lens with the given numerical aperture
+    return 2 * np.pi * (1 - np.sqrt(1 - np.asarray(numerical_aperture, dtype=np.float64) ** 2))
+
+
+def pixel_sums(stack):
+    # Sum of every frame of an (N, H, W) stack, accumulated in float64 so large crops can not overflow
+    return np.asarray(stack).sum(axis=(-2, -1), dtype=np.float64)
+
+
+def parameter_column(table, name, config):
+    '''
+    One calibration parameter for every row of a catalog or results table, from the globals where present and
+    from config everywhere else. Raises ValueError if some rows have neither.
+    '''
+    n = num_rows(table)
+    values = np.full(n, np.nan)
+    if 'globals' in table:
+        values = globals_column(table, global_names[name])
+    default = config.get(name, None) if config else None
+    if default is not None:
+        values = np.where(np.isnan(values), float(default), values)
+    if np.isnan(values).any():
+        raise ValueError(f"Calibration parameter '{name}' is missing for {int(np.isnan(values).sum())} shots, "
+                         f"set it in the config or as the global {global_names[name]}")
+    return values
+
+
+def counts_to_atoms(counts, camera_gain, quantum_efficiency, exposure, collection_solid_angle, scattering_rate):
+    # Vectorized conversion, all arguments broadcast against each other
+    counts = np.asarray(counts, dtype=np.float64)
+    photons_on_camera = counts * camera_gain / quantum_efficiency
+    photons_scattered = photons_on_camera * (4 * np.pi / np.asarray(collection_solid_angle, dtype=np.float64))
+    return photons_scattered / (np.asarray(scattering_rate, dtype=np.float64) * exposure)
+
+
+def atom_numbers(table, counts, config=None):
+    '''
+    Atom number for every row of a table, counts is the column of pixel sums (same length as the table).
+    config holds the parameters that are not recorded as globals, e.g.
+        {'camera_gain': 0.5, 'quantum_efficiency': 0.6, 'exposure': 1e-3,
+         'collection_solid_angle': solid_angle_from_na(0.1), 'scattering_rate': scattering_rate(1.0)}
+    '''
+    parameters = {name: parameter_column(table, name, config) for name in global_names}
+    return counts_to_atoms(counts, **parameters)
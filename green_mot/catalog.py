@@ -0,0 +1,247 @@
+'''
+Shot catalog of a data folder
+
+The catalog holds one row per shot file with what can be learned without decoding the frame: file size and
+modification time, whether the frame dataset and the globals group exist, the frame shape, the run number and all
+globals. It is stored per folder as json in the cache folder, and only files that are new or have changed since
+the last call are opened again, so asking for the catalog of a folder that was seen before costs one stat per file.
+
+Every shot also gets a content hash of its frame and globals. The frame is hashed as it is stored: the compressed
+chunks are read without decompressing them, which takes a few ms per shot. Copies of a shot in other folders or
+days have the same hash, so the caches built on the catalog (cropped stacks in green_mot/pipeline.py, metric
+results in green_mot/aggregate.py, thumbnails) are keyed by the hash, and a copy is decoded and analysed only once.
+A repacked store keeps the pixels but not the chunks of the original file, so its shots hash differently.
+
+Catalogs and the results derived from them are plain column tables: a dict of column name -> list or numpy array,
+all of the same length. select() picks rows out of such a table.
+'''
+
+import hashlib
+import json
+import os
+
+from green_mot.shots import (_read_dataset, _to_python, cache_directory, dataset_path, list_shot_files,
+                             read_pixel_format, read_store_globals, shot_stat, split_shot_path)
+
+catalog_directory = os.path.join(cache_directory, 'catalog')
+
+# Bump when the per shot entry changes, older cache files are then rebuilt
+catalog_version = 3
+
+
+def _frame_digest(digest, dataset, index=None):
+    # Add the stored bytes of a frame (of frame index of a store) to a hashlib object, chunked datasets chunk by
+    # chunk as they are on disk, contiguous ones through their pixels
+    digest.update(f"{dataset.dtype.str}{dataset.shape[-2:]}".encode())
+    if dataset.chunks is not None:
+        chunk_height, chunk_width = dataset.chunks[-2:]
+        height, width = dataset.shape[-2:]
+        leading = () if index is None else (index,)
+        try:
+            for top in range(0, height, chunk_height):
+                for left in range(0, width, chunk_width):
+                    _, chunk = dataset.id.read_direct_chunk(leading + (top, left))
+                    digest.update(chunk)
+            return
+        except (OSError, RuntimeError, ValueError):
+            # A chunk that was never written, hash the pixels instead
+            pass
+    digest.update(_read_dataset(dataset, None, index).tobytes())
+
+
+def _content_hash(entry, dataset=None, index=None):
+    # Hash of the globals and the frame of a shot, dataset is None for a shot without a frame
+    digest = hashlib.sha1(json.dumps(entry['globals'], sort_keys=True, default=str).encode())
+    if dataset is not None:
+        _frame_digest(digest, dataset, index)
+    return digest.hexdigest()
+
+
+def _describe_shot(file_path, stat):
+    # Everything the catalog stores about one shot, read from the file without decoding the frame
+    store_path, index = split_shot_path(file_path)
+    entry = {
+        'mtime': stat.st_mtime_ns,
+        'size': stat.st_size,
+        'has_frame': False,
+        'frame_shape': None,
+        'frame_dtype': None,
+        'pixel_format': None,
+        'has_globals': False,
+        'globals': {},
+        'run_number': None,
+        'sequence_id': None,
+        'content_hash': None,
+        'error': None,
+    }
+    import h5py
+
+    try:
+        if index is not None:
+            return _describe_store_shot(entry, store_path, index)
+        with h5py.File(file_path, 'r') as f:
+            dataset = None
+            if dataset_path in f:
+                dataset = f[dataset_path]
+                entry['has_frame'] = dataset.size > 0
+                entry['frame_shape'] = list(dataset.shape)
+                entry['frame_dtype'] = str(dataset.dtype)
+            entry['pixel_format'] = read_pixel_format(f)
+            if 'globals' in f:
+                entry['has_globals'] = True
+                entry['globals'] = {key: _to_python(value) for key, value in f['globals'].attrs.items()}
+            entry['run_number'] = _to_python(f.attrs.get('run number', None))
+            entry['sequence_id'] = _to_python(f.attrs.get('sequence_id', None))
+            entry['content_hash'] = _content_hash(entry, dataset if entry['has_frame'] else None)
+    except OSError as error:
+        # A truncated or corrupt file still gets a row, screening decides what to do with it
+        entry['error'] = str(error)
+    return entry
+
+
+def _describe_store_shot(entry, store_path, index):
+    # Same entry for a shot inside a repacked store
+    import h5py
+
+    with h5py.File(store_path, 'r') as f:
+        entry['has_frame'] = bool(f['has_frame'][index])
+        entry['frame_shape'] = list(f['frames'].shape[1:])
+        entry['frame_dtype'] = str(f['frames'].dtype)
+        if 'pixel_format' in f['shots']:
+            entry['pixel_format'] = _to_python(f['shots/pixel_format'][index]) or None
+        entry['has_globals'] = bool(f['shots/has_globals'][index])
+        run_number = int(f['shots/run_number'][index])
+        entry['run_number'] = None if run_number < 0 else run_number
+        entry['sequence_id'] = _to_python(f['shots/sequence_id'][index]) or None
+        entry['globals'] = read_store_globals(store_path)[index]
+        entry['content_hash'] = _content_hash(entry, f['frames'] if entry['has_frame'] else None, index)
+    return entry
+
+
+def _catalog_cache_path(folder_path, recursive=True):
+    # The listing of a folder with and without its subfolders differs, each is cached in its own file
+    key = hashlib.sha1(os.path.abspath(folder_path).encode()).hexdigest()
+    return os.path.join(catalog_directory, f"{key}.json" if recursive else f"{key}-flat.json")
+
+
+def build_catalog(folder_path, recursive=True):
+    '''
+    Return the catalog of every shot under folder_path as a column table, sorted like list_shot_files.
+    Columns: file_path, mtime, size, has_frame, frame_shape, frame_dtype, pixel_format (of the camera, e.g. 'Mono8',
+    None if not recorded), has_globals, globals (one dict per shot), run_number, sequence_id, content_hash, error.
+    '''
+    return _to_columns(catalog_entries(folder_path, recursive))
+
+
+def catalog_entries(folder_path, recursive=True):
+    '''
+    The catalog as {shot path: entry dict}, the form it is cached in. Only needs h5py (and numpy) for shots that
+    are new or changed, so listing a folder that was seen before does not import them, see green_mot/cli.py.
+    '''
+    cache_path = _catalog_cache_path(folder_path, recursive)
+    cached = {}
+    if os.path.exists(cache_path):
+        with open(cache_path) as f:
+            stored = json.load(f)
+        if stored.get('version') == catalog_version:
+            cached = stored['shots']
+
+    entries = {}
+    changed = False
+    for file_path in list_shot_files(folder_path, recursive=recursive):
+        stat = shot_stat(file_path)
+        key = os.path.abspath(file_path)
+        entry = cached.get(key)
+        if entry is None or entry['mtime'] != stat.st_mtime_ns or entry['size'] != stat.st_size:
+            entry = _describe_shot(file_path, stat)
+            changed = True
+        entries[file_path] = entry
+    changed = changed or len(entries) != len(cached)
+
+    if changed:
+        os.makedirs(catalog_directory, exist_ok=True)
+        temporary_path = cache_path + '.tmp'
+        with open(temporary_path, 'w') as f:
+            json.dump({'version': catalog_version, 'folder': os.path.abspath(folder_path),
+                       'shots': {os.path.abspath(p): e for p, e in entries.items()}}, f)
+        os.replace(temporary_path, cache_path)
+
+    return entries
+
+
+# Content hashes looked up with content_hash(), keyed by (absolute path, mtime, size)
+_content_hashes = {}
+
+
+def content_hash(file_path):
+    '''
+    Content hash of one shot, from the catalog of the folder (or store) it is in. The first call for a folder
+    catalogs the whole folder, the hashes of its other shots are kept for the following calls.
+    '''
+    stat = shot_stat(file_path)
+    key = (os.path.abspath(file_path), stat.st_mtime_ns, stat.st_size)
+    if key not in _content_hashes:
+        store_path, index = split_shot_path(file_path)
+        folder_path = store_path if index is not None else os.path.dirname(os.path.abspath(file_path))
+        for path, entry in catalog_entries(folder_path, recursive=False).items():
+            _content_hashes[(os.path.abspath(path), entry['mtime'], entry['size'])] = entry['content_hash']
+    if key not in _content_hashes:
+        # Not a shot of its folder listing (e.g. not named .h5), described on its own
+        _content_hashes[key] = _describe_shot(file_path, stat)['content_hash']
+    return _content_hashes[key]
+
+
+def _to_columns(entries):
+    import numpy as np
+
+    paths = list(entries)
+    rows = [entries[p] for p in paths]
+    return {
+        'file_path': paths,
+        'mtime': np.array([row['mtime'] for row in rows], dtype=np.int64),
+        'size': np.array([row['size'] for row in rows], dtype=np.int64),
+        'has_frame': np.array([row['has_frame'] for row in rows], dtype=bool),
+        'frame_shape': [None if row['frame_shape'] is None else tuple(row['frame_shape']) for row in rows],
+        'frame_dtype': [row['frame_dtype'] for row in rows],
+        'pixel_format': [row['pixel_format'] for row in rows],
+        'has_globals': np.array([row['has_globals'] for row in rows], dtype=bool),
+        'globals': [row['globals'] for row in rows],
+        'run_number': [row['run_number'] for row in rows],
+        'sequence_id': [row['sequence_id'] for row in rows],
+        'content_hash': [row['content_hash'] for row in rows],
+        'error': [row['error'] for row in rows],
+    }
+
+
+def globals_column(table, name, default=float('nan')):
+    # One global as a float array, default where a shot does not have it or it is not a number
+    import numpy as np
+
+    values = []
+    for shot_globals in table['globals']:
+        value = shot_globals.get(name, default)
+        try:
+            values.append(float(value))
+        except (TypeError, ValueError):
+            values.append(default)
+    return np.array(values, dtype=np.float64)
+
+
+def num_rows(table):
+    return len(table['file_path'])
+
+
+def select(table, rows):
+    # New table with only the given rows, rows is a boolean mask or an array of indices
+    import numpy as np
+
+    rows = np.asarray(rows)
+    if rows.dtype == bool:
+        rows = np.flatnonzero(rows)
+    selected = {}
+    for name, column in table.items():
+        if isinstance(column, np.ndarray):
+            selected[name] = column[rows]
+        else:
+            selected[name] = [column[i] for i in rows]
+    return selected
@@ -0,0 +1,329 @@
+'''
+The green-mot command
+
+One entry point for the everyday tasks, run as green-mot <command> (after pip install -e .) or as
+python -m green_mot <command> from the repository root:
+
+    green-mot list <folder> [--recursive]              one line per shot: run number, frame, scanned globals
+    green-mot catalog <folder> [--recursive]           summary of a folder: shots, frames, constant and scanned globals
+    green-mot crop-preview <shot or folder> [--roi top bottom left right] [--index n] [--output png]
+    green-mot select-roi <folder> [--roi top bottom left right] [--pipeline <pipeline.toml>]
+    green-mot lifetime <day folder> [--roi top bottom left right]
+    green-mot sweep <folder> [--roi top bottom left right] [--output png]
+    green-mot video <day folder> <pattern> [<pattern> ...] [--output folder] [--roi ...] [--force] [--workers n]
+    green-mot compare <day folder> <pattern> [<pattern> ...] --output <mp4 or png> [--roi ...] [--normalization ...]
+
+numpy, h5py, cv2 and matplotlib are only imported inside the commands that need them. list and catalog work from
+the cached catalog (green_mot/catalog.py) and only open the shot files that are new or changed, so they start in
+a few tens of milliseconds and need no display. lifetime and sweep run initial_green_mot_lifetime.py and
+frequency_b_field_sweep_analysis.py with the folder and cropping region given on the command line in place of the
+values at the top of the scripts.
+'''
+
+import argparse
+import ast
+import os
+import sys
+
+from green_mot.shots import base_directory, is_repacked_store, split_shot_path
+
+# Same number of significant digits as green_mot/varying.py, so float noise does not count as a scanned value
+significant_digits = 12
+
+# Cropping region of crop-preview, video and compare when none is given, the one of green_mot/videos.py
+default_roi = (350, 1050, 950, 1650)
+
+
+def _value_key(value):
+    # Hashable form of a global for comparing the shots
+    if isinstance(value, float):
+        return float(f"{value:.{significant_digits}g}")
+    if isinstance(value, list):
+        return repr(value)
+    return value
+
+
+def _sort_key(value):
+    # Numbers first in numeric order, then everything else by its text
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return (0, value, '')
+    return (1, 0, repr(value))
+
+
+def _format_value(value):
+    if isinstance(value, float):
+        return f"{value:.6g}"
+    return str(value)
+
+
+def split_globals(entries):
+    '''
+    ({name: value} of the globals every shot has with the same value, {name: sorted distinct values} of the others)
+    for catalog entries. The same split as green_mot/varying.py, without numpy.
+    '''
+    values = {}
+    missing = {}
+    for entry in entries:
+        for name, value in entry['globals'].items():
+            values.setdefault(name, {}).setdefault(_value_key(value), value)
+    for name in values:
+        missing[name] = sum(name not in entry['globals'] for entry in entries)
+
+    constant = {}
+    varying = {}
+    for name in sorted(values):
+        if len(values[name]) == 1 and not missing[name]:
+            constant[name] = next(iter(values[name].values()))
+        else:
+            varying[name] = sorted(values[name].values(), key=_sort_key)
+    return constant, dict(sorted(varying.items(), key=lambda item: (-len(item[1]), item[0])))
+
+
+def _display_path(file_path, folder_path):
+    store_path, index = split_shot_path(file_path)
+    if index is not None:
+        return f"{os.path.basename(store_path)}::{index}"
+    return os.path.relpath(file_path, folder_path)
+
+
+def command_list(arguments):
+    from green_mot.catalog import catalog_entries
+
+    entries = catalog_entries(arguments.folder, arguments.recursive)
+    _, varying = split_globals(entries.values())
+    for file_path, entry in entries.items():
+        if entry['error'] is not None:
+            frame = f"error: {entry['error']}"
+        elif entry['has_frame']:
+            frame = 'x'.join(str(n) for n in entry['frame_shape'])
+        else:
+            frame = 'no frame'
+        line = f"{_display_path(file_path, arguments.folder)}  run {entry['run_number']}  {frame}"
+        scanned = [f"{name}={_format_value(entry['globals'][name])}" for name in varying if name in entry['globals']]
+        print(line + (f"  {' '.join(scanned)}" if scanned else ''))
+    print(f"{len(entries)} shots")
+
+
+def command_catalog(arguments):
+    from green_mot.catalog import catalog_entries
+
+    entries = list(catalog_entries(arguments.folder, arguments.recursive).values())
+    constant, varying = split_globals(entries)
+    shapes = {}
+    for entry in entries:
+        if entry['has_frame']:
+            shape = 'x'.join(str(n) for n in entry['frame_shape']) + f" {entry['frame_dtype']}"
+            shapes[shape] = shapes.get(shape, 0) + 1
+
+    print(f"Folder: {os.path.abspath(arguments.folder)}")
+    hashes = [entry['content_hash'] for entry in entries if entry['content_hash'] is not None]
+    print(f"Shots: {len(entries)}, with a frame: {sum(entry['has_frame'] for entry in entries)}, "
+          f"unreadable: {sum(entry['error'] is not None for entry in entries)}, "
+          f"copies of other shots: {len(hashes) - len(set(hashes))}")
+    for shape, count in shapes.items():
+        print(f"  frame {shape}: {count} shots")
+    print(f"Scanned globals ({len(varying)}):")
+    for name, values in varying.items():
+        shown = ', '.join(_format_value(v) for v in values[:8]) + (', ...' if len(values) > 8 else '')
+        print(f"  {name}: {len(values)} values: {shown}")
+    print(f"Constant globals ({len(constant)}):")
+    for name, value in constant.items():
+        print(f"  {name} = {_format_value(value)}")
+
+
+def command_crop_preview(arguments):
+    import matplotlib
+
+    if arguments.output:
+        matplotlib.use('Agg')
+    import matplotlib.patches as patches
+    import matplotlib.pyplot as plt
+
+    from green_mot.shots import list_shot_files, read_frame
+
+    file_path = arguments.path
+    if os.path.isdir(file_path) or _is_store(file_path):
+        file_path = list_shot_files(file_path, recursive=True)[arguments.index]
+    frame = read_frame(file_path)
+    if frame is None:
+        sys.exit(1)
+    top, bottom, left, right = arguments.roi
+
+    # The full frame with the cropping region drawn on it, the crop next to it
+    fig, axes = plt.subplots(1, 2, figsize=(12, 6))
+    axes[0].imshow(frame, cmap='gray')
+    axes[0].add_patch(patches.Rectangle((left, top), right - left, bottom - top, linewidth=2, edgecolor='r',
+                                        facecolor='none'))
+    axes[0].set_title(f"{os.path.basename(file_path)}")
+    axes[1].imshow(frame[top:bottom, left:right], cmap='gray')
+    axes[1].set_title(f"top={top}, bottom={bottom}, left={left}, right={right}")
+    plt.tight_layout()
+    if arguments.output:
+        fig.savefig(arguments.output)
+        print(f"Crop preview saved: {arguments.output}")
+    else:
+        plt.show()
+
+
+def command_select_roi(arguments):
+    from green_mot.roi_selector import select_roi
+
+    roi = arguments.roi
+    if roi is None and arguments.pipeline:
+        from green_mot.pipeline import load_spec
+
+        roi_config = load_spec(arguments.pipeline).get('roi')
+        if roi_config:
+            roi = (roi_config['top'], roi_config['bottom'], roi_config['left'], roi_config['right'])
+    select_roi(arguments.folder, roi, arguments.pipeline)
+
+
+def _is_store(path):
+    # True for a repacked store, which crop-preview treats like a folder
+    return split_shot_path(path)[1] is None and is_repacked_store(path)
+
+
+def run_script(script_name, parameters):
+    '''
+    Run one of the analysis scripts of the repository root with some of the parameters at its top replaced.
+    parameters is {variable name: value}, every top level assignment to one of the names gets the value instead.
+    '''
+    script_path = os.path.join(base_directory, script_name)
+    with open(script_path) as f:
+        tree = ast.parse(f.read(), script_path)
+    replaced = set()
+    for node in tree.body:
+        if isinstance(node, ast.Assign) and len(node.targets) == 1 and isinstance(node.targets[0], ast.Name):
+            name = node.targets[0].id
+            if name in parameters:
+                node.value = ast.Constant(parameters[name])
+                replaced.add(name)
+    for name in sorted(set(parameters) - replaced):
+        print(f"Warning: {script_name} has no parameter '{name}', ignored")
+    ast.fix_missing_locations(tree)
+    exec(compile(tree, script_path, 'exec'), {'__name__': '__main__', '__file__': script_path})
+
+
+def _roi_parameters(roi):
+    if roi is None:
+        return {}
+    return dict(zip(('top', 'bottom', 'left', 'right'), roi))
+
+
+def command_lifetime(arguments):
+    parameters = {'main_folder_path': os.path.abspath(arguments.day_folder)}
+    parameters.update(_roi_parameters(arguments.roi))
+    run_script('initial_green_mot_lifetime.py', parameters)
+
+
+def command_sweep(arguments):
+    parameters = {'folder_path': os.path.abspath(arguments.folder), 'output_png': arguments.output}
+    parameters.update(_roi_parameters(arguments.roi))
+    run_script('frequency_b_field_sweep_analysis.py', parameters)
+
+
+def _match_folders(day_folder, patterns):
+    from green_mot.videos import match_folders
+
+    folders = match_folders(day_folder, patterns)
+    if not folders:
+        raise FileNotFoundError(f"No folders match {patterns} in {day_folder}")
+    return folders
+
+
+def command_video(arguments):
+    from green_mot.videos import render_videos
+
+    folders = _match_folders(arguments.day_folder, arguments.patterns)
+    output_directory = arguments.output
+    if output_directory and not os.path.isabs(output_directory):
+        output_directory = os.path.join(os.path.dirname(folders[0]), output_directory)
+    render_videos(folders, output_directory, roi=tuple(arguments.roi or default_roi), workers=arguments.workers,
+                  force=arguments.force)
+
+
+def command_compare(arguments):
+    from green_mot.compare import iter_comparison_frames, write_comparison_grid, write_comparison_video
+
+    folders = _match_folders(arguments.day_folder, arguments.patterns)
+    print("Processing data from:")
+    for folder in folders:
+        print(f"- {folder}")
+    frame_stream = iter_comparison_frames(folders, tuple(arguments.roi or default_roi),
+                                          tolerance=arguments.tolerance, normalization=arguments.normalization,
+                                          columns=arguments.columns, panel_scale=arguments.panel_scale)
+    if arguments.output.lower().endswith('.png'):
+        write_comparison_grid(frame_stream, arguments.output)
+    else:
+        write_comparison_video(frame_stream, arguments.output)
+
+
+def make_parser():
+    parser = argparse.ArgumentParser(prog='green-mot', description="Green MOT analysis tools")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    def roi_option(command, help_text="cropping region, the script's own values when not given"):
+        command.add_argument('--roi', type=int, nargs=4, metavar=('TOP', 'BOTTOM', 'LEFT', 'RIGHT'), help=help_text)
+
+    for name, function, help_text in (('list', command_list, "one line per shot of a folder"),
+                                      ('catalog', command_catalog, "summary of the shots of a folder")):
+        command = commands.add_parser(name, help=help_text)
+        command.add_argument('folder', help="folder of shot files or a repacked store")
+        command.add_argument('--recursive', '-r', action='store_true', help="include the subfolders")
+        command.set_defaults(function=function)
+
+    command = commands.add_parser('crop-preview', help="show a cropping region on the frame of a shot")
+    command.add_argument('path', help="shot file, folder or repacked store")
+    command.add_argument('--roi', type=int, nargs=4, metavar=('TOP', 'BOTTOM', 'LEFT', 'RIGHT'),
+                         default=default_roi)
+    command.add_argument('--index', type=int, default=0, help="shot of a folder to show, default the first")
+    command.add_argument('--output', help="write the preview to this png instead of showing it")
+    command.set_defaults(function=command_crop_preview)
+
+    command = commands.add_parser('select-roi', help="drag the cropping region on the mean image of a folder")
+    command.add_argument('folder')
+    roi_option(command, "box at the start, default the one of the pipeline file or the middle of the frame")
+    command.add_argument('--pipeline', help="pipeline file whose [roi] the w key writes, see green_mot/pipeline.py")
+    command.set_defaults(function=command_select_roi)
+
+    command = commands.add_parser('lifetime', help="run initial_green_mot_lifetime.py on a day folder")
+    command.add_argument('day_folder')
+    roi_option(command)
+    command.set_defaults(function=command_lifetime)
+
+    command = commands.add_parser('sweep', help="run frequency_b_field_sweep_analysis.py on a folder")
+    command.add_argument('folder')
+    roi_option(command)
+    command.add_argument('--output', help="write the grid of crops to this png instead of showing it")
+    command.set_defaults(function=command_sweep)
+
+    command = commands.add_parser('video', help="one video per experiment folder, see green_mot/videos.py")
+    command.add_argument('day_folder', help="day folder, a name inside data/ or a path")
+    command.add_argument('patterns', nargs='+', help="folder names or glob patterns inside the day folder")
+    command.add_argument('--output', help="folder for the videos, relative to the day folder, default next to "
+                                          "the shots")
+    roi_option(command, f"cropping region, default {' '.join(map(str, default_roi))}")
+    command.add_argument('--force', action='store_true', help="make every video again even if it is up to date")
+    command.add_argument('--workers', type=int, help="worker processes, default one per cpu")
+    command.set_defaults(function=command_video)
+
+    command = commands.add_parser('compare', help="side by side video or grid of several experiment folders")
+    command.add_argument('day_folder', help="day folder, a name inside data/ or a path")
+    command.add_argument('patterns', nargs='+', help="folder names or glob patterns, every match is one panel")
+    command.add_argument('--output', required=True, help="an .mp4 for a video, a .png for one grid image")
+    roi_option(command, f"cropping region, default {' '.join(map(str, default_roi))}")
+    command.add_argument('--normalization', choices=('global', 'shared', 'panel'), default='global')
+    command.add_argument('--tolerance', type=float, default=1e-5, help="seconds, shots closer in T_WAIT are aligned")
+    command.add_argument('--columns', type=int, help="panels per row, default all side by side")
+    command.add_argument('--panel-scale', type=float, default=1.0, help="shrink the panels, e.g. 0.5")
+    command.set_defaults(function=command_compare)
+    return parser
+
+
+def main(argv=None):
+    arguments = make_parser().parse_args(argv)
+    arguments.function(arguments)
+
+
+if __name__ == '__main__':
+    main()
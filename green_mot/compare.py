@@ -0,0 +1,213 @@
+'''
+Comparing several experiments shot by shot
+
+Every folder is reduced to a list of (T_WAIT, file) sorted by wait time, read from the globals only. The lists are
+merged in one pass: shots whose wait times agree within a tolerance end up in the same row, folders without a
+matching shot leave an empty panel instead of shifting everything after them. The frames are then read row by row
+and the tiled rows are streamed into a video or into one big image grid, so comparing many folders is a single
+pass over the data.
+'''
+
+import os
+import re
+
+import cv2
+import numpy as np
+
+from green_mot.catalog import build_catalog, globals_column
+from green_mot.normalize import StreamingHistogram, apply_lut, build_lut, lut_for_frames, normalize_to_uint8
+from green_mot.prefetch import PrefetchLoader
+from green_mot.screening import screen_shots, usable_shots
+
+font = cv2.FONT_HERSHEY_SIMPLEX
+text_color = (255, 255, 255)  # White text
+background_color = (0, 0, 0)  # Black background for contrast
+
+
+def experiment_label(folder_name):
+    # Short readable label from the folder naming conventions used on 20250123
+    if re.match(r"LongImaging_NoRampOnGreen", folder_name):
+        return "No-Ramp Long Imaging"
+    if re.match(r"LongImaging_WithRampOnGreen", folder_name):
+        return "Ramp Long Imaging"
+    if match := re.match(r"NoRamp_(\d+)V", folder_name):
+        return f"No Ramp {match.group(1)}V VCA"
+    if match := re.match(r"WithRamp_(\d+)V_([\d\.]+)V_1ms_step_([\d\.]+)MHz", folder_name):
+        return f"With Ramp {match.group(1)}V-{match.group(2)}V {match.group(3)}MHz"
+    if match := re.match(r"WithRamp_(\d+)V_([\d\.]+)V", folder_name):
+        return f"With Ramp {match.group(1)}V-{match.group(2)}V"
+    return folder_name
+
+
+def t_wait_series(folder_path, screen=True):
+    '''
+    (T_WAIT, file_path) for every shot of a folder, sorted by wait time, taken from the shot catalog.
+    With screen=True the shots that fail screening (no frame, no T_WAIT, saturated, ...) are left out.
+    '''
+    catalog = build_catalog(folder_path, recursive=False)
+    if screen:
+        screened = screen_shots(catalog)
+        for file_path, reasons, usable in zip(screened['file_path'], screened['reasons'], screened['usable']):
+            if not usable:
+                print(f"Warning: {os.path.basename(file_path)} left out of the comparison: {reasons}")
+        catalog = usable_shots(screened)
+
+    t_wait = globals_column(catalog, 'T_WAIT')
+    series = [(float(t), file_path) for t, file_path in zip(t_wait, catalog['file_path']) if np.isfinite(t)]
+    series.sort(key=lambda item: item[0])
+    return series
+
+
+def align_by_t_wait(series_list, tolerance=1e-6):
+    '''
+    Merge sorted (T_WAIT, file_path) lists into rows of [file_path or None, ...], one entry per series.
+
+    Each step takes the smallest wait time among the heads of all lists, and every head within tolerance of it
+    joins the row. Returns a list of (t_wait, row) where t_wait is the mean wait time of the shots in the row.
+    '''
+    heads = [0] * len(series_list)
+    rows = []
+    while True:
+        current = [series[i][0] for series, i in zip(series_list, heads) if i < len(series)]
+        if not current:
+            return rows
+        t_min = min(current)
+
+        row = [None] * len(series_list)
+        times = []
+        for k, series in enumerate(series_list):
+            i = heads[k]
+            if i < len(series) and series[i][0] - t_min <= tolerance:
+                row[k] = series[i][1]
+                times.append(series[i][0])
+                heads[k] += 1
+        rows.append((sum(times) / len(times), row))
+
+
+def global_percentile_scale(file_paths, roi, percentiles=(0.5, 99.5)):
+    # One lookup table for all shots, from a histogram of every cropped frame
+    histogram = StreamingHistogram()
+    for _, frame, _ in PrefetchLoader(file_paths, roi, with_globals=False):
+        histogram.update(frame)
+    low, high = histogram.percentiles(percentiles)
+    return build_lut(low, high, len(histogram.counts) - 1)
+
+
+def draw_label(image, text, x, y, font_scale):
+    thickness = max(1, int(round(2 * font_scale)))
+    text_size = cv2.getTextSize(text, font, font_scale, thickness)[0]
+    cv2.rectangle(image, (x - 5, y - text_size[1] - 5), (x + text_size[0] + 5, y + 5), background_color, -1)
+    cv2.putText(image, text, (x, y), font, font_scale, text_color, thickness)
+
+
+def iter_comparison_frames(folder_paths, roi, tolerance=1e-6, normalization='global', percentiles=(0.5, 99.5),
+                           columns=None, panel_scale=1.0, labels=None, prefetch_depth=4, screen=True):
+    '''
+    Yield (t_wait, tiled BGR frame) for each aligned row of shots.
+
+    normalization:
+        'global' -> one scale for every panel of every row (a pre-pass over all frames), brightness can be
+                    compared across panels and across time
+        'shared' -> one scale per row, shared by all panels of that row
+        'panel'  -> every panel scaled to its own range, like the old side by side script
+    columns sets how many panels go in one row of the tiled frame, by default all panels are side by side.
+    screen=True leaves out the shots that fail green_mot.screening.
+    '''
+    if normalization not in ('global', 'shared', 'panel'):
+        raise ValueError(f"Unknown normalization '{normalization}', use 'global', 'shared' or 'panel'")
+
+    series_list = [t_wait_series(folder_path, screen) for folder_path in folder_paths]
+    rows = align_by_t_wait(series_list, tolerance)
+    if labels is None:
+        labels = [experiment_label(os.path.basename(os.path.normpath(p))) for p in folder_paths]
+
+    if normalization == 'global':
+        all_files = [file_path for _, row in rows for file_path in row if file_path is not None]
+        global_lut = global_percentile_scale(all_files, roi, percentiles)
+
+    top, bottom, left, right = roi
+    panel_height = int(round((bottom - top) * panel_scale))
+    panel_width = int(round((right - left) * panel_scale))
+    columns = columns or len(folder_paths)
+    grid_rows = (len(folder_paths) + columns - 1) // columns
+    font_scale = max(0.4, panel_width / 700)
+
+    # Only the files of the aligned rows are read, in row order, while the previous row is being tiled
+    row_files = [file_path for _, row in rows for file_path in row if file_path is not None]
+    position = {file_path: i for i, file_path in enumerate(row_files)}
+    stream = iter(PrefetchLoader(row_files, roi, depth=prefetch_depth, with_globals=False))
+    loaded = {}
+    last = -1  # position in row_files of the last shot the loader gave
+
+    def frame_of(file_path):
+        # The loader keeps the order of row_files but skips shots without a frame, so reading on until file_path
+        # or a later shot comes out tells whether it has a frame (None if not)
+        nonlocal last
+        while file_path not in loaded and last < position[file_path]:
+            item = next(stream, None)
+            if item is None:
+                last = len(row_files)
+                break
+            loaded[item[0]] = item[1]
+            last = position[item[0]]
+        return loaded.pop(file_path, None)
+
+    for t_wait, row in rows:
+        panels = [None if file_path is None else frame_of(file_path) for file_path in row]
+
+        if normalization == 'shared' and any(panel is not None for panel in panels):
+            row_lut = lut_for_frames([panel for panel in panels if panel is not None], percentiles)
+
+        tiled = np.zeros((grid_rows * panel_height, columns * panel_width, 3), dtype=np.uint8)
+        for k, panel in enumerate(panels):
+            r, c = divmod(k, columns)
+            y, x = r * panel_height, c * panel_width
+            if panel is not None:
+                if normalization == 'global':
+                    image = apply_lut(panel, global_lut)
+                elif normalization == 'shared':
+                    image = apply_lut(panel, row_lut)
+                else:
+                    image = normalize_to_uint8(panel)
+                if panel_scale != 1.0:
+                    image = cv2.resize(image, (panel_width, panel_height), interpolation=cv2.INTER_AREA)
+                tiled[y:y + panel_height, x:x + panel_width] = image[:, :, None]
+            else:
+                draw_label(tiled, "no shot" if row[k] is None else "no frame", x + 20, y + panel_height // 2,
+                            font_scale)
+            draw_label(tiled, labels[k], x + 20, y + panel_height - 20, font_scale)
+
+        draw_label(tiled, f"Wait time: {t_wait * 1e3:.2f} ms", 20, int(40 * font_scale) + 10, font_scale)
+        yield t_wait, tiled
+
+
+def write_comparison_video(frame_stream, output_video_path, frame_rate=30, seconds_per_frame=1):
+    # Stream the tiled frames into an mp4, each frame is shown for seconds_per_frame
+    video_writer = None
+    count = 0
+    for _, frame in frame_stream:
+        if video_writer is None:
+            frame_height, frame_width, _ = frame.shape
+            fourcc = cv2.VideoWriter_fourcc(*'mp4v')
+            video_writer = cv2.VideoWriter(output_video_path, fourcc, frame_rate, (frame_width, frame_height))
+        for _ in range(int(frame_rate * seconds_per_frame)):
+            video_writer.write(frame)
+        count += 1
+
+    if video_writer is None:
+        print("No frames were processed. Video was not created.")
+        return 0
+    video_writer.release()
+    print(f"Comparison video saved: {output_video_path} ({count} time steps)")
+    return count
+
+
+def write_comparison_grid(frame_stream, output_image_path):
+    # Stack the tiled rows vertically (one row per wait time) and save them as one image
+    rows = [frame for _, frame in frame_stream]
+    if not rows:
+        print("No frames were processed. Image was not created.")
+        return 0
+    cv2.imwrite(output_image_path, np.vstack(rows))
+    print(f"Comparison grid saved: {output_image_path} ({len(rows)} time steps)")
+    return len(rows)
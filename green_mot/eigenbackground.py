@@ -0,0 +1,89 @@
+'''
+Eigen background: subtracting the best matching background from every shot
+
+Subtracting one or two fixed background frames leaves every fringe or intensity change between the background
+shots and the signal shot in the pixel sum. Here the background shots are turned into a small basis of
+eigen images with a randomized SVD (Halko, Martinsson, Tropp, SIAM Rev. 53, 217 (2011)). For every signal frame
+the combination of basis images that best matches the frame in a region without atoms (the mask) is found by
+least squares and subtracted from the whole frame.
+
+All frames share the same basis and mask, so the fits of the whole stack are one least squares problem with one
+right hand side per frame, solved in a single call. The cost is a few passes over the stack, whatever the number
+of shots.
+'''
+
+import numpy as np
+
+
+def randomized_svd(matrix, n_components, oversample=10, iterations=2, seed=0):
+    '''
+    Leading singular values and right singular vectors of an (M, P) matrix, M rows of P pixels.
+    Returns (singular values (k,), right singular vectors (k, P)).
+    '''
+    matrix = np.asarray(matrix, dtype=np.float32)
+    rank = min(n_components + oversample, *matrix.shape)
+    rng = np.random.default_rng(seed)
+
+    # Range of the matrix from a few random combinations of its columns, sharpened by power iterations
+    sample = matrix @ rng.standard_normal((matrix.shape[1], rank), dtype=np.float32)
+    for _ in range(iterations):
+        sample, _ = np.linalg.qr(sample)
+        sample = matrix @ (matrix.T @ sample)
+    basis, _ = np.linalg.qr(sample)
+
+    _, singular_values, right_vectors = np.linalg.svd(basis.T @ matrix, full_matrices=False)
+    return singular_values[:n_components], right_vectors[:n_components]
+
+
+def background_basis(background_stack, n_components=8, **svd_options):
+    # (k, H, W) eigen images of an (M, H, W) stack of background frames, without subtracting the mean so that the
+    # fitted combination also follows the overall brightness
+    background_stack = np.asarray(background_stack)
+    n, height, width = background_stack.shape
+    n_components = min(n_components, n)
+    _, vectors = randomized_svd(background_stack.reshape(n, -1), n_components, **svd_options)
+    return vectors.reshape(n_components, height, width)
+
+
+def signal_mask(shape, signal_region=None, margin=0.25):
+    '''
+    Boolean (H, W) mask of the pixels used for the fit, True where there are no atoms.
+    signal_region (top, bottom, left, right) in crop pixels is left out, by default the middle of the crop
+    without a border of margin times the crop size.
+    '''
+    height, width = shape
+    if signal_region is None:
+        signal_region = (int(height * margin), int(height * (1 - margin)), int(width * margin),
+                         int(width * (1 - margin)))
+    top, bottom, left, right = signal_region
+    mask = np.ones(shape, dtype=bool)
+    mask[max(top, 0):max(bottom, 0), max(left, 0):max(right, 0)] = False
+    if not mask.any():
+        raise ValueError(f"The signal region {signal_region} covers the whole {shape} crop, nothing left to fit")
+    return mask
+
+
+def fit_backgrounds(stack, basis, mask):
+    '''
+    Best background for every frame of an (N, H, W) stack as a combination of the (k, H, W) basis, fitted on the
+    pixels where mask is True. Returns (backgrounds (N, H, W) float32, coefficients (N, k)).
+    '''
+    stack = np.asarray(stack, dtype=np.float32)
+    n = len(stack)
+    k = len(basis)
+    design = basis[:, mask].T  # (pixels in mask, k)
+    targets = stack[:, mask].T  # (pixels in mask, N), one right hand side per frame
+    coefficients, _, _, _ = np.linalg.lstsq(design, targets, rcond=None)
+    backgrounds = (coefficients.T @ basis.reshape(k, -1)).reshape(stack.shape)
+    return backgrounds.astype(np.float32), coefficients.T.reshape(n, k)
+
+
+def subtract_eigen_background(stack, background_stack, n_components=8, signal_region=None, clip=False):
+    '''
+    Subtract the fitted eigen background from every frame of a stack. The result is not clipped at zero by default,
+    so the noise around zero averages out in pixel sums instead of adding up.
+    '''
+    basis = background_basis(background_stack, n_components)
+    backgrounds, _ = fit_backgrounds(stack, basis, signal_mask(basis.shape[1:], signal_region))
+    subtracted = np.asarray(stack, dtype=np.float32) - backgrounds
+    return np.clip(subtracted, 0, None) if clip else subtracted
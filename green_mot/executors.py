@@ -0,0 +1,349 @@
+'''
+Where the units of a batch run are executed
+
+run_batch() (green_mot/batch.py) hands its units to an executor and journals the results as they come back.
+Three executors are available:
+
+    InlineExecutor()            one unit after the other in this process
+    ProcessExecutor(workers)    a pool of worker processes on this machine
+    TCPExecutor(address)        worker processes on any number of machines that see the same data folder, they
+                                connect to this process over TCP and ask for units
+
+For the TCP executor every machine starts workers with
+    python -m green_mot.executors worker <coordinator host>:<port> [--local <path> ...] [--processes <n>]
+where --local lists data folders the machine has on a local disk (or already in its page cache). The scheduler
+is locality aware: the units are grouped by the folder (or repacked store) they read, a worker keeps getting
+units of the same folder so its file cache stays warm, and when it needs a new folder it first gets one under
+its --local paths, then one that no other worker is busy with, and only then a share of a folder another worker
+is already working on. A unit whose worker disconnects goes back to the queue.
+
+Units and results are sent with pickle (multiprocessing.connection), whoever knows the authkey can run code on
+the coordinator and the workers. Only run workers on a trusted network and set the same secret authkey in
+GREEN_MOT_AUTHKEY on all machines, e.g. with
+    export GREEN_MOT_AUTHKEY=$(python -c "import secrets; print(secrets.token_hex())")
+The coordinator refuses to listen on an address other than localhost without it; on localhost it makes up a random
+key for its own workers. Functions of units must be importable by the workers, i.e. module level functions of
+green_mot or the analysis scripts.
+'''
+
+import os
+import ipaddress
+import queue
+import secrets
+import socket
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from multiprocessing.connection import Client, Listener
+
+from green_mot.shots import split_shot_path
+
+default_address = ('127.0.0.1', 8766)
+
+
+# Key of earlier versions, it is in the source code so it protects nothing
+public_authkey = b'green_mot'
+
+
+def default_authkey():
+    # Authkey from GREEN_MOT_AUTHKEY, None if it is not set
+    authkey = os.environ.get('GREEN_MOT_AUTHKEY')
+    return authkey.encode() if authkey else None
+
+
+def is_loopback(host):
+    if host == 'localhost':
+        return True
+    try:
+        return ipaddress.ip_address(host).is_loopback
+    except ValueError:
+        return False
+
+
+def coordinator_authkey(address, authkey=None):
+    # A secret key is required to listen on the network, on localhost a random one is made up if none is set
+    authkey = authkey or default_authkey()
+    if authkey is not None and authkey != public_authkey:
+        return authkey
+    if not is_loopback(address[0]):
+        raise ValueError(f"Refusing to listen on {address[0]}:{address[1]} without a secret authkey, set the same "
+                         "random GREEN_MOT_AUTHKEY on the coordinator and all workers")
+    authkey = secrets.token_hex(16).encode()
+    print(f"Warning: GREEN_MOT_AUTHKEY is not set, workers on this machine need GREEN_MOT_AUTHKEY={authkey.decode()}")
+    return authkey
+
+
+def unit_locality(unit):
+    # Folder (or repacked store) that a unit reads, from the first argument that is a path to a file or folder
+    for arg in unit[3]:
+        if isinstance(arg, str):
+            path, index = split_shot_path(arg)
+            if index is not None:
+                return os.path.abspath(path)
+            if os.path.isfile(path):
+                return os.path.dirname(os.path.abspath(path))
+            if os.path.isdir(path):
+                return os.path.abspath(path)
+    return ''
+
+
+def _run(function, args):
+    from green_mot.batch import run_unit
+
+    return run_unit(function, args)
+
+
+class InlineExecutor:
+
+    def run(self, units):
+        # Yield (unit, status, result, error) for every unit
+        for unit in units:
+            yield (unit,) + _run(unit[2], unit[3])
+
+
+class ProcessExecutor:
+
+    def __init__(self, workers=None):
+        self.workers = workers
+
+    def run(self, units):
+        # At most two units per worker are queued, so a Ctrl-C does not leave thousands of submitted units behind
+        units = iter(units)
+        with ProcessPoolExecutor(max_workers=self.workers) as pool:
+            limit = 2 * (self.workers or os.cpu_count())
+            running = {}
+            try:
+                while True:
+                    for unit in units:
+                        running[pool.submit(_run, unit[2], unit[3])] = unit
+                        if len(running) >= limit:
+                            break
+                    if not running:
+                        return
+                    done, _ = wait(running, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        yield (running.pop(future),) + future.result()
+            finally:
+                for future in running:
+                    future.cancel()
+
+
+class LocalityScheduler:
+    '''
+    Pending units grouped by locality. next_unit(worker) hands out units of the worker's current locality and
+    picks a new one for it when that is used up.
+    '''
+
+    def __init__(self, units):
+        self.groups = {}
+        for unit in units:
+            self.groups.setdefault(unit_locality(unit), []).append(unit)
+        self.affinity = {}  # worker name -> locality it is working on
+        self.lock = threading.Lock()
+
+    def _choose_locality(self, worker, local_paths):
+        available = [locality for locality, group in self.groups.items() if group]
+        if not available:
+            return None
+        # 1. a folder on a local disk of the worker
+        for locality in available:
+            if any(locality.startswith(os.path.abspath(path)) for path in local_paths):
+                return locality
+        # 2. the largest folder no other worker is busy with
+        busy = {locality for name, locality in self.affinity.items() if name != worker}
+        free = [locality for locality in available if locality not in busy]
+        # 3. otherwise share the largest folder
+        return max(free or available, key=lambda locality: len(self.groups[locality]))
+
+    def next_unit(self, worker, local_paths=()):
+        with self.lock:
+            locality = self.affinity.get(worker)
+            if locality is None or not self.groups.get(locality):
+                locality = self._choose_locality(worker, local_paths)
+                if locality is None:
+                    self.affinity.pop(worker, None)
+                    return None
+                self.affinity[worker] = locality
+            return self.groups[locality].pop(0)
+
+    def put_back(self, unit):
+        with self.lock:
+            self.groups.setdefault(unit_locality(unit), []).insert(0, unit)
+
+
+class TCPExecutor:
+    '''
+    Coordinator of remote workers. address is (host, port) to listen on, use ('0.0.0.0', port) for workers on
+    other machines. local_workers starts that many worker processes on this machine as well, which is also how
+    the executor is tested without a second machine. Rather than waiting for workers forever while units are left,
+    the run fails once all local worker processes have exited with no worker connected, or, without local workers,
+    when no worker connected again within reconnect_timeout seconds after the last one left.
+    '''
+
+    def __init__(self, address=default_address, authkey=None, local_workers=0, reconnect_timeout=60):
+        self.address = tuple(address)
+        self.authkey = coordinator_authkey(self.address, authkey)
+        self.local_workers = local_workers
+        self.reconnect_timeout = reconnect_timeout
+
+    def run(self, units):
+        units = list(units)
+        if not units:
+            return
+        scheduler = LocalityScheduler(units)
+        results = queue.Queue()
+        # Workers connected right now, time the last one left and units with a result
+        workers = {'connected': 0, 'left': None, 'finished': 0}
+        connected_lock = threading.Lock()
+        listener = Listener(self.address, authkey=self.authkey)
+        print(f"Waiting for workers on {listener.address[0]}:{listener.address[1]}")
+
+        def serve(connection):
+            # One thread per worker: hand out a unit, wait for its result, repeat
+            name, local_paths, unit, counted = '?', (), None, False
+            try:
+                name, local_paths = connection.recv()
+                with connected_lock:
+                    workers['connected'] += 1
+                    counted = True
+                print(f"Worker {name} connected" + (f", local: {', '.join(local_paths)}" if local_paths else ''))
+                while True:
+                    unit = scheduler.next_unit(name, local_paths)
+                    if unit is None:
+                        with connected_lock:
+                            finished = workers['finished'] == len(units)
+                        if finished:
+                            connection.send(None)
+                            return
+                        # Units are still running elsewhere, one may come back if its worker disconnects
+                        time.sleep(0.2)
+                        continue
+                    connection.send((unit[2], unit[3]))
+                    status, result, error = connection.recv()
+                    with connected_lock:
+                        workers['finished'] += 1
+                    results.put((unit, status, result, error))
+                    unit = None
+            except (EOFError, OSError):
+                if unit is not None:
+                    print(f"Warning: worker {name} disconnected, its unit goes back to the queue")
+                    scheduler.put_back(unit)
+            finally:
+                connection.close()
+                if counted:
+                    with connected_lock:
+                        workers['connected'] -= 1
+                        if not workers['connected']:
+                            workers['left'] = time.monotonic()
+                    results.put(None)  # wakes the coordinator up so it can check on the workers
+
+        def accept():
+            while True:
+                try:
+                    connection = listener.accept()
+                except (OSError, EOFError):
+                    return
+                threading.Thread(target=serve, args=(connection,), daemon=True).start()
+
+        threading.Thread(target=accept, daemon=True).start()
+        processes = [start_local_worker(listener.address, self.authkey) for _ in range(self.local_workers)]
+
+        def workers_gone():
+            # Local workers may still be starting, remote ones may reconnect
+            with connected_lock:
+                if workers['connected']:
+                    return False
+                if processes:
+                    return all(process.poll() is not None for process in processes)
+                return workers['left'] is not None and time.monotonic() - workers['left'] > self.reconnect_timeout
+
+        try:
+            received = 0
+            while received < len(units):
+                try:
+                    item = results.get(timeout=1)
+                except queue.Empty:
+                    item = None
+                if item is None:
+                    if workers_gone():
+                        raise RuntimeError(f"All workers are gone, {len(units) - received} units were not run")
+                    continue
+                received += 1
+                yield item
+        finally:
+            listener.close()
+            for process in processes:
+                process.terminate()
+                process.wait()
+
+
+def start_local_worker(address, authkey):
+    # Worker process on this machine, the authkey is passed in the environment rather than on the command line
+    environment = dict(os.environ, GREEN_MOT_AUTHKEY=authkey.decode())
+    base_directory = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    environment['PYTHONPATH'] = os.pathsep.join(filter(None, [base_directory, environment.get('PYTHONPATH')]))
+    return subprocess.Popen([sys.executable, '-m', 'green_mot.executors', 'worker', f"{address[0]}:{address[1]}"],
+                            env=environment)
+
+
+def worker(address, local_paths=(), name=None, authkey=None):
+    # Connect to a coordinator and run units until it has none left
+    name = name or f"{socket.gethostname()}:{os.getpid()}"
+    authkey = authkey or default_authkey()
+    if authkey is None:
+        raise ValueError("GREEN_MOT_AUTHKEY is not set, set it to the authkey of the coordinator")
+    connection = Client(tuple(address), authkey=authkey)
+    connection.send((name, list(local_paths)))
+    count = 0
+    try:
+        while True:
+            task = connection.recv()
+            if task is None:
+                break
+            function, args = task
+            connection.send(_run(function, args))
+            count += 1
+    except EOFError:
+        pass
+    finally:
+        connection.close()
+    print(f"Worker {name} done, {count} units")
+
+
+def make_executor(kind, workers=None, address=default_address):
+    # Executor by name, as used on the command line
+    if kind == 'inline':
+        return InlineExecutor()
+    if kind == 'process':
+        return ProcessExecutor(workers)
+    if kind == 'tcp':
+        return TCPExecutor(address, local_workers=workers or 0)
+    raise ValueError(f"Unknown executor '{kind}', use inline, process or tcp")
+
+
+def parse_address(text):
+    host, _, port = text.rpartition(':')
+    return host or default_address[0], int(port)
+
+
+if __name__ == '__main__':
+    arguments = sys.argv[1:]
+    if not arguments or arguments[0] != 'worker' or len(arguments) < 2:
+        print("usage: python -m green_mot.executors worker <host>:<port> [--local <path> ...] [--processes <n>]")
+        print("  --local      data folder on a local disk of this machine, preferred when units are handed out")
+        print("  --processes  number of worker processes to start on this machine (default 1)")
+        sys.exit(1)
+
+    address = parse_address(arguments[1])
+    local_paths = [arguments[i + 1] for i, a in enumerate(arguments) if a == '--local']
+    processes = int(arguments[arguments.index('--processes') + 1]) if '--processes' in arguments else 1
+    if processes == 1:
+        worker(address, local_paths)
+    else:
+        children = [subprocess.Popen([sys.executable, '-m', 'green_mot.executors', 'worker', arguments[1]] +
+                                     [part for path in local_paths for part in ('--local', path)])
+                    for _ in range(processes)]
+        for child in children:
+            child.wait()
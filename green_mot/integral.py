@@ -0,0 +1,72 @@
+'''
+Summed-area tables
+
+The summed-area table S of a frame holds at S[y, x] the sum of all pixels above and left of (y, x), with a row
+and a column of zeros in front. The sum over any rectangle is then four lookups,
+    S[bottom, right] - S[top, right] - S[bottom, left] + S[top, left]
+so once the tables of a stack are built, the counts of every shot under a new cropping region cost O(N) instead
+of a pass over all pixels. box_sums() takes arrays of boxes as well, which makes scans over many candidate
+regions (edge_scan()) a handful of array lookups. Used by the interactive crop selection
+(green_mot/roi_selector.py) and the [integral] stage of green_mot/pipeline.py.
+'''
+
+import numpy as np
+
+
+def summed_area_tables(stack):
+    # (N, H + 1, W + 1) float64 summed-area tables of an (N, H, W) stack, or (H + 1, W + 1) for one frame
+    stack = np.asarray(stack)
+    tables = np.zeros(stack.shape[:-2] + (stack.shape[-2] + 1, stack.shape[-1] + 1))
+    np.cumsum(stack, axis=-2, dtype=np.float64, out=tables[..., 1:, 1:])
+    np.cumsum(tables[..., 1:, 1:], axis=-1, out=tables[..., 1:, 1:])
+    return tables
+
+
+def compact_summed_area_tables(stack):
+    '''
+    Summed-area tables in the smallest dtype that keeps the box sums exact. Frames of whole numbers (also when
+    stored as floats, like background subtracted counts) get int64 tables, or uint32 ones, half the size, when
+    no pixel is negative and no frame adds up to 2**32 or more. Frames with fractional values get float64.
+    '''
+    stack = np.asarray(stack)
+    if stack.dtype.kind == 'f' and not np.array_equal(stack, np.round(stack)):
+        return summed_area_tables(stack)
+    tables = np.zeros(stack.shape[:-2] + (stack.shape[-2] + 1, stack.shape[-1] + 1), dtype=np.int64)
+    np.cumsum(stack, axis=-2, dtype=np.int64, out=tables[..., 1:, 1:])
+    np.cumsum(tables[..., 1:, 1:], axis=-1, out=tables[..., 1:, 1:])
+    if stack.size and stack.min() >= 0 and tables[..., -1, -1].max() < 2 ** 32:
+        return tables.astype(np.uint32)
+    return tables
+
+
+def box_sums(tables, roi):
+    '''
+    Sum over roi (top, bottom, left, right) of every frame, from the tables of summed_area_tables() or
+    compact_summed_area_tables(). The four entries may also be arrays of K boxes, the result is then (N, K).
+    Returns float64.
+    '''
+    top, bottom, left, right = (np.asarray(v, dtype=np.intp) for v in roi)
+    with np.errstate(over='ignore'):
+        # uint32 differences wrap around on the way, the final sum is exact because it is below 2**32
+        sums = (tables[..., bottom, right] - tables[..., top, right]
+                - tables[..., bottom, left] + tables[..., top, left])
+    return np.asarray(sums, dtype=np.float64)
+
+
+def edge_scan(tables, roi, margin, step=1):
+    '''
+    How the counts depend on the cropping region: every edge of roi is moved by -margin ... margin pixels in
+    steps of step while the other three stay put. Returns (offsets, {edge: (N, K) counts}) for the edges top,
+    bottom, left and right, K = len(offsets). Offsets that would leave the table or empty the box are NaN.
+    '''
+    offsets = np.arange(-margin, margin + 1, step)
+    height, width = tables.shape[-2] - 1, tables.shape[-1] - 1
+    scans = {}
+    for k, (edge, limit) in enumerate(zip(('top', 'bottom', 'left', 'right'), (height, height, width, width))):
+        boxes = [np.full(len(offsets), v) for v in roi]
+        boxes[k] = boxes[k] + offsets
+        valid = (boxes[k] >= 0) & (boxes[k] <= limit) & (boxes[0] < boxes[1]) & (boxes[2] < boxes[3])
+        counts = box_sums(tables, [np.where(valid, box, 0) for box in boxes])
+        counts[..., ~valid] = np.nan
+        scans[edge] = counts
+    return offsets, scans
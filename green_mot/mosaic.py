@@ -0,0 +1,84 @@
+'''
+Drawing a grid of crops as one image
+
+The grid scripts make rows x cols matplotlib axes and call imshow on each, which gets slow and memory hungry
+above a few dozen shots. Here the crops are copied into one preallocated array, the titles are drawn into the
+array with cv2, and the result is shown with a single imshow or written straight to a png. The matplotlib cost
+no longer depends on the number of shots.
+'''
+
+import cv2
+import numpy as np
+
+from green_mot.normalize import apply_lut, lut_for_frames, normalize_to_uint8
+
+
+def tile_stack(stack, cols, gap=4, fill=0):
+    '''
+    Copy an (N, H, W) stack into one (rows * (H + gap) - gap, cols * (W + gap) - gap) image, row by row.
+    Unused cells at the end are left at fill.
+    '''
+    stack = np.asarray(stack)
+    n, height, width = stack.shape
+    rows = (n + cols - 1) // cols
+
+    # Every crop gets a cell with the gap on its right and bottom, then the (rows, cols, H, W) cells are laid out
+    # as one image with a single copy
+    cells = np.full((rows * cols, height + gap, width + gap), fill, dtype=stack.dtype)
+    cells[:n, :height, :width] = stack
+    mosaic = cells.reshape(rows, cols, height + gap, width + gap).transpose(0, 2, 1, 3)
+    mosaic = mosaic.reshape(rows * (height + gap), cols * (width + gap))
+    return np.ascontiguousarray(mosaic[:mosaic.shape[0] - gap, :mosaic.shape[1] - gap])
+
+
+def render_mosaic(stack, titles=None, cols=5, normalization='global', percentiles=(0.5, 99.5), gap=4,
+                  font_scale=None, text_position=(10, 25)):
+    '''
+    8-bit BGR mosaic of a stack with an optional title in the top left corner of every cell.
+
+    normalization: 'global' -> one brightness scale for all crops, 'panel' -> every crop on its own min / max
+    text_position is (x, y) of the title inside the cell, in pixels.
+    '''
+    stack = np.asarray(stack)
+    if normalization == 'global' and np.issubdtype(stack.dtype, np.unsignedinteger):
+        images = apply_lut(stack, lut_for_frames(stack, percentiles))
+    elif normalization == 'global':
+        images = normalize_to_uint8(stack, *np.percentile(stack, percentiles))
+    else:
+        images = np.stack([normalize_to_uint8(frame) for frame in stack])
+
+    gray = tile_stack(images, cols, gap)
+    mosaic = cv2.cvtColor(gray, cv2.COLOR_GRAY2BGR)
+
+    if titles:
+        height, width = stack.shape[1:]
+        font_scale = font_scale or max(0.3, width / 1400)
+        thickness = max(1, int(round(font_scale * 1.5)))
+        for i, title in enumerate(titles):
+            r, c = divmod(i, cols)
+            x = c * (width + gap) + text_position[0]
+            y = r * (height + gap) + text_position[1]
+            for k, line in enumerate(str(title).split('\n')):
+                cv2.putText(mosaic, line, (x, y + int(k * 30 * font_scale)), cv2.FONT_HERSHEY_SIMPLEX, font_scale,
+                            (255, 255, 255), thickness, cv2.LINE_AA)
+    return mosaic
+
+
+def show_mosaic(mosaic, title=None, figsize=(15, 10)):
+    # One imshow for the whole grid
+    import matplotlib.pyplot as plt
+
+    fig, ax = plt.subplots(figsize=figsize)
+    ax.imshow(mosaic[:, :, ::-1])  # cv2 draws in BGR
+    ax.axis('off')
+    if title:
+        fig.suptitle(title, fontsize=16)
+    plt.tight_layout()
+    return fig
+
+
+def save_mosaic(mosaic, output_path):
+    # Straight to disk without matplotlib
+    if not cv2.imwrite(output_path, mosaic):
+        raise OSError(f"Could not write {output_path}")
+    print(f"Mosaic saved: {output_path}")
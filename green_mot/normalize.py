@@ -0,0 +1,100 @@
+'''
+Fast 8-bit normalization of camera frames for videos and image grids
+
+The old video tools scaled every crop with its own np.min / np.max and a float division. That is several passes
+and a float64 copy per frame, it divides by zero on flat frames, and the brightness of one frame can not be
+compared with the next.
+
+Here the scale is computed once for the whole stack: the pixel values are counted in a histogram that is updated
+frame by frame (the camera frames are integers, so this is a single np.bincount per frame), the low and high
+percentiles are read off the cumulative histogram, and a lookup table maps every possible pixel value to 0..255.
+Converting a frame is then one np.take, directly into uint8 without float temporaries.
+'''
+
+import numpy as np
+
+
+class StreamingHistogram:
+    '''
+    Histogram of integer pixel values, updated one frame at a time. Negative values of signed frames (e.g. crops
+    with the background subtracted) are counted as 0, the value apply_lut() shows them at.
+
+        histogram = StreamingHistogram()
+        for frame in frames:
+            histogram.update(frame)
+        low, high = histogram.percentiles((0.5, 99.5))
+    '''
+
+    def __init__(self, max_value=np.iinfo(np.uint16).max):
+        self.counts = np.zeros(int(max_value) + 1, dtype=np.int64)
+
+    def update(self, frame):
+        if not np.issubdtype(frame.dtype, np.integer):
+            raise TypeError(f"StreamingHistogram needs integer frames, got {frame.dtype}")
+        if np.issubdtype(frame.dtype, np.signedinteger) and frame.min() < 0:
+            frame = np.clip(frame, 0, None)
+        counts = np.bincount(frame.ravel(), minlength=len(self.counts))
+        if len(counts) > len(self.counts):
+            # A value above max_value, grow instead of failing halfway through a folder
+            counts[:len(self.counts)] += self.counts
+            self.counts = counts.astype(np.int64)
+        else:
+            self.counts += counts
+        return self
+
+    @property
+    def total(self):
+        return int(self.counts.sum())
+
+    def percentiles(self, percentiles):
+        # Pixel values below which the given percentages of all counted pixels lie
+        cumulative = np.cumsum(self.counts)
+        if cumulative[-1] == 0:
+            return [0 for _ in percentiles]
+        targets = np.asarray(percentiles, dtype=np.float64) / 100.0 * cumulative[-1]
+        values = np.searchsorted(cumulative, targets, side='left')
+        return [int(v) for v in np.minimum(values, len(cumulative) - 1)]
+
+
+def build_lut(low, high, max_value=np.iinfo(np.uint16).max):
+    '''
+    Lookup table mapping every pixel value 0..max_value to uint8.
+    Values up to low become 0, values from high up become 255. When high <= low (a flat frame or stack) the table
+    is all zeros instead of dividing by zero.
+    '''
+    if high <= low:
+        return np.zeros(int(max_value) + 1, dtype=np.uint8)
+    values = np.arange(int(max_value) + 1, dtype=np.float64)
+    lut = (values - low) * (255.0 / (high - low))
+    return np.clip(np.rint(lut), 0, 255).astype(np.uint8)
+
+
+def apply_lut(frame, lut, out=None):
+    # One pass over the frame straight into uint8, values past the end of the table map to its last entry
+    return np.take(lut, frame, out=out, mode='clip')
+
+
+def lut_for_frames(frames, percentiles=(0.5, 99.5)):
+    # Global lookup table for a list or stack of integer frames
+    histogram = StreamingHistogram()
+    for frame in frames:
+        histogram.update(frame)
+    low, high = histogram.percentiles(percentiles)
+    return build_lut(low, high, len(histogram.counts) - 1)
+
+
+def normalize_to_uint8(frame, low=None, high=None):
+    '''
+    Convert a single frame to uint8 between low and high (its own min and max by default).
+    Unsigned integer frames go through a lookup table, anything else through a float32 scale.
+    '''
+    if low is None:
+        low = frame.min()
+    if high is None:
+        high = frame.max()
+    if np.issubdtype(frame.dtype, np.unsignedinteger):
+        return apply_lut(frame, build_lut(low, high, high))
+
+    scale = np.float32(255.0 / (high - low)) if high > low else np.float32(0.0)
+    scaled = (frame.astype(np.float32) - np.float32(low)) * scale
+    return np.clip(scaled, 0, 255, out=scaled).astype(np.uint8)
@@ -0,0 +1,579 @@
+'''
+Analysis pipelines described in a TOML file
+
+Instead of editing the constants under "USER DEFINE PARAMETERS HERE ONLY" for every run, a pipeline file holds
+everything one analysis needs, e.g. pipelines/release_and_recapture.toml:
+
+    [source]
+    folder = "data/20250114_release_and_recapture_greenMOT/recaptured MOT"
+
+    [roi]
+    top = 400
+    bottom = 850
+    left = 910
+    right = 1350
+
+    [background]
+    strategy = "paired"   # none, paired (shot by shot), mean (mean frame of each folder), constant or eigen
+    folders = ["data/20250114_release_and_recapture_greenMOT/backgrounds1",
+               "data/20250114_release_and_recapture_greenMOT/backgrounds2"]
+
+    [preprocess]          # optional
+    binning = 2           # sum 2 x 2 pixel blocks
+    filter = "gaussian"   # or "median", leave out for no smoothing
+    sigma = 1.0           # gaussian width in binned pixels, size = 3 or 5 for the median
+
+    [metrics]
+    names = ["pixel_sum", "moments"]
+
+    [output]
+    csv = "results/release_and_recapture.csv"
+    plot = "pixel_sum"    # column plotted against the scanned global, saved next to the csv as png
+    x = "T_WAIT"          # optional, the x axis and facet globals are picked with green_mot.varying otherwise
+    table = "results/release_and_recapture.h5"   # optional HDF5 table, see green_mot/results.py
+    write_back = false    # true stores the metrics in every shot file under results/<pipeline name>
+
+An optional [calibration] table with the parameters of green_mot/calibration.py adds an atom_number column.
+
+Every folder is screened before loading (green_mot/screening.py): shots without a frame, with missing globals,
+saturated or with an outlying T_WAIT are left out of the analysis. They stay in the results table with NaN
+metrics, usable = false and the reasons in the reasons column. An optional [screening] table passes its values
+to screen_shots (e.g. max_saturated_fraction = 0.1), enabled = false turns the screening off.
+
+An optional [integral] table makes the cropping region cheap to change:
+
+    [integral]
+    region = [300, 950, 810, 1450]   # top, bottom, left, right, must contain the roi
+
+The load and background stages then work on the whole region, and an integral stage caches the summed-area
+tables of the background subtracted frames (green_mot/integral.py, uint32 when the counts allow it). pixel_sum
+is taken from the tables, four lookups per shot, the other metrics from the roi cut out of the region. Moving the
+roi inside the region reuses every stage but the metrics, and crop_sensitivity() (--scan) shows how the counts
+change when each edge of the roi moves, without touching the pixels again. pixel_sum then comes from the frames
+before [preprocess], which only makes a difference with a filter that does not keep the sum.
+Relative paths are relative to the repository root. The runner goes through the stages load -> background ->
+preprocess -> metrics -> output. Every stage result is cached in cache/pipeline under a hash of the stage's own
+config and the hashes of the stages it depends on (the load stage hashes the content hashes of the shots in the
+catalog, so new or changed shots are picked up, and a copy of a folder reuses everything computed for the
+original). File paths are not part of the cached results, every stage attaches the paths of the folder it runs on.
+Running variants of a pipeline on the same data therefore only recomputes the
+stages whose config changed: a new metric reuses the loaded and background subtracted crops, a new background
+reuses the crops.
+Run from the repository root with
+    python -m green_mot.pipeline <pipeline.toml> [<pipeline.toml> ...] [--set roi.top=420 ...] [--force]
+                                 [--scan <margin>]
+'''
+
+import hashlib
+import json
+import os
+import pickle
+import tomllib
+
+import numpy as np
+
+from green_mot.calibration import atom_numbers, pixel_sums
+from green_mot.catalog import build_catalog, globals_column
+from green_mot.denoise import preprocess
+from green_mot.eigenbackground import subtract_eigen_background
+from green_mot.integral import box_sums, compact_summed_area_tables, edge_scan
+from green_mot.prefetch import PrefetchLoader
+from green_mot.screening import screen_shots
+from green_mot.shots import base_directory, cache_directory
+from green_mot.tracking import moments
+from green_mot.varying import plot_metric
+
+pipeline_directory = os.path.join(cache_directory, 'pipeline')
+
+# Bump when a stage computes something different for the same config, every cached stage is then recomputed
+pipeline_version = 3
+
+
+def load_spec(spec_path, overrides=()):
+    '''
+    Read a pipeline file. overrides are strings like "roi.top=420" or 'background.strategy="mean"', the value
+    is parsed as TOML and falls back to a plain string.
+    '''
+    with open(spec_path, 'rb') as f:
+        spec = tomllib.load(f)
+    spec.setdefault('name', os.path.splitext(os.path.basename(spec_path))[0])
+    for override in overrides:
+        path, _, text = override.partition('=')
+        try:
+            value = tomllib.loads(f"value = {text}")['value']
+        except tomllib.TOMLDecodeError:
+            value = text
+        *parents, name = path.strip().split('.')
+        table = spec
+        for parent in parents:
+            table = table.setdefault(parent, {})
+        table[name] = value
+    return spec
+
+
+def save_roi(spec_path, roi):
+    '''
+    Write roi (top, bottom, left, right) into the [roi] table of a pipeline file. Everything else in the file,
+    comments included, stays as it is. A file without a [roi] table gets one at the end.
+    '''
+    values = dict(zip(('top', 'bottom', 'left', 'right'), (int(v) for v in roi)))
+    with open(spec_path) as f:
+        lines = f.read().splitlines()
+
+    header = next((i for i, line in enumerate(lines) if line.strip() == '[roi]'), None)
+    if header is None:
+        lines += ['', '[roi]'] + [f"{name} = {value}" for name, value in values.items()]
+    else:
+        end = next((i for i in range(header + 1, len(lines)) if lines[i].lstrip().startswith('[')), len(lines))
+        missing = dict(values)
+        for i in range(header + 1, end):
+            name = lines[i].split('=')[0].strip()
+            if '=' in lines[i] and name in missing:
+                comment = lines[i][lines[i].index('#'):] if '#' in lines[i] else ''
+                lines[i] = f"{name} = {missing.pop(name)}" + (f"  {comment}" if comment else '')
+        lines[header + 1:header + 1] = [f"{name} = {value}" for name, value in missing.items()]
+
+    text = '\n'.join(lines) + '\n'
+    tomllib.loads(text)  # never leave a file behind that can not be read again
+    temporary_path = spec_path + '.tmp'
+    with open(temporary_path, 'w') as f:
+        f.write(text)
+    os.replace(temporary_path, spec_path)
+    print(f"Cropping region written to {spec_path}: " + ', '.join(f"{k}={v}" for k, v in values.items()))
+
+
+def resolve_path(path):
+    return path if os.path.isabs(path) else os.path.join(base_directory, path)
+
+
+def stage_key(name, config, upstream=()):
+    # Hash of everything a stage result depends on
+    text = json.dumps({'stage': name, 'version': pipeline_version, 'config': config, 'upstream': list(upstream)},
+                      sort_keys=True, default=str)
+    return hashlib.sha1(text.encode()).hexdigest()
+
+
+def cached_stage(name, key, compute, force=False):
+    # Result of compute() stored under cache/pipeline/<name>-<key>.pickle, reused while the key is the same
+    cache_path = os.path.join(pipeline_directory, f"{name}-{key}.pickle")
+    if not force and os.path.exists(cache_path):
+        with open(cache_path, 'rb') as f:
+            print(f"  {name}: reused {key[:10]}")
+            return pickle.load(f)
+
+    result = compute()
+    os.makedirs(pipeline_directory, exist_ok=True)
+    temporary_path = cache_path + '.tmp'
+    with open(temporary_path, 'wb') as f:
+        pickle.dump(result, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(temporary_path, cache_path)
+    print(f"  {name}: computed {key[:10]}")
+    return result
+
+
+# Load stage
+
+def screening_options(spec):
+    # Keyword arguments of screen_shots from the [screening] table, None when screening is turned off
+    options = dict(spec.get('screening', {}))
+    if not options.pop('enabled', True):
+        return None
+    return options
+
+
+def load_stage(folder, roi, recursive=False, force=False, screening=None):
+    '''
+    Cropped frames of every shot of a folder that has a frame and passes screening (screening holds the options
+    of screen_shots, None to only leave out shots without a frame).
+    Returns (key, {'file_path': [...], 'globals': [...], 'reasons': [...], 'position': [...], 'stack': (N, H, W)
+    array, 'excluded': [(file_path, globals, reasons), ...]}). position is the row of each shot in the folder's
+    catalog, background shots are paired by it.
+    The key only depends on the content of the shots and the roi, copies of a shot are decoded once.
+    '''
+    catalog = build_catalog(resolve_path(folder), recursive=recursive)
+    if screening is not None:
+        screened = screen_shots(catalog, **screening)
+        usable, reasons = screened['usable'] & catalog['has_frame'], screened['reasons']
+    else:
+        usable = np.asarray(catalog['has_frame'], dtype=bool)
+        reasons = ['' if has_frame else 'no frame' for has_frame in catalog['has_frame']]
+    excluded = [(catalog['file_path'][i], catalog['globals'][i], reasons[i]) for i in np.flatnonzero(~usable)]
+    for file_path, _, shot_reasons in excluded:
+        print(f"Warning: {file_path} left out: {shot_reasons}")
+    rows = np.flatnonzero(usable)
+    if not len(rows):
+        raise ValueError(f"No usable shots in {folder}")
+    hashes = [catalog['content_hash'][i] for i in rows]
+    key = stage_key('load', {'roi': list(roi), 'shots': hashes})
+
+    def compute():
+        # One read per distinct shot, 'used' are the positions in rows of the shots that gave a frame
+        first_path = {}
+        for i, digest in zip(rows, hashes):
+            first_path.setdefault(digest, catalog['file_path'][i])
+        digest_of = {file_path: digest for digest, file_path in first_path.items()}
+        frames = {}
+        for file_path, frame, _ in PrefetchLoader(list(first_path.values()), tuple(roi), with_globals=False):
+            frames[digest_of[file_path]] = frame
+        used = [k for k, digest in enumerate(hashes) if digest in frames]
+        if not used:
+            raise ValueError(f"No frames found in {folder}")
+        return {'used': used, 'stack': np.stack([frames[hashes[k]] for k in used])}
+
+    loaded = cached_stage('load', key, compute, force)
+    used_rows = rows[loaded['used']]
+    excluded += [(catalog['file_path'][i], catalog['globals'][i], 'no frame') for i in np.setdiff1d(rows, used_rows)]
+    return key, {'file_path': [catalog['file_path'][i] for i in used_rows],
+                 'globals': [catalog['globals'][i] for i in used_rows],
+                 'reasons': [reasons[i] for i in used_rows], 'position': used_rows.tolist(),
+                 'stack': loaded['stack'], 'excluded': excluded}
+
+
+# Background stage, every strategy takes (stack, loaded background folders, config, roi) and returns float32 crops
+
+def background_none(stack, backgrounds, config, roi):
+    return stack.astype(np.float32)
+
+
+def background_paired(stack, backgrounds, config, roi):
+    # Shot i minus the sum of shot i of every background folder, like release_and_recapture_green_mot.py. The
+    # stacks come in paired by background_stage (pair_shots)
+    combined = sum(b['stack'].astype(np.float32) for b in backgrounds)
+    return np.clip(stack.astype(np.float32) - combined, 0, None)
+
+
+def background_mean(stack, backgrounds, config, roi):
+    # The mean frames of the background folders are added up and subtracted from every shot
+    combined = sum(b['stack'].mean(axis=0, dtype=np.float32) for b in backgrounds)
+    return np.clip(stack.astype(np.float32) - combined, 0, None)
+
+
+def background_constant(stack, backgrounds, config, roi):
+    return np.clip(stack.astype(np.float32) - float(config.get('value', 0)), 0, None)
+
+
+def background_eigen(stack, backgrounds, config, roi):
+    '''
+    Best combination of the eigen images of all background shots, fitted outside the cloud, see
+    green_mot/eigenbackground.py. Config: n_components (default 8), signal = [top, bottom, left, right] region of
+    the cloud in camera pixels that is left out of the fit (default the middle half of the crop), clip.
+    '''
+    if not backgrounds:
+        raise ValueError("The eigen background needs at least one background folder")
+    signal_region = config.get('signal')
+    if signal_region is not None:
+        top, bottom, left, right = signal_region
+        signal_region = (top - roi[0], bottom - roi[0], left - roi[2], right - roi[2])
+    background_stack = np.concatenate([b['stack'] for b in backgrounds])
+    return subtract_eigen_background(stack, background_stack, config.get('n_components', 8), signal_region,
+                                     config.get('clip', False))
+
+
+background_strategies = {
+    'none': background_none,
+    'paired': background_paired,
+    'mean': background_mean,
+    'constant': background_constant,
+    'eigen': background_eigen,
+}
+
+
+def pair_shots(loaded, backgrounds):
+    '''
+    Rows of loaded that have a shot at the same position (row in the folder's catalog) in every background folder,
+    and the background dicts with their stacks reordered to match those rows.
+    '''
+    indices = [{position: k for k, position in enumerate(b['position'])} for b in backgrounds]
+    rows = [k for k, position in enumerate(loaded['position']) if all(position in index for index in indices)]
+    paired = [dict(b, stack=b['stack'][[index[loaded['position'][k]] for k in rows]])
+              for b, index in zip(backgrounds, indices)]
+    return rows, paired
+
+
+def background_stage(loaded, load_key, config, roi, force=False, screening=None):
+    '''
+    Background subtracted frames. Returns (key, dict like the loaded one with the float32 stack), shots the
+    paired strategy finds no background shot for move to 'excluded'.
+    '''
+    strategy = config.get('strategy', 'none')
+    if strategy not in background_strategies:
+        raise ValueError(f"Unknown background strategy '{strategy}', available: {', '.join(background_strategies)}")
+    backgrounds = [load_stage(folder, roi, force=force, screening=screening) for folder in config.get('folders', [])]
+    background_inputs = [b for _, b in backgrounds]
+    rows = list(range(len(loaded['file_path'])))
+    if strategy == 'paired':
+        rows, background_inputs = pair_shots(loaded, background_inputs)
+    key = stage_key('background', {'config': config, 'rows': rows}, [load_key] + [k for k, _ in backgrounds])
+
+    def compute():
+        stack = loaded['stack'] if len(rows) == len(loaded['stack']) else loaded['stack'][rows]
+        return {'stack': background_strategies[strategy](stack, background_inputs, config, roi)}
+
+    stack = cached_stage('background', key, compute, force)['stack']
+    unpaired = sorted(set(range(len(loaded['file_path']))) - set(rows))
+    if unpaired:
+        print(f"Warning: {len(unpaired)} shots have no shot at the same position in every background folder, "
+              f"left out")
+    processed = {name: [loaded[name][k] for k in rows] for name in ('file_path', 'globals', 'reasons', 'position')}
+    processed['stack'] = stack
+    processed['excluded'] = loaded['excluded'] + [(loaded['file_path'][k], loaded['globals'][k], 'no paired background')
+                                                  for k in unpaired]
+    return key, processed
+
+
+# Integral stage, summed-area tables of the background subtracted region
+
+def integral_stage(processed, processed_key, force=False):
+    key = stage_key('integral', {}, [processed_key])
+
+    def compute():
+        return {'tables': compact_summed_area_tables(processed['stack'])}
+
+    return key, cached_stage('integral', key, compute, force)['tables']
+
+
+def region_box(roi, region):
+    # roi in camera pixels -> (top, bottom, left, right) in pixels of the region
+    return roi[0] - region[0], roi[1] - region[0], roi[2] - region[2], roi[3] - region[2]
+
+
+def crop_stage(processed, processed_key, roi, region):
+    # The roi cut out of the background subtracted region, a view, so nothing is cached
+    top, bottom, left, right = region_box(roi, region)
+    key = stage_key('crop', {'roi': list(roi), 'region': list(region)}, [processed_key])
+    return key, dict(processed, stack=processed['stack'][:, top:bottom, left:right])
+
+
+# Preprocess stage, binning and smoothing
+
+def preprocess_stage(processed, processed_key, config, force=False):
+    if not config:
+        return processed_key, processed
+    key = stage_key('preprocess', config, [processed_key])
+
+    def compute():
+        return {'stack': preprocess(processed['stack'], config.get('binning', 1), config.get('filter'),
+                                    config.get('sigma', 1.0), config.get('size', 3))}
+
+    stack = cached_stage('preprocess', key, compute, force)['stack']
+    return key, dict(processed, stack=stack)
+
+
+# Metrics stage, every metric takes (stack, roi, binning) and returns {column name: (N,) array}
+
+def metric_pixel_sum(stack, roi, binning=1):
+    return {'pixel_sum': pixel_sums(stack)}
+
+
+def metric_peak(stack, roi, binning=1):
+    return {'peak': stack.max(axis=(1, 2)).astype(np.float64)}
+
+
+def metric_moments(stack, roi, binning=1):
+    # Positions and widths in pixels of the full camera frame, a binned pixel k covers pixels k * b ... k * b + b - 1
+    columns = moments(stack)
+    offset = (binning - 1) / 2
+    columns['centroid_x'] = columns['centroid_x'] * binning + offset + roi[2]
+    columns['centroid_y'] = columns['centroid_y'] * binning + offset + roi[0]
+    for name in ('sigma_x', 'sigma_y'):
+        columns[name] = columns[name] * binning
+    columns['sigma_xy'] = columns['sigma_xy'] * binning ** 2
+    return columns
+
+
+stack_metrics = {
+    'pixel_sum': metric_pixel_sum,
+    'peak': metric_peak,
+    'moments': metric_moments,
+}
+
+
+def metrics_stage(processed, processed_key, config, calibration, roi, binning=1, force=False, counts=None):
+    # counts are the pixel sums of the shots when they are already known (from the integral stage)
+    names = config.get('names', ['pixel_sum'])
+    for name in names:
+        if name not in stack_metrics:
+            raise ValueError(f"Unknown metric '{name}', available: {', '.join(stack_metrics)}")
+    key = stage_key('metrics', {'metrics': config, 'calibration': calibration, 'roi': list(roi), 'binning': binning},
+                    [processed_key])
+
+    def compute():
+        table = {'file_path': processed['file_path'], 'globals': processed['globals']}
+        table['t_wait'] = globals_column(table, 'T_WAIT')
+        for name in names:
+            if name == 'pixel_sum' and counts is not None:
+                table['pixel_sum'] = counts
+            else:
+                table.update(stack_metrics[name](processed['stack'], roi, binning))
+        if calibration is not None:
+            if 'pixel_sum' in table:
+                shot_counts = table['pixel_sum']
+            else:
+                shot_counts = counts if counts is not None else pixel_sums(processed['stack'])
+            table['atom_number'] = atom_numbers(table, shot_counts, calibration)
+        return table
+
+    table = cached_stage('metrics', key, compute, force)
+    table['file_path'] = processed['file_path']
+    table['usable'] = np.ones(len(table['file_path']), dtype=bool)
+    table['reasons'] = processed['reasons']
+    return key, table
+
+
+def add_excluded_rows(table, excluded):
+    # The shots left out before the analysis as rows with NaN metrics, usable = False and their reasons
+    if not excluded:
+        return table
+    file_paths, shot_globals, reasons = (list(column) for column in zip(*excluded))
+    extended = {}
+    for name, column in table.items():
+        if name == 'file_path':
+            extended[name] = list(column) + file_paths
+        elif name == 'globals':
+            extended[name] = list(column) + shot_globals
+        elif name == 'reasons':
+            extended[name] = list(column) + reasons
+        elif name == 'usable':
+            extended[name] = np.concatenate((column, np.zeros(len(excluded), dtype=bool)))
+        else:
+            extended[name] = np.concatenate((np.asarray(column, dtype=np.float64), np.full(len(excluded), np.nan)))
+    extended['t_wait'] = globals_column(extended, 'T_WAIT')
+    return extended
+
+
+# Output stage, always written since it is cheap
+
+def write_outputs(table, config, name):
+    from green_mot.aggregate import write_csv
+    from green_mot.results import ResultsWriter, write_results_table
+
+    if config.get('write_back'):
+        with ResultsWriter(name) as writer:
+            writer.write_table(table)
+    if config.get('table'):
+        write_results_table({column: values for column, values in table.items() if column != 'globals'},
+                            resolve_path(config['table']))
+
+    if not config.get('csv'):
+        return
+    csv_path = resolve_path(config['csv'])
+    os.makedirs(os.path.dirname(csv_path), exist_ok=True)
+    write_csv({name: column for name, column in table.items() if name != 'globals'}, csv_path)
+
+    column = config.get('plot')
+    if column:
+        # Figure without pyplot, so no window or display is needed
+        from matplotlib.figure import Figure
+
+        fig = Figure(figsize=(10, 6))
+        ax = fig.subplots()
+        plot_metric(ax, table, table[column], column, config.get('x'), config.get('facet'))
+        plot_path = os.path.splitext(csv_path)[0] + '.png'
+        fig.savefig(plot_path)
+        print(f"Plot saved: {plot_path}")
+
+
+def spec_regions(spec):
+    # (roi, region) of a pipeline, region is the [integral] region or None
+    roi_config = spec['roi']
+    roi = (roi_config['top'], roi_config['bottom'], roi_config['left'], roi_config['right'])
+    if roi[0] >= roi[1] or roi[2] >= roi[3]:
+        raise ValueError(f"Invalid cropping region: top={roi[0]}, bottom={roi[1]}, left={roi[2]}, right={roi[3]}")
+    if 'integral' not in spec:
+        return roi, None
+    if 'region' not in spec['integral']:
+        raise ValueError("The [integral] table needs region = [top, bottom, left, right]")
+    region = tuple(int(v) for v in spec['integral']['region'])
+    if not (region[0] <= roi[0] and roi[1] <= region[1] and region[2] <= roi[2] and roi[3] <= region[3]):
+        raise ValueError(f"The cropping region {roi} is not inside the integral region {region}")
+    return roi, region
+
+
+def integral_tables(spec, force=False):
+    '''
+    Summed-area tables of the background subtracted [integral] region of a pipeline.
+    Returns (file paths, region, (N, H + 1, W + 1) tables), see green_mot/integral.py for box sums over them.
+    '''
+    _, region = spec_regions(spec)
+    if region is None:
+        raise ValueError(f"Pipeline {spec.get('name', '')} has no [integral] table")
+    source = spec['source']
+    screening = screening_options(spec)
+    load_key, loaded = load_stage(source['folder'], region, source.get('recursive', False), force, screening)
+    processed_key, processed = background_stage(loaded, load_key, spec.get('background', {}), region, force,
+                                                screening)
+    _, tables = integral_stage(processed, processed_key, force)
+    return processed['file_path'], region, tables
+
+
+def crop_sensitivity(spec, margin=20, step=2, force=False):
+    '''
+    Mean counts over the shots of a pipeline while each edge of its roi moves by -margin ... margin pixels
+    (clipped to the [integral] region, NaN outside). Returns (offsets, {edge: (K,) mean counts}).
+    '''
+    roi, _ = spec_regions(spec)
+    _, region, tables = integral_tables(spec, force)
+    offsets, scans = edge_scan(tables, region_box(roi, region), margin, step)
+    return offsets, {edge: counts.mean(axis=0) for edge, counts in scans.items()}
+
+
+def run_pipeline(spec, force=False):
+    '''
+    Run a pipeline given as a dict (see load_spec) and return the metrics table.
+    force=True recomputes every stage instead of reusing the cache.
+    '''
+    print(f"Pipeline {spec.get('name', '')}")
+    roi, region = spec_regions(spec)
+
+    source = spec['source']
+    load_roi = roi if region is None else region
+    screening = screening_options(spec)
+    load_key, loaded = load_stage(source['folder'], load_roi, source.get('recursive', False), force, screening)
+    processed_key, processed = background_stage(loaded, load_key, spec.get('background', {}), load_roi, force,
+                                                screening)
+    counts = None
+    if region is not None:
+        _, tables = integral_stage(processed, processed_key, force)
+        counts = box_sums(tables, region_box(roi, region))
+        processed_key, processed = crop_stage(processed, processed_key, roi, region)
+    preprocess_config = spec.get('preprocess', {})
+    processed_key, processed = preprocess_stage(processed, processed_key, preprocess_config, force)
+    _, table = metrics_stage(processed, processed_key, spec.get('metrics', {}), spec.get('calibration'), roi,
+                             preprocess_config.get('binning', 1), force, counts)
+    table = add_excluded_rows(table, processed['excluded'])
+    write_outputs(table, spec.get('output', {}), spec.get('name', 'pipeline'))
+    return table
+
+
+if __name__ == '__main__':
+    import sys
+
+    arguments = sys.argv[1:]
+    force = '--force' in arguments
+    arguments = [a for a in arguments if a != '--force']
+    scan_margin = None
+    if '--scan' in arguments:
+        i = arguments.index('--scan')
+        scan_margin = int(arguments[i + 1])
+        del arguments[i:i + 2]
+    overrides = []
+    while '--set' in arguments:
+        i = arguments.index('--set')
+        overrides.append(arguments[i + 1])
+        del arguments[i:i + 2]
+    if not arguments:
+        print("usage: python -m green_mot.pipeline <pipeline.toml> [<pipeline.toml> ...] [--set key=value ...] "
+              "[--force]")
+        print("  --set    change one value of every pipeline, e.g. --set roi.top=420 --set background.strategy=mean")
+        print("  --force  recompute every stage")
+        print("  --scan   mean counts while every edge of the roi moves by up to <margin> pixels, needs [integral]")
+        sys.exit(1)
+    for spec_path in arguments:
+        spec = load_spec(spec_path, overrides)
+        if scan_margin is None:
+            run_pipeline(spec, force)
+            continue
+        offsets, scans = crop_sensitivity(spec, scan_margin, max(1, scan_margin // 10), force)
+        print(f"{'offset':>8}" + ''.join(f"{edge:>14}" for edge in scans))
+        for k, offset in enumerate(offsets):
+            print(f"{offset:>8}" + ''.join(f"{scans[edge][k]:>14.6g}" for edge in scans))
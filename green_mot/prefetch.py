@@ -0,0 +1,107 @@
+'''
+Prefetching shot loader
+
+Reading and decompressing the frames is done on a background thread while the caller works on the shots that
+were already loaded. The queue between the two is bounded by the prefetch depth, so the reader never runs more
+than that many shots ahead and memory stays flat on large folders. On a network mounted data folder the total
+time approaches whichever of reading or processing is slower, instead of the sum of both.
+'''
+
+import queue
+import threading
+
+import numpy as np
+
+from green_mot.shots import read_frame, read_globals
+
+# Marks the end of the stream in the queue
+_done = object()
+
+
+class PrefetchLoader:
+    '''
+    Iterate over (file_path, frame, globals) for each shot, with the reads running ahead on a thread.
+
+    depth is the number of shots that may be waiting in the queue. Shots without a frame are skipped.
+    Errors raised while reading are raised again in the loop that consumes the loader.
+
+        for file_path, frame, shot_globals in PrefetchLoader(files, roi, depth=8):
+            ...
+    '''
+
+    def __init__(self, file_paths, roi=None, depth=4, with_globals=True):
+        if depth < 1:
+            raise ValueError(f"Prefetch depth must be at least 1, got {depth}")
+        self.file_paths = list(file_paths)
+        self.roi = roi
+        self.depth = depth
+        self.with_globals = with_globals
+        self._queue = None
+        self._stop = None
+        self._thread = None
+
+    def _read_all(self):
+        try:
+            for file_path in self.file_paths:
+                if self._stop.is_set():
+                    return
+                frame = read_frame(file_path, self.roi)
+                if frame is None:
+                    continue
+                shot_globals = read_globals(file_path) if self.with_globals else None
+                self._put((file_path, frame, shot_globals))
+        except Exception as error:  # handed over to the consuming thread
+            self._put(error)
+        finally:
+            self._put(_done)
+
+    def _put(self, item):
+        # Block while the queue is full (backpressure), but give up if the consumer stopped listening
+        while not self._stop.is_set():
+            try:
+                self._queue.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                continue
+
+    def __iter__(self):
+        self._queue = queue.Queue(maxsize=self.depth)
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._read_all, daemon=True)
+        self._thread.start()
+        try:
+            while True:
+                item = self._queue.get()
+                if item is _done:
+                    return
+                if isinstance(item, Exception):
+                    raise item
+                yield item
+        finally:
+            self.close()
+
+    def close(self):
+        # Stop the reader thread, also used when the consuming loop exits early
+        if self._stop is not None:
+            self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+
+def prefetch_batches(file_paths, roi=None, batch_size=16, depth=2, with_globals=True):
+    '''
+    Like PrefetchLoader but yields (file_paths, (N, H, W) stack, list of globals) batches, so that vectorized
+    reductions can run on one batch while the next one is being read. depth counts batches here.
+    '''
+    loader = PrefetchLoader(file_paths, roi, depth=depth * batch_size, with_globals=with_globals)
+    paths, frames, globals_list = [], [], []
+    for file_path, frame, shot_globals in loader:
+        paths.append(file_path)
+        frames.append(frame)
+        globals_list.append(shot_globals)
+        if len(frames) == batch_size:
+            yield paths, np.stack(frames), globals_list
+            paths, frames, globals_list = [], [], []
+    if frames:
+        yield paths, np.stack(frames), globals_list
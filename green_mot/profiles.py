@@ -0,0 +1,214 @@
+'''
+Radial profiles of the cloud
+
+radial_profiles() averages every frame of an (N, H, W) stack over rings around the cloud centre and returns an
+(N, n_bins) array, the mean intensity per ring. The rings are worked out once, not per centre: ring_offsets()
+lists the pixel offsets (dy, dx) from a centre out to the outermost ring, sorted by ring, for the sub-pixel part
+of the centre (cached, with the default center_step of 0.5 there are only four). For a frame with its centre at
+the whole pixel (y, x) the offsets are one fixed index array into the frame starting at (y, x), so the profile
+is one gather of the pixels in ring order plus one np.add.reduceat over the ring boundaries, whatever the centre.
+That is the reduction np.bincount(ring, weights=frame) does, but on contiguous memory and without a ring map per
+frame, which makes it several times faster (about a thousand 450 x 440 frames per second, also when the centroid
+moves from frame to frame). Frames whose outer rings leave the crop are copied into a zero padded buffer first.
+
+The centre is by default the centroid of every frame (green_mot/tracking.py), rounded to a grid of center_step
+pixels so that all centres share a few ring_offsets(). Run from the repository root with
+    python -m green_mot.profiles <top> <bottom> <left> <right> <folder> [<folder> ...] [--output <png>]
+to compare the mean profile of several experiment folders, e.g. NoRamp_*V against WithRamp_*.
+'''
+
+import os
+from functools import lru_cache
+
+import numpy as np
+
+from green_mot.tracking import centroids
+
+
+@lru_cache(maxsize=256)
+def ring_offsets(phase, bin_width=1.0, n_bins=100):
+    '''
+    (dy, dx, starts, rings, counts) for a centre at phase (fy, fx) from the whole pixel, 0 <= fy, fx < 1.
+    dy, dx are the offsets of the pixels inside the outermost ring sorted by ring, starts where each ring begins
+    in them, rings the ring number of each start (rings without a pixel are left out) and counts the number of
+    pixels of each of these rings. Ring k holds the pixels at k * bin_width <= r < (k + 1) * bin_width from the
+    centre.
+    '''
+    reach = int(np.ceil(n_bins * bin_width)) + 1
+    dy, dx = np.mgrid[-reach:reach + 1, -reach:reach + 1]
+    ring = (np.hypot(dy - phase[0], dx - phase[1]) / bin_width).astype(np.intp).ravel()
+    inside = np.flatnonzero(ring < n_bins)
+    order = inside[np.argsort(ring[inside], kind='stable')]
+    sorted_rings = ring[order]
+    starts = np.flatnonzero(np.r_[True, sorted_rings[1:] != sorted_rings[:-1]])[:len(order)]
+    counts = np.diff(np.r_[starts, len(order)])
+    result = dy.ravel()[order], dx.ravel()[order], starts, sorted_rings[starts], counts
+    for array in result:
+        array.flags.writeable = False
+    return result
+
+
+def default_bins(shape, bin_width=1.0):
+    # Rings out to half the shorter side of the crop, the ones that fit completely for a centred cloud
+    return max(1, int(min(shape) / 2 / bin_width))
+
+
+def ring_radii(n_bins, bin_width=1.0):
+    # Middle radius of every ring, in crop pixels
+    return (np.arange(n_bins) + 0.5) * bin_width
+
+
+def _ring_counts(dy, dx, starts, counts, shape, whole):
+    # Pixels per ring inside a crop of shape (H, W) for a centre at the whole pixel (y, x)
+    outside = np.flatnonzero((dy < -whole[0]) | (dy >= shape[0] - whole[0]) | (dx < -whole[1]) |
+                             (dx >= shape[1] - whole[1]))
+    if not len(outside):
+        return counts
+    return counts - np.bincount(np.searchsorted(starts, outside, side='right') - 1, minlength=len(counts))
+
+
+def _profiles_of_phase(stack, rows, whole, phase, bin_width, n_bins, pad, profiles, batch_size):
+    # Profiles of the frames rows of stack, whose centres share one sub-pixel phase, written into profiles
+    height, width = stack.shape[1:]
+    dy, dx, starts, rings, counts = ring_offsets(phase, bin_width, n_bins)
+    padded_width = width + 2 * pad
+    index = dy * padded_width + dx
+    first = index.min()
+    index = index - first
+    # Start of every frame's gather in its flat (padded) frame
+    offsets = (whole[rows, 0] + pad) * padded_width + whole[rows, 1] + pad + first
+    if pad:
+        buffer = np.zeros((min(batch_size, len(rows)), height + 2 * pad, padded_width), stack.dtype)
+        flat = buffer.reshape(len(buffer), -1)
+    else:
+        flat = np.ascontiguousarray(stack).reshape(len(stack), -1)
+    # Integer frames are summed exactly, in int32 when no ring can overflow it (much faster) and else in int64,
+    # float frames in float64
+    if stack.dtype.kind in 'biu':
+        small = stack.dtype.itemsize <= 2 and counts.max() < 2 ** 15
+        dtype = np.int32 if small else np.int64
+    else:
+        dtype = np.float64
+    gathered = np.empty((min(batch_size, len(rows)), len(index)), stack.dtype)
+    ring_counts = np.empty((len(gathered), len(starts)), np.intp)
+    known = {}  # ring counts by whole pixel centre, they differ where the rings leave the crop
+    for start in range(0, len(rows), batch_size):
+        batch = rows[start:start + batch_size]
+        if pad:
+            buffer[:len(batch), pad:pad + height, pad:pad + width] = stack[batch]
+        for j, offset in enumerate(offsets[start:start + batch_size]):
+            np.take(flat[j if pad else batch[j], offset:], index, out=gathered[j])
+            center = tuple(whole[batch[j]])
+            if center not in known:
+                known[center] = _ring_counts(dy, dx, starts, counts, (height, width), center)
+            ring_counts[j] = known[center]
+        sums = np.add.reduceat(gathered[:len(batch)], starts, axis=1, dtype=dtype)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            profiles[batch[:, None], rings] = sums / ring_counts[:len(batch)]
+
+
+def radial_profiles(stack, centers=None, bin_width=1.0, n_bins=None, center_step=0.5, batch_size=16):
+    '''
+    Azimuthally averaged profile of every frame of an (N, H, W) stack, returned as an (N, n_bins) float64 array
+    of mean counts per ring (NaN for rings without a pixel in the crop) with the radii from ring_radii().
+
+    centers is None for the centroid of every frame, one (y, x) for all frames or an (N, 2) array of (y, x),
+    all in crop pixels. Centres are rounded to multiples of center_step, every distinct sub-pixel part of the
+    centres costs one ring_offsets(). Subtract the background before, stray light pulls the centroids towards the
+    middle of the crop.
+    '''
+    stack = np.asarray(stack)
+    if stack.ndim == 2:
+        stack = stack[None]
+    if n_bins is None:
+        n_bins = default_bins(stack.shape[1:], bin_width)
+    if centers is None:
+        centers = centroids(stack)
+        # A frame without signal has no centroid, its profile is taken around the middle of the crop
+        middle = (np.array(stack.shape[1:]) - 1) / 2
+        centers = np.where(np.isnan(centers), middle, centers)
+    centers = np.broadcast_to(np.asarray(centers, dtype=np.float64), (len(stack), 2))
+    centers = np.round(centers / center_step) * center_step
+    whole = np.floor(centers).astype(np.intp)
+    phases = np.round(centers - whole, 9)
+
+    profiles = np.full((len(stack), n_bins), np.nan)
+    if not len(stack):
+        return profiles
+    # Zero padding so that the outermost ring of every frame stays inside its buffer
+    reach = int(np.ceil(n_bins * float(bin_width))) + 1
+    pad = int(max(0, (reach - whole).max(), (whole + reach + 1 - stack.shape[1:]).max()))
+    # Frames grouped by the sub-pixel phase of their centre, with one sort
+    unique_phases, group = np.unique(phases, axis=0, return_inverse=True)
+    group = group.ravel()
+    order = np.argsort(group, kind='stable')
+    for rows in np.split(order, np.flatnonzero(np.diff(group[order])) + 1):
+        phase = tuple(float(v) for v in unique_phases[group[rows[0]]])
+        _profiles_of_phase(stack, rows, whole, phase, float(bin_width), n_bins, pad, profiles, batch_size)
+    return profiles
+
+
+def folder_profiles(folder_path, roi, background=None, bin_width=1.0, n_bins=None, center_step=0.5):
+    '''
+    Radial profiles of every shot of a folder: a table with file_path, t_wait and profile (N, n_bins), plus
+    radius (n_bins,) in pixels. background is an (H, W) crop or a number subtracted (and clipped at zero) first.
+    Returns None when no shot has a frame.
+    '''
+    from green_mot.catalog import build_catalog, globals_column
+    from green_mot.shots import load_roi_stack
+
+    catalog = build_catalog(folder_path, recursive=True)
+    stack, file_paths = load_roi_stack([p for p, f in zip(catalog['file_path'], catalog['has_frame']) if f], roi)
+    if stack is None:
+        return None
+    if background is not None:
+        stack = np.clip(stack.astype(np.float32) - background, 0, None)
+    t_wait_by_path = dict(zip(catalog['file_path'], globals_column(catalog, 'T_WAIT')))
+    profiles = radial_profiles(stack, bin_width=bin_width, n_bins=n_bins, center_step=center_step)
+    return {
+        'file_path': file_paths,
+        't_wait': np.array([t_wait_by_path[p] for p in file_paths]),
+        'profile': profiles,
+        'radius': ring_radii(profiles.shape[1], bin_width),
+    }
+
+
+if __name__ == '__main__':
+    import sys
+
+    import matplotlib
+
+    from green_mot.compare import experiment_label
+
+    arguments = sys.argv[1:]
+    output_png = None
+    if '--output' in arguments:
+        i = arguments.index('--output')
+        output_png = arguments[i + 1]
+        del arguments[i:i + 2]
+        matplotlib.use('Agg')
+    if len(arguments) < 5:
+        print("usage: python -m green_mot.profiles <top> <bottom> <left> <right> <folder> [<folder> ...] "
+              "[--output <png>]")
+        sys.exit(1)
+    import matplotlib.pyplot as plt
+
+    roi = tuple(int(v) for v in arguments[:4])
+    plt.figure(figsize=(8, 6))
+    for folder in arguments[4:]:
+        table = folder_profiles(folder, roi)
+        if table is None:
+            print(f"Warning: no frames in {folder}, skipped")
+            continue
+        label = experiment_label(os.path.basename(os.path.normpath(folder)))
+        plt.plot(table['radius'], np.nanmean(table['profile'], axis=0), label=f"{label} ({len(table['file_path'])})")
+    plt.xlabel('Radius from the cloud centroid (pixels)')
+    plt.ylabel('Mean counts per pixel')
+    plt.title('Radial profile, mean over the shots of every folder')
+    plt.grid(True)
+    plt.legend()
+    if output_png:
+        plt.savefig(output_png)
+        print(f"Radial profiles saved: {output_png}")
+    else:
+        plt.show()
@@ -0,0 +1,188 @@
+'''
+Repack a folder of shot files into one analysis store
+
+Every shot file is about 1 MB, and most of that is labscript metadata around a single frame, so opening the files
+costs more than reading the pixels. repack_folder() copies the frames of a whole data/<day>/<experiment> folder
+into one HDF5 file:
+
+    frames                  (N, H, W) camera frames, chunked per frame in tiles so a crop only decodes the tiles
+                            it overlaps, compressed with gzip after byte shuffling, which keeps the store a bit
+                            smaller than the frames of the source files (about 23 MB instead of 28 MB for the 15
+                            shots of a release and recapture folder). --codec lzf decodes about twice as fast but
+                            takes 15 % more space than the source. With --contiguous the frames are stored
+                            uncompressed in one block and read through a memory map instead (shots.memmap_dataset)
+    has_frame               (N,) False where the shot had no frame (the frame is left as zeros)
+    globals/<name>          one column per labscript global, numbers as float64, text as strings, array valued
+                            globals as json text that is read back as lists, like read_globals gives them
+    globals_present/<name>  (N,) True where the shot has that global
+    shots/...               source_path, source_mtime, source_size, run_number, sequence_id, has_globals,
+                            pixel_format (of the camera, empty if the shot does not record it)
+    source/<index>          external link to the original shot file, so everything else in it stays reachable
+
+The store can be used wherever a folder of shots is expected, see green_mot/shots.py.
+Zarr would work for the same layout, HDF5 is used because h5py is already a requirement.
+'''
+
+import json
+import os
+
+import h5py
+import numpy as np
+
+from green_mot.shots import (_to_python, base_directory, data_directory, dataset_path, list_shot_files,
+                             read_pixel_format)
+
+repacked_directory = os.path.join(base_directory, 'repacked')
+
+store_version = 1
+
+# One frame per chunk in the first axis, tiles of 150 x 160 pixels, a 1200 x 1920 frame is 8 x 12 tiles
+default_chunk_shape = (150, 160)
+
+
+def default_store_path(folder_path):
+    # data/<day>/<experiment> -> repacked/<day>/<experiment>.h5
+    relative = os.path.relpath(os.path.abspath(folder_path), data_directory)
+    if relative.startswith('..'):
+        relative = os.path.basename(os.path.normpath(folder_path))
+    return os.path.join(repacked_directory, relative + '.h5')
+
+
+def _global_kind(values):
+    # Column type for the values one global takes across the shots
+    if all(isinstance(v, bool) for v in values):
+        return 'bool'
+    if all(isinstance(v, int) and not isinstance(v, bool) for v in values):
+        return 'int'
+    if all(isinstance(v, (int, float)) for v in values):
+        return 'float'
+    if all(isinstance(v, list) for v in values):
+        return 'array'
+    return 'str'
+
+
+def repack_folder(folder_path, store_path=None, recursive=True, chunk_shape=default_chunk_shape,
+                  compression='gzip'):
+    '''
+    Write every shot under folder_path into one store file and return its path.
+    compression is 'gzip' (level 4) or 'lzf', both with byte shuffling. None writes the frames uncompressed and
+    contiguous, which allows memory mapped reads.
+    '''
+    files = list_shot_files(folder_path, recursive=recursive)
+    if not files:
+        raise FileNotFoundError(f"No shot files found in {folder_path}")
+    store_path = store_path or default_store_path(folder_path)
+    os.makedirs(os.path.dirname(os.path.abspath(store_path)), exist_ok=True)
+
+    # First pass over the metadata only, to know the frame shape and which globals exist
+    shot_globals = []
+    frame_shape = None
+    frame_dtype = None
+    source_frame_bytes = 0
+    for file_path in files:
+        with h5py.File(file_path, 'r') as f:
+            shot_globals.append({key: _to_python(value) for key, value in f['globals'].attrs.items()}
+                                if 'globals' in f else None)
+            if dataset_path in f:
+                source_frame_bytes += f[dataset_path].id.get_storage_size()
+            if frame_shape is None and dataset_path in f and f[dataset_path].size > 0:
+                frame_shape = f[dataset_path].shape
+                frame_dtype = f[dataset_path].dtype
+    if frame_shape is None:
+        raise ValueError(f"None of the shots in {folder_path} has a frame")
+
+    count = len(files)
+    temporary_path = store_path + '.tmp'
+    with h5py.File(temporary_path, 'w') as store:
+        store.attrs['green_mot_store'] = store_version
+        store.attrs['dataset_path'] = dataset_path
+        store.attrs['source_folder'] = os.path.abspath(folder_path)
+
+        if compression is None:
+            frames = store.create_dataset('frames', shape=(count,) + frame_shape, dtype=frame_dtype)
+        else:
+            chunks = (1, min(chunk_shape[0], frame_shape[0]), min(chunk_shape[1], frame_shape[1]))
+            frames = store.create_dataset('frames', shape=(count,) + frame_shape, dtype=frame_dtype,
+                                          chunks=chunks, compression=compression, shuffle=True,
+                                          compression_opts=4 if compression == 'gzip' else None)
+        has_frame = np.zeros(count, dtype=bool)
+
+        shots = store.create_group('shots')
+        source = store.create_group('source')
+        source_paths = []
+        run_numbers = np.full(count, -1, dtype=np.int64)
+        sequence_ids = []
+        pixel_formats = []
+        for i, file_path in enumerate(files):
+            with h5py.File(file_path, 'r') as f:
+                if dataset_path in f and f[dataset_path].shape == frame_shape:
+                    frames[i] = f[dataset_path][()]
+                    has_frame[i] = True
+                elif dataset_path in f and f[dataset_path].size > 0:
+                    print(f"Warning: {file_path} has a {f[dataset_path].shape} frame, expected {frame_shape}. "
+                          f"Stored without frame.")
+                run_number = _to_python(f.attrs.get('run number', -1))
+                run_numbers[i] = run_number if isinstance(run_number, int) else -1
+                sequence_ids.append(str(_to_python(f.attrs.get('sequence_id', ''))))
+                pixel_formats.append(read_pixel_format(f) or '')
+            source_paths.append(os.path.abspath(file_path))
+            source[str(i)] = h5py.ExternalLink(os.path.abspath(file_path), '/')
+
+        store.create_dataset('has_frame', data=has_frame)
+        string_type = h5py.string_dtype()
+        stats = [os.stat(p) for p in files]
+        shots.create_dataset('source_path', data=source_paths, dtype=string_type)
+        shots.create_dataset('source_mtime', data=[s.st_mtime_ns for s in stats], dtype=np.int64)
+        shots.create_dataset('source_size', data=[s.st_size for s in stats], dtype=np.int64)
+        shots.create_dataset('run_number', data=run_numbers)
+        shots.create_dataset('sequence_id', data=sequence_ids, dtype=string_type)
+        shots.create_dataset('pixel_format', data=pixel_formats, dtype=string_type)
+        shots.create_dataset('has_globals', data=[g is not None for g in shot_globals], dtype=bool)
+
+        # Columnar globals, one dataset per name plus a mask of the shots that have it
+        globals_group = store.create_group('globals')
+        present_group = store.create_group('globals_present')
+        names = sorted({name for g in shot_globals if g for name in g})
+        for name in names:
+            present = np.array([g is not None and name in g for g in shot_globals], dtype=bool)
+            values = [g[name] for g in shot_globals if g is not None and name in g]
+            kind = _global_kind(values)
+            if kind == 'array':
+                column = [json.dumps(g[name]) if p else '' for g, p in zip(shot_globals, present)]
+                dataset = globals_group.create_dataset(name, data=column, dtype=string_type)
+            elif kind == 'str':
+                column = [str(g[name]) if p else '' for g, p in zip(shot_globals, present)]
+                dataset = globals_group.create_dataset(name, data=column, dtype=string_type)
+            else:
+                column = np.full(count, np.nan)
+                column[present] = [float(v) for v in values]
+                dataset = globals_group.create_dataset(name, data=column)
+            dataset.attrs['kind'] = kind
+            present_group.create_dataset(name, data=present)
+
+        frame_bytes = frames.id.get_storage_size()
+
+    if compression is not None and frame_bytes > source_frame_bytes:
+        print(f"Warning: the frames take {frame_bytes / 1e6:.1f} MB in the store, more than the "
+              f"{source_frame_bytes / 1e6:.1f} MB of the source files")
+    os.replace(temporary_path, store_path)
+    print(f"Repacked {count} shots from {folder_path} into {store_path}")
+    return store_path
+
+
+if __name__ == '__main__':
+    import sys
+
+    arguments = [a for a in sys.argv[1:] if a != '--contiguous']
+    codec = 'gzip'
+    if '--codec' in arguments:
+        i = arguments.index('--codec')
+        codec = arguments[i + 1]
+        del arguments[i:i + 2]
+    if not arguments or codec not in ('gzip', 'lzf'):
+        print("usage: python -m green_mot.repack [--contiguous] [--codec gzip|lzf] <data folder> [<store file>]")
+        print("  --contiguous  store the frames uncompressed so they can be memory mapped")
+        print("  --codec       gzip (default, smaller than the source files) or lzf (faster to decode, larger)")
+        sys.exit(1)
+    repack_folder(arguments[0], arguments[1] if len(arguments) > 1 else None,
+                  compression=None if '--contiguous' in sys.argv else codec)
@@ -0,0 +1,234 @@
+'''
+Writing results back into the shot files
+
+The pixel sums, fit parameters and centroids used to be plotted and thrown away. ResultsWriter stores them the way
+lyse does: as attributes of the group results/<analysis> in every shot file, so lyse and any later script can read
+them back with the shot. For a shot inside a repacked store the values go into one column per result under
+results/<analysis> in the store instead. When the writer is closed, one consolidated HDF5 table with a row per
+shot and a column per result is written as well (HDF5 rather than Parquet, h5py is already a requirement).
+
+Writing is done on a background thread so the analysis loop never waits for the disk. The thread takes what has
+been queued (up to batch_size shots), groups it by file and opens every file once for all of its values.
+
+    with ResultsWriter('release_and_recapture', 'results/release_and_recapture.h5') as writer:
+        for file_path, frame, shot_globals in PrefetchLoader(files, roi):
+            writer.write(file_path, {'pixel_sum': frame.sum(dtype=np.float64)})
+
+Writing into a shot file changes its modification time, the catalog then describes the file again on the next run.
+'''
+
+import os
+import queue
+import threading
+
+import h5py
+import numpy as np
+
+from green_mot.shots import split_shot_path
+
+# Marks the end of the stream in the queue
+_done = object()
+
+
+def _attribute_value(value):
+    # Value as h5py can store it in an attribute, None when it can not be stored
+    if value is None:
+        return None
+    if isinstance(value, (str, bytes, bool, int, float, np.generic)):
+        return value
+    array = np.asarray(value)
+    return array if array.dtype != object else None
+
+
+def write_shot_results(file_path, analysis, values):
+    # Store values as attributes of results/<analysis> in one shot file, or as columns of a repacked store
+    store_path, index = split_shot_path(file_path)
+    if index is not None:
+        write_store_results(store_path, analysis, {index: values})
+        return
+    with h5py.File(file_path, 'a') as f:
+        group = f.require_group('results').require_group(analysis)
+        for name, value in values.items():
+            value = _attribute_value(value)
+            if value is None:
+                print(f"Warning: result '{name}' of {os.path.basename(file_path)} can not be stored, skipped")
+                continue
+            group.attrs[name] = value
+
+
+def write_store_results(store_path, analysis, values_by_index):
+    # Numeric results of several shots of one store, one (N,) float64 column per result, NaN where not written
+    with h5py.File(store_path, 'a') as f:
+        count = len(f['has_frame'])
+        group = f.require_group('results').require_group(analysis)
+        for index, values in values_by_index.items():
+            for name, value in values.items():
+                if isinstance(value, str):
+                    continue  # text results (e.g. screening reasons) only go into the consolidated table
+                try:
+                    value = float(value)
+                except (TypeError, ValueError):
+                    print(f"Warning: result '{name}' of shot {index} in {store_path} is not a number, skipped")
+                    continue
+                if name not in group:
+                    group.create_dataset(name, data=np.full(count, np.nan))
+                group[name][index] = value
+
+
+def read_shot_results(file_path, analysis):
+    # {name: value} of the results stored for one shot, empty when there are none
+    store_path, index = split_shot_path(file_path)
+    with h5py.File(store_path if index is not None else file_path, 'r') as f:
+        if f'results/{analysis}' not in f:
+            return {}
+        group = f[f'results/{analysis}']
+        if index is not None:
+            return {name: float(dataset[index]) for name, dataset in group.items()}
+        return {name: value.item() if isinstance(value, np.generic) else value for name, value in group.attrs.items()}
+
+
+def _is_missing(value):
+    return value is None or (isinstance(value, (float, np.floating)) and np.isnan(value))
+
+
+def _is_text_column(column):
+    # Strings, possibly with missing values, e.g. a label that some shots do not have
+    texts = [isinstance(v, str) for v in column]
+    return (any(texts) or not texts) and all(text or _is_missing(v) for text, v in zip(texts, column))
+
+
+def write_results_table(table, output_path):
+    '''
+    Write a column table (dict of equal length columns) as one HDF5 file with a dataset per column.
+    Text columns become string datasets, with an empty string where a value is missing (None or NaN). Columns that
+    are neither numbers nor text (e.g. globals) are left out with a warning.
+    '''
+    os.makedirs(os.path.dirname(os.path.abspath(output_path)), exist_ok=True)
+    temporary_path = output_path + '.tmp'
+    with h5py.File(temporary_path, 'w') as f:
+        for name, column in table.items():
+            if _is_text_column(column):
+                f.create_dataset(name, data=['' if _is_missing(v) else v for v in column], dtype=h5py.string_dtype())
+                continue
+            try:
+                data = np.asarray(column, dtype=np.float64)
+            except (TypeError, ValueError):
+                print(f"Warning: column '{name}' is neither numbers nor text, left out of {output_path}")
+                continue
+            f.create_dataset(name, data=data)
+    os.replace(temporary_path, output_path)
+    print(f"Results table saved: {output_path} ({len(table['file_path'])} shots)")
+
+
+def read_results_table(table_path):
+    # Consolidated table back as a dict of columns
+    with h5py.File(table_path, 'r') as f:
+        return {name: [v.decode() for v in dataset[()]] if dataset.dtype.kind == 'O' else dataset[()]
+                for name, dataset in f.items()}
+
+
+class ResultsWriter:
+    '''
+    Queue per shot results and write them into the shot files on a background thread.
+
+    analysis is the name of the results group. table_path, when given, receives the consolidated table of
+    everything written when the writer is closed. batch_size is the number of shots the thread collects before it
+    writes, depth how many shots may wait in the queue before write() blocks. Errors raised while writing are
+    raised again from write() or close().
+    '''
+
+    def __init__(self, analysis, table_path=None, batch_size=32, depth=256):
+        self.analysis = analysis
+        self.table_path = table_path
+        self.batch_size = batch_size
+        self.rows = {}  # file path -> all values written for that shot, for the consolidated table
+        self._queue = queue.Queue(maxsize=depth)
+        self._error = None
+        self._thread = threading.Thread(target=self._write_all, daemon=True)
+        self._thread.start()
+
+    def _write_all(self):
+        finished = False
+        while not finished:
+            batch = [self._queue.get()]
+            # Take whatever else is already waiting, up to batch_size shots
+            while len(batch) < self.batch_size and batch[-1] is not _done:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            if batch[-1] is _done:
+                batch.pop()
+                finished = True
+            if self._error is None and batch:
+                try:
+                    self._write_batch(batch)
+                except Exception as error:  # handed over to the analysis thread
+                    self._error = error
+
+    def _write_batch(self, batch):
+        # One open per file: all values of a shot file together, all shots of a store together
+        by_file = {}
+        by_store = {}
+        for file_path, values in batch:
+            store_path, index = split_shot_path(file_path)
+            if index is not None:
+                by_store.setdefault(store_path, {}).setdefault(index, {}).update(values)
+            else:
+                by_file.setdefault(file_path, {}).update(values)
+        for file_path, values in by_file.items():
+            write_shot_results(file_path, self.analysis, values)
+        for store_path, values_by_index in by_store.items():
+            write_store_results(store_path, self.analysis, values_by_index)
+
+    def _raise_error(self):
+        if self._error is not None:
+            error, self._error = self._error, None
+            raise error
+
+    def write(self, file_path, values):
+        # Queue the results of one shot, returns right away unless the queue is full
+        self._raise_error()
+        if self._thread is None:
+            raise RuntimeError("The results writer is closed")
+        values = dict(values)
+        self.rows.setdefault(file_path, {}).update(values)
+        self._queue.put((file_path, values))
+
+    def write_table(self, table, columns=None):
+        # Queue every row of a results table, columns defaults to all numeric columns
+        if columns is None:
+            columns = [name for name, column in table.items()
+                       if isinstance(column, np.ndarray) and column.dtype.kind in 'biuf']
+        for row, file_path in enumerate(table['file_path']):
+            self.write(file_path, {name: table[name][row] for name in columns})
+
+    def close(self):
+        # Wait until everything is written, then write the consolidated table
+        if self._thread is None:
+            return
+        self._queue.put(_done)
+        self._thread.join()
+        self._thread = None
+        self._raise_error()
+        if self.table_path and self.rows:
+            names = []
+            for values in self.rows.values():
+                names.extend(name for name in values if name not in names)
+            table = {'file_path': list(self.rows)}
+            for name in names:
+                table[name] = [_table_value(values.get(name)) for values in self.rows.values()]
+            write_results_table(table, self.table_path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def _table_value(value):
+    # Numbers stay numbers, anything else that is missing or not a scalar becomes NaN in the table
+    if isinstance(value, (str, bool, int, float, np.generic)):
+        return value
+    return np.nan
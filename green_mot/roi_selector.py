@@ -0,0 +1,222 @@
+'''
+Interactive selection of the cropping region
+
+Instead of editing top, bottom, left, right and running visualize_h5_images_for_cropping.py again for every try,
+select_roi() shows the mean image of a folder and lets you drag the cropping region on it. While dragging, a
+preview of the crop and the integrated counts of every shot under the box follow the mouse.
+
+Everything shown comes from the thumbnail cache (green_mot/thumbnails.py): the mean image is the average of the
+1/4 scale thumbnails of the shots, and the counts are box sums over the summed-area tables of those thumbnails
+(green_mot/integral.py), four lookups per shot. A thumbnail pixel is the mean of a 4 x 4 block, so with the box
+snapped to the block grid the counts are the exact sums over the full resolution crop. Only the preview and the
+counts are redrawn while dragging (matplotlib blitting), a redraw takes a few milliseconds.
+
+Controls:
+    drag              draw a new box, drag its edges or corners to resize it or its centre to move it
+    w                 write the box into the [roi] table of the pipeline file (and print it for the scripts)
+    q                 close
+
+Run from the repository root with
+    green-mot select-roi <folder> [--roi top bottom left right] [--pipeline <pipeline.toml>]
+'''
+
+import os
+import time
+
+import numpy as np
+
+from green_mot.catalog import build_catalog, globals_column
+from green_mot.integral import box_sums, summed_area_tables
+from green_mot.thumbnails import load_thumbnails
+from green_mot.varying import choose_axes
+
+# Pyramid level the selector works on, the box snaps to multiples of it
+factor = 4
+
+
+def load_folder(folder_path, recursive=True):
+    '''
+    Thumbnails of the shots of a folder for the selector: (file paths, (N, h, w) stack of 1/factor scale
+    thumbnails, x values, x axis name). x is the scanned global picked by green_mot.varying, or the shot number.
+    '''
+    catalog = build_catalog(folder_path, recursive=recursive)
+    rows = [i for i, has_frame in enumerate(catalog['has_frame']) if has_frame]
+    thumbnails = load_thumbnails([catalog['file_path'][i] for i in rows], factor)
+    used = [k for k, thumbnail in enumerate(thumbnails) if thumbnail is not None]
+    if not used:
+        raise ValueError(f"No shots with a frame in {folder_path}")
+    rows = [rows[k] for k in used]
+    stack = np.stack([thumbnails[k] for k in used])
+
+    x_name, _ = choose_axes({'globals': [catalog['globals'][i] for i in rows]})
+    if x_name is None:
+        return [catalog['file_path'][i] for i in rows], stack, np.arange(len(rows), dtype=np.float64), 'shot'
+    return [catalog['file_path'][i] for i in rows], stack, globals_column(catalog, x_name)[rows], x_name
+
+
+def snap_roi(extents, frame_shape):
+    # (x0, x1, y0, y1) of the selector in camera pixels -> (top, bottom, left, right) on the thumbnail block grid
+    x0, x1, y0, y1 = extents
+    height, width = frame_shape
+
+    def snap(value, limit):
+        return int(np.clip(round(value / factor), 0, limit // factor)) * factor
+
+    top, bottom = sorted((snap(y0, height), snap(y1, height)))
+    left, right = sorted((snap(x0, width), snap(x1, width)))
+    return top, max(bottom, top + factor), left, max(right, left + factor)
+
+
+class ROISelector:
+    '''
+    The selector window for one folder. roi is the box shown at the start, the middle half of the frame when
+    None. pipeline_path is the pipeline file the w key writes to.
+    '''
+
+    def __init__(self, folder_path, roi=None, pipeline_path=None, recursive=True):
+        import matplotlib.pyplot as plt
+        from matplotlib.widgets import RectangleSelector
+
+        self.folder_path = folder_path
+        self.pipeline_path = pipeline_path
+        self.file_paths, stack, self.x, self.x_name = load_folder(folder_path, recursive)
+        self.mean = stack.mean(axis=0)
+        self.tables = summed_area_tables(stack)
+        self.frame_shape = (stack.shape[1] * factor, stack.shape[2] * factor)
+        self.order = np.argsort(self.x, kind='stable')
+        height, width = self.frame_shape
+        if roi is None:
+            roi = (height // 4, 3 * height // 4, width // 4, 3 * width // 4)
+        self.roi = snap_roi((roi[2], roi[3], roi[0], roi[1]), self.frame_shape)
+
+        self.fig = plt.figure(figsize=(15, 8))
+        grid = self.fig.add_gridspec(2, 2, width_ratios=(2, 1))
+        self.image_ax = self.fig.add_subplot(grid[:, 0])
+        self.preview_ax = self.fig.add_subplot(grid[0, 1])
+        self.counts_ax = self.fig.add_subplot(grid[1, 1])
+
+        low, high = np.percentile(self.mean, (0.5, 99.5))
+        self.image_ax.imshow(self.mean, cmap='gray', vmin=low, vmax=high, extent=(0, width, height, 0))
+        self.image_ax.set_title(f"{os.path.basename(os.path.normpath(folder_path))}: mean of {len(stack)} shots, "
+                                f"drag the cropping region, w writes it")
+
+        # The preview keeps fixed axis limits, so it can be blitted: the crop is placed in the unit square
+        self.preview_ax.set_xlim(0, 1)
+        self.preview_ax.set_ylim(1, 0)
+        self.preview_ax.set_box_aspect(1)
+        self.preview_ax.axis('off')
+        self.preview = self.preview_ax.imshow(np.zeros((1, 1)), cmap='gray', animated=True, aspect='auto')
+
+        self.counts_ax.set_xlabel(self.x_name)
+        self.counts_ax.set_ylabel('Counts in the box')
+        self.counts_ax.grid(True)
+        self.counts_ax.set_xlim(*self._padded(self.x[self.order]))
+        self.counts_ax.set_ylim(0, 1)
+        (self.line,) = self.counts_ax.plot(self.x[self.order], np.zeros(len(self.x)), marker='o', animated=True)
+        self.status = self.counts_ax.text(0.02, 0.95, '', transform=self.counts_ax.transAxes, va='top',
+                                          fontsize=9, animated=True)
+        self.animated = [(self.preview_ax, [self.preview]), (self.counts_ax, [self.line, self.status])]
+        self.backgrounds = None
+
+        self.selector = RectangleSelector(self.image_ax, self._on_select, useblit=True, button=[1],
+                                          minspanx=factor, minspany=factor, spancoords='data', interactive=True,
+                                          props=dict(edgecolor='red', fill=False, linewidth=1.5))
+        self.selector.extents = (self.roi[2], self.roi[3], self.roi[0], self.roi[1])
+        self.fig.canvas.mpl_connect('draw_event', self._on_draw)
+        self.fig.canvas.mpl_connect('motion_notify_event', self._on_move)
+        self.fig.canvas.mpl_connect('key_press_event', self._on_key)
+        self._update_artists()
+        self.fig.tight_layout()
+
+    @staticmethod
+    def _padded(values):
+        low, high = float(np.nanmin(values)), float(np.nanmax(values))
+        pad = 0.05 * (high - low) or 0.5
+        return low - pad, high + pad
+
+    def counts(self, roi=None):
+        # Integrated counts of every shot under roi (the current box by default), in file order
+        top, bottom, left, right = self.roi if roi is None else roi
+        return box_sums(self.tables, (top // factor, bottom // factor, left // factor, right // factor)) * factor ** 2
+
+    def _update_artists(self):
+        # Preview image, counts line and status text for the current box, returns True when the counts went above
+        # the y range of the plot and the whole figure has to be drawn again
+        top, bottom, left, right = self.roi
+        crop = self.mean[top // factor:bottom // factor, left // factor:right // factor]
+        self.preview.set_data(crop)
+        low, high = np.percentile(crop, (0.5, 99.5))
+        self.preview.set_clim(low, high if high > low else low + 1)
+        scale = 1 / max(crop.shape)
+        x0 = (1 - crop.shape[1] * scale) / 2
+        y0 = (1 - crop.shape[0] * scale) / 2
+        self.preview.set_extent((x0, 1 - x0, 1 - y0, y0))
+
+        counts = self.counts()
+        self.line.set_ydata(counts[self.order])
+        self.status.set_text(f"top={top}, bottom={bottom}, left={left}, right={right}\n"
+                             f"mean counts {counts.mean():.4g}, {len(counts)} shots")
+        # The y range starts at zero and only grows, with some room, so most boxes need no full redraw
+        if counts.max() > self.counts_ax.get_ylim()[1]:
+            self.counts_ax.set_ylim(0, 1.5 * counts.max())
+            return True
+        return False
+
+    def _on_draw(self, event):
+        # A full draw (start, resize, new y range): keep the axes without the animated artists for blitting
+        canvas = self.fig.canvas
+        self.backgrounds = [canvas.copy_from_bbox(ax.bbox) for ax, _ in self.animated]
+        for ax, artists in self.animated:
+            for artist in artists:
+                ax.draw_artist(artist)
+
+    def redraw(self, roi):
+        # Show a new box, only the preview and the counts axes are redrawn. Returns the time it took in ms
+        start = time.perf_counter()
+        self.roi = roi
+        canvas = self.fig.canvas
+        if self._update_artists() or self.backgrounds is None:
+            canvas.draw_idle()
+        else:
+            for background, (ax, artists) in zip(self.backgrounds, self.animated):
+                canvas.restore_region(background)
+                for artist in artists:
+                    ax.draw_artist(artist)
+                canvas.blit(ax.bbox)
+        return (time.perf_counter() - start) * 1e3
+
+    def _on_move(self, event):
+        # While the box is being dragged
+        if event.button != 1 or event.inaxes is not self.image_ax:
+            return
+        roi = snap_roi(self.selector.extents, self.frame_shape)
+        if roi != self.roi:
+            self.redraw(roi)
+
+    def _on_select(self, press, release):
+        roi = snap_roi(self.selector.extents, self.frame_shape)
+        if roi != self.roi:
+            self.redraw(roi)
+
+    def _on_key(self, event):
+        if event.key == 'w':
+            self.write()
+
+    def write(self):
+        top, bottom, left, right = self.roi
+        print(f"top = {top}\nbottom = {bottom}\nleft = {left}\nright = {right}")
+        if self.pipeline_path:
+            from green_mot.pipeline import save_roi
+
+            save_roi(self.pipeline_path, self.roi)
+
+    def show(self):
+        import matplotlib.pyplot as plt
+
+        plt.show()
+        return self.roi
+
+
+def select_roi(folder_path, roi=None, pipeline_path=None, recursive=True):
+    # Open the selector and return the box it had when the window was closed
+    return ROISelector(folder_path, roi, pipeline_path, recursive).show()
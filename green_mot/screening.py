@@ -0,0 +1,180 @@
+'''
+Screening shots before the expensive analysis
+
+Cheap checks on the catalog and on the cached thumbnails and histograms, so that empty datasets, missing globals,
+saturated frames and shots taken with a wrong T_WAIT are caught before fitting and rendering instead of being
+skipped with a printed warning or silently added to the sums.
+
+screen_shots() adds these columns to the catalog table:
+    saturated_fraction -> fraction of pixels at or above the saturation level (full frame, from the cached
+                          histogram, some setups always have a small saturated stray light spot, hence the loose
+                          default), see saturation_levels()
+    total_counts       -> sum of all pixel values of the full frame
+    signal_counts      -> counts above the background inside the roi, from the 1/16 thumbnails (nan if no background)
+    reasons            -> all problems found for the shot, joined with '; ', empty for a clean shot
+    usable             -> False if one of the reasons is in exclude
+
+T_WAIT is only required (and checked for outliers) in folders where at least one shot records it, days like
+20250110 and 20250113 that do not scan the wait time are not screened out for missing it. screen_folder() screens
+the shots of a folder for the scripts and prints the ones it leaves out.
+'''
+
+import re
+
+import numpy as np
+
+from green_mot.catalog import build_catalog, globals_column, num_rows, select
+from green_mot.thumbnails import load_histogram, load_pyramid, pyramid_factors
+
+# Reasons that take a shot out of the analysis by default. 'no signal' is only reported, late T_WAIT shots of a
+# lifetime measurement are expected to have no atoms left and must stay in the data.
+default_exclude = ('unreadable', 'no frame', 'no globals', 'missing global', 'saturated', 't_wait outlier')
+
+
+def t_wait_outliers(t_wait, outlier_factor=5.0):
+    '''
+    Flag wait times that do not belong to the scan: not finite, negative, or further away from every other
+    wait time than outlier_factor times the typical step of the scan.
+    '''
+    bad = ~np.isfinite(t_wait) | (t_wait < 0)
+    valid = np.flatnonzero(~bad)
+    values = np.unique(t_wait[valid])
+    if len(values) < 3:
+        return bad
+
+    steps = np.diff(values)
+    typical_step = np.median(steps)
+    # Distance of each distinct wait time to its closest neighbour in the scan
+    gap_before = np.concatenate(([np.inf], steps))
+    gap_after = np.concatenate((steps, [np.inf]))
+    isolated = values[np.minimum(gap_before, gap_after) > outlier_factor * typical_step]
+    bad[valid] |= np.isin(t_wait[valid], isolated)
+    return bad
+
+
+def saturation_levels(catalog):
+    '''
+    Largest pixel value of every shot, taken from the bit depth of the camera's pixel format the shot records
+    ('Mono8' -> 255, 'Mono12' -> 4095). The frames are stored as uint16 whatever the camera gives, so the frame
+    dtype says nothing about it. Shots without a pixel format fall back to the largest value of their frame dtype,
+    which misses the saturation of a camera with fewer bits than the dtype, so they are reported.
+    '''
+    levels = np.full(num_rows(catalog), np.nan)
+    unknown = 0
+    for i, (pixel_format, frame_dtype) in enumerate(zip(catalog['pixel_format'], catalog['frame_dtype'])):
+        bits = re.search(r'\d+', pixel_format) if pixel_format else None
+        if bits:
+            levels[i] = 2 ** int(bits.group()) - 1
+        elif frame_dtype is not None and np.issubdtype(np.dtype(frame_dtype), np.integer):
+            levels[i] = np.iinfo(np.dtype(frame_dtype)).max
+            unknown += 1
+    if unknown:
+        print(f"Warning: {unknown} shots do not record the camera pixel format, saturation is checked at the "
+              f"largest value of their frame dtype, pass saturation_level to set it")
+    return levels
+
+
+def screen_shots(catalog, required_globals=None, saturation_level=None, max_saturated_fraction=0.05,
+                 background_thumbnail=None, roi=None, min_signal_counts=0.0, t_wait_outlier_factor=5.0,
+                 exclude=default_exclude):
+    '''
+    Return a copy of the catalog table with the screening columns added (see the module docstring).
+
+    background_thumbnail is a 1/16 scale background image (thumbnails.mean_thumbnail of the background shots),
+    roi the usual (top, bottom, left, right) in full frame pixels. Without a background the signal check is skipped.
+    saturation_level defaults to the top of the camera's pixel format of every shot, see saturation_levels().
+    required_globals defaults to T_WAIT when some shot of the catalog records it, else nothing.
+    '''
+    n = num_rows(catalog)
+    if required_globals is None:
+        required_globals = ('T_WAIT',) if any('T_WAIT' in g for g in catalog['globals']) else ()
+    reasons = [[] for _ in range(n)]
+    if saturation_level is None:
+        levels = saturation_levels(catalog)
+    else:
+        levels = np.full(n, float(saturation_level))
+    saturated_fraction = np.full(n, np.nan)
+    total_counts = np.full(n, np.nan)
+    signal_counts = np.full(n, np.nan)
+
+    factor = pyramid_factors[-1]
+    if roi is not None:
+        top, bottom, left, right = roi
+        small_roi = (slice(top // factor, -(-bottom // factor)), slice(left // factor, -(-right // factor)))
+    else:
+        small_roi = (slice(None), slice(None))
+
+    for i in range(n):
+        if catalog['error'][i] is not None:
+            reasons[i].append('unreadable')
+            continue
+        if not catalog['has_globals'][i]:
+            reasons[i].append('no globals')
+        else:
+            missing = [name for name in required_globals if name not in catalog['globals'][i]]
+            if missing:
+                reasons[i].append(f"missing global {', '.join(missing)}")
+        if not catalog['has_frame'][i]:
+            reasons[i].append('no frame')
+            continue
+
+        histogram = load_histogram(catalog['file_path'][i])
+        if histogram is not None and len(histogram):
+            total_counts[i] = float(np.dot(histogram, np.arange(len(histogram), dtype=np.float64)))
+            if np.isfinite(levels[i]):
+                saturated_fraction[i] = histogram[int(levels[i]):].sum() / histogram.sum()
+                if saturated_fraction[i] > max_saturated_fraction:
+                    reasons[i].append(f"saturated ({saturated_fraction[i]:.2%} of pixels)")
+
+        if background_thumbnail is not None:
+            thumbnail = load_pyramid(catalog['file_path'][i])[factor]
+            difference = thumbnail[small_roi] - background_thumbnail[small_roi]
+            # Every thumbnail pixel is the mean of factor x factor frame pixels
+            signal_counts[i] = float(difference.sum()) * factor * factor
+            if signal_counts[i] <= min_signal_counts:
+                reasons[i].append('no signal above background')
+
+    if 'T_WAIT' in required_globals:
+        has_t_wait = np.array(['T_WAIT' in g for g in catalog['globals']], dtype=bool)
+        t_wait = globals_column(catalog, 'T_WAIT')
+        outliers = t_wait_outliers(np.where(has_t_wait, t_wait, 0.0), t_wait_outlier_factor) & has_t_wait
+        for i in np.flatnonzero(outliers):
+            reasons[i].append(f"t_wait outlier ({t_wait[i]:g} s)")
+
+    usable = np.array([not any(reason.startswith(prefix) for reason in shot_reasons for prefix in exclude)
+                       for shot_reasons in reasons], dtype=bool)
+
+    screened = dict(catalog)
+    screened['saturated_fraction'] = saturated_fraction
+    screened['total_counts'] = total_counts
+    screened['signal_counts'] = signal_counts
+    screened['reasons'] = ['; '.join(shot_reasons) for shot_reasons in reasons]
+    screened['usable'] = usable
+    return screened
+
+
+def usable_shots(screened):
+    # Only the rows that passed the screening
+    return select(screened, screened['usable'])
+
+
+def screen_folder(folder_path, recursive=False, **options):
+    '''
+    Screen every shot of a folder (options go to screen_shots) and print the shots that are left out.
+    Returns {file_path: (usable, reasons)}.
+    '''
+    screened = screen_shots(build_catalog(folder_path, recursive=recursive), **options)
+    results = {}
+    for file_path, usable, reasons in zip(screened['file_path'], screened['usable'], screened['reasons']):
+        if not usable:
+            print(f"Warning: {file_path} left out: {reasons}")
+        results[file_path] = (bool(usable), reasons)
+    return results
+
+
+def print_screening_report(screened):
+    bad = np.flatnonzero(np.array([bool(r) for r in screened['reasons']]))
+    print(f"Screened {num_rows(screened)} shots, {int(screened['usable'].sum())} usable")
+    for i in bad:
+        status = 'kept' if screened['usable'][i] else 'excluded'
+        print(f"  {status}: {screened['file_path'][i]} -> {screened['reasons'][i]}")
@@ -0,0 +1,264 @@
+'''
+Long running analysis service
+
+Every tool is a script that imports cv2, h5py and matplotlib, walks the folder and decodes every frame again each
+time a crop number changes. The service does that work once and keeps the results in memory: shot catalogs, the
+decoded frames of every folder that was asked for. A new crop is then a slice of frames that are already in memory.
+The background is subtracted with the strategies of the pipeline (green_mot/pipeline.py), by default "paired" like
+release_and_recapture_green_mot.py: shot i minus the sum of shot i of every background folder.
+
+Memory is bounded, the least recently used entries are dropped once the cache holds more than max_bytes. Entries
+remember the catalog they were built from and are rebuilt when a shot file in the folder changes. Requests for the
+same folder that arrive together wait for one another, the frames are decoded once.
+
+Start it with
+    python -m green_mot.service [port]
+and talk to it over HTTP with JSON, e.g. from another script or a lyse analysis file:
+    from green_mot.service import request
+    result = request('pixel_sums', {'folder': 'data/20250114_release_and_recapture_greenMOT/recaptured MOT',
+                                    'roi': [400, 850, 910, 1350],
+                                    'background_folders': ['data/20250114_release_and_recapture_greenMOT/backgrounds1']})
+
+Endpoints (POST, JSON body):
+    catalog     {folder}                              -> file paths, T_WAIT and screening reasons of the shots
+    pixel_sums  {folder, roi, background_folders,     -> float64 pixel sums of the background subtracted crops,
+                 background}                             background is a [background] table of a pipeline file,
+                                                         {"strategy": "paired"} by default
+    video       {folders, roi, output, normalization} -> renders a (comparison) video, see green_mot/compare.py,
+                                                         output is a path inside results/
+    status      {}                                    -> what is in the cache
+    clear       {}                                    -> empties the cache
+'''
+
+import json
+import os
+import threading
+import urllib.error
+import urllib.request
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+
+from green_mot.catalog import build_catalog, globals_column
+from green_mot.shots import base_directory, read_frame
+
+default_port = 8765
+default_max_bytes = 2 * 1024 ** 3
+
+# The service only writes below this directory
+results_directory = os.path.join(base_directory, 'results')
+
+
+class LRUCache:
+    '''
+    Dict like cache that drops the least recently used entries once the stored arrays exceed max_bytes.
+    Every entry carries a signature, get() only returns it if the signature still matches.
+    '''
+
+    def __init__(self, max_bytes=default_max_bytes):
+        self.max_bytes = max_bytes
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, signature):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] != signature:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key, signature, value, size):
+        with self._lock:
+            if key in self._entries:
+                self.total_bytes -= self._entries.pop(key)[2]
+            self._entries[key] = (signature, value, size)
+            self.total_bytes += size
+            # Never drop the entry that was just added, even if it alone is larger than the limit
+            while self.total_bytes > self.max_bytes and len(self._entries) > 1:
+                _, (_, _, dropped_size) = self._entries.popitem(last=False)
+                self.total_bytes -= dropped_size
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.total_bytes = 0
+
+    def describe(self):
+        with self._lock:
+            return {'entries': [list(key) for key in self._entries], 'bytes': self.total_bytes,
+                    'max_bytes': self.max_bytes, 'hits': self.hits, 'misses': self.misses}
+
+
+class AnalysisState:
+    # Everything the service keeps between requests
+
+    def __init__(self, max_bytes=default_max_bytes):
+        self.cache = LRUCache(max_bytes)
+        self._folder_locks = {}
+        self._locks_lock = threading.Lock()
+
+    def _folder_lock(self, key):
+        # One lock per folder, so two requests for the same folder do not decode it twice
+        with self._locks_lock:
+            return self._folder_locks.setdefault(key, threading.Lock())
+
+    def catalog(self, folder):
+        catalog = build_catalog(folder, recursive=True)
+        signature = (tuple(catalog['file_path']), tuple(catalog['mtime']), tuple(catalog['size']))
+        return catalog, signature
+
+    def frames(self, folder):
+        '''
+        Full frames of every shot in a folder as one (N, H, W) stack, so that any crop is a slice.
+        Returns (catalog, (file paths, positions, stack)), positions are the rows of the shots in the catalog.
+        '''
+        key = ('frames', os.path.abspath(folder))
+        with self._folder_lock(key):
+            catalog, signature = self.catalog(folder)
+            cached = self.cache.get(key, signature)
+            if cached is not None:
+                return catalog, cached
+
+            paths, positions, frames = [], [], []
+            for position, (file_path, has_frame) in enumerate(zip(catalog['file_path'], catalog['has_frame'])):
+                if not has_frame:
+                    continue
+                frame = read_frame(file_path)
+                if frame is None:
+                    continue
+                paths.append(file_path)
+                positions.append(position)
+                frames.append(frame)
+            stack = np.stack(frames) if frames else np.zeros((0, 0, 0), dtype=np.uint16)
+            self.cache.put(key, signature, (paths, positions, stack), stack.nbytes)
+            return catalog, (paths, positions, stack)
+
+    def handle_catalog(self, folder):
+        from green_mot.screening import screen_shots
+
+        catalog, _ = self.catalog(folder)
+        screened = screen_shots(catalog)
+        t_wait = globals_column(catalog, 'T_WAIT')
+        return {'file_path': catalog['file_path'], 't_wait': [None if np.isnan(t) else t for t in t_wait],
+                'usable': screened['usable'].tolist(), 'reasons': screened['reasons']}
+
+    def handle_pixel_sums(self, folder, roi, background_folders=(), background=None):
+        from green_mot.pipeline import background_strategies, pair_shots
+
+        top, bottom, left, right = roi
+        config = dict(background or {'strategy': 'paired' if background_folders else 'none'})
+        config['folders'] = list(background_folders)
+        strategy = config.get('strategy', 'none')
+        if strategy not in background_strategies:
+            raise ValueError(f"Unknown background strategy '{strategy}', available: {', '.join(background_strategies)}")
+
+        catalog, (paths, positions, stack) = self.frames(folder)
+        loaded = {'position': positions, 'stack': stack[:, top:bottom, left:right]}
+        backgrounds = []
+        for background_folder in background_folders:
+            _, (_, background_positions, background_stack) = self.frames(background_folder)
+            backgrounds.append({'position': background_positions,
+                                'stack': background_stack[:, top:bottom, left:right]})
+        rows = list(range(len(paths)))
+        if strategy == 'paired':
+            rows, backgrounds = pair_shots(loaded, backgrounds)
+        crops = background_strategies[strategy](loaded['stack'][rows], backgrounds, config, tuple(roi))
+        sums = crops.sum(axis=(1, 2), dtype=np.float64)
+
+        paths = [paths[k] for k in rows]
+        t_wait_by_path = dict(zip(catalog['file_path'], globals_column(catalog, 'T_WAIT')))
+        t_wait = [t_wait_by_path[p] for p in paths]
+        return {'file_path': paths, 't_wait': [None if np.isnan(t) else float(t) for t in t_wait],
+                'pixel_sum': sums.tolist()}
+
+    def handle_video(self, folders, roi, output, normalization='global'):
+        from green_mot.compare import iter_comparison_frames, write_comparison_video
+
+        output = results_path(output)
+        os.makedirs(os.path.dirname(output), exist_ok=True)
+        frames = iter_comparison_frames(folders, tuple(roi), normalization=normalization)
+        count = write_comparison_video(frames, output)
+        return {'output': output, 'time_steps': count}
+
+
+def results_path(path):
+    # Absolute path of an output file, relative paths are taken inside results/, anything outside it is refused
+    path = os.path.realpath(os.path.join(results_directory, path))
+    if os.path.commonpath([path, os.path.realpath(results_directory)]) != os.path.realpath(results_directory):
+        raise ValueError(f"Output paths must be inside {results_directory}")
+    return path
+
+
+def make_handler(state):
+
+    class Handler(BaseHTTPRequestHandler):
+
+        def do_POST(self):
+            endpoint = self.path.strip('/')
+            length = int(self.headers.get('Content-Length', 0))
+            try:
+                payload = json.loads(self.rfile.read(length) or b'{}')
+                if endpoint == 'status':
+                    result = state.cache.describe()
+                elif endpoint == 'clear':
+                    state.cache.clear()
+                    result = {}
+                elif endpoint in ('catalog', 'pixel_sums', 'video'):
+                    result = getattr(state, f"handle_{endpoint}")(**payload)
+                else:
+                    self._reply(404, {'error': f"Unknown endpoint '{endpoint}'"})
+                    return
+            except Exception as error:
+                self._reply(500, {'error': f"{type(error).__name__}: {error}"})
+                return
+            self._reply(200, result)
+
+        def _reply(self, code, body):
+            data = json.dumps(body).encode()
+            self.send_response(code)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def log_message(self, format, *args):
+            print(f"[service] {self.address_string()} {format % args}")
+
+    return Handler
+
+
+def serve(port=default_port, max_bytes=default_max_bytes):
+    # Only listens on localhost, the service has no authentication
+    server = ThreadingHTTPServer(('127.0.0.1', port), make_handler(AnalysisState(max_bytes)))
+    print(f"Analysis service listening on http://127.0.0.1:{port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+def request(endpoint, payload=None, port=default_port, timeout=600):
+    # Call the service and return the decoded JSON answer, raises RuntimeError with the service's error message
+    data = json.dumps(payload or {}).encode()
+    http_request = urllib.request.Request(f"http://127.0.0.1:{port}/{endpoint}", data=data,
+                                          headers={'Content-Type': 'application/json'})
+    try:
+        with urllib.request.urlopen(http_request, timeout=timeout) as response:
+            return json.loads(response.read())
+    except urllib.error.HTTPError as error:
+        raise RuntimeError(json.loads(error.read()).get('error', str(error))) from None
+
+
+if __name__ == '__main__':
+    import sys
+
+    serve(int(sys.argv[1]) if len(sys.argv) > 1 else default_port)
@@ -0,0 +1,288 @@
+'''
+Reading shot files written by labscript
+
+Every shot is one h5 file. The camera frame lives under images/cam1/after ramp/frame and the globals of the
+shot are stored as attributes of the globals group.
+
+A folder that was repacked into one store file (green_mot/repack.py) can be used in place of the folder:
+list_shot_files() of the store returns one path per shot in the form "<store file>::<index>", and read_frame() /
+read_globals() accept those paths like normal shot files.
+'''
+
+import json
+import os
+import re
+
+# h5py and numpy are imported in the functions that need them: listing the shots of a folder from its cached
+# catalog (green-mot list, see green_mot/cli.py) then starts without loading either of them
+
+# Dataset path inside the .h5 file
+dataset_path = 'images/cam1/after ramp/frame'
+# Group of the camera that took the frame, its attributes hold the camera settings of the shot
+camera_path = dataset_path.rsplit('/', 2)[0]
+
+# Repository root, data folder and the folder where intermediate results are cached
+base_directory = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+data_directory = os.path.join(base_directory, 'data')
+cache_directory = os.path.join(base_directory, 'cache')
+
+# Separates the store file from the shot index in the path of a shot inside a repacked store
+store_separator = '::'
+
+
+def natural_sort_key(s):
+    # Sort "..._2.h5" before "..._10.h5"
+    return [int(text) if text.isdigit() else text for text in re.split(r'(\d+)', s)]
+
+
+def is_repacked_store(path):
+    # True for a single file written by green_mot/repack.py
+    if not os.path.isfile(path):
+        return False
+    import h5py
+
+    try:
+        with h5py.File(path, 'r') as f:
+            return 'green_mot_store' in f.attrs
+    except OSError:
+        return False
+
+
+def split_shot_path(shot_path):
+    # "<store>::<index>" -> (store, index), a normal shot file -> (file, None)
+    file_path, separator, index = shot_path.rpartition(store_separator)
+    if not separator or not index.isdigit():
+        return shot_path, None
+    return file_path, int(index)
+
+
+def shot_stat(shot_path):
+    # os.stat of the file that holds the shot, used to notice when a shot changed
+    return os.stat(split_shot_path(shot_path)[0])
+
+
+def list_shot_files(folder_path, recursive=False):
+    '''
+    Return the paths of all .h5 files in a folder, sorted numerically.
+    With recursive=True the subfolders are included too (the 20250110 and 20250113 data have one shot per subfolder).
+    folder_path can also be a repacked store, then the "<store>::<index>" path of every shot is returned.
+    '''
+    if not os.path.exists(folder_path):
+        raise FileNotFoundError(f"The folder does not exist: {folder_path}")
+
+    if is_repacked_store(folder_path):
+        import h5py
+
+        with h5py.File(folder_path, 'r') as f:
+            count = f['frames'].shape[0]
+        return [f"{folder_path}{store_separator}{i}" for i in range(count)]
+
+    if not recursive:
+        files = [os.path.join(folder_path, f) for f in os.listdir(folder_path) if f.endswith('.h5')]
+    else:
+        files = []
+        for root, _, names in os.walk(folder_path):
+            files.extend(os.path.join(root, f) for f in names if f.endswith('.h5'))
+
+    return sorted(files, key=lambda p: natural_sort_key(os.path.relpath(p, folder_path)))
+
+
+def shot_folders(folder_path):
+    '''
+    (name, path) of the subfolders of a day folder, sorted numerically, for the scripts that take one experiment
+    per subfolder. A repacked store in the folder counts as a subfolder named after the file without .h5, so a day
+    whose subfolders were repacked one by one (green_mot/repack.py) reads the same way.
+    '''
+    entries = []
+    for name in os.listdir(folder_path):
+        path = os.path.join(folder_path, name)
+        if os.path.isdir(path):
+            entries.append((name, path))
+        elif name.endswith('.h5') and is_repacked_store(path):
+            entries.append((name[:-len('.h5')], path))
+    return sorted(entries, key=lambda entry: natural_sort_key(entry[0]))
+
+
+def crop(frame, roi):
+    # roi is (top, bottom, left, right), the same four numbers the scripts define at the top
+    if roi is None:
+        return frame
+    top, bottom, left, right = roi
+    if top >= bottom or left >= right:
+        raise ValueError(f"Invalid cropping region: top={top}, bottom={bottom}, left={left}, right={right}")
+    return frame[top:bottom, left:right]
+
+
+def read_frame(file_path, roi=None):
+    '''
+    Load the camera frame of one shot, cropped to roi if given.
+    Returns None when the dataset is missing or empty, the same cases the scripts skip with a warning.
+    For contiguous uncompressed datasets the result is a read-only view into a memory map of the file.
+    '''
+    import h5py
+
+    store_path, index = split_shot_path(file_path)
+    if index is not None:
+        return _read_store_frame(store_path, index, roi)
+
+    with h5py.File(file_path, 'r') as f:
+        if dataset_path not in f:
+            print(f"Warning: Dataset path '{dataset_path}' not found in {os.path.basename(file_path)}.")
+            return None
+        dataset = f[dataset_path]
+        if dataset.size == 0:
+            print(f"Warning: Dataset in {os.path.basename(file_path)} is empty.")
+            return None
+        return _read_dataset(dataset, roi)
+
+
+def memmap_dataset(dataset):
+    '''
+    numpy.memmap view of an h5py dataset that is stored contiguous and uncompressed, None for any other layout.
+
+    Slicing the view only touches the pages of the file that hold the slice, and processes that map the same file
+    share them through the page cache instead of each copying the data through h5py.
+    '''
+    import numpy as np
+
+    if dataset.chunks is not None or dataset.compression is not None or dataset.dtype.hasobject:
+        return None
+    if dataset.file.driver not in ('sec2', 'stdio'):
+        return None
+    offset = dataset.id.get_offset()
+    if offset is None:
+        # Space for the dataset was never allocated (nothing written yet)
+        return None
+    return np.memmap(dataset.file.filename, dtype=dataset.dtype, mode='r', offset=offset, shape=dataset.shape)
+
+
+def _read_dataset(dataset, roi, index=None):
+    # Slicing the dataset directly only decodes the chunks that overlap the crop, index picks a frame of a store
+    if roi is not None:
+        top, bottom, left, right = roi
+        if top >= bottom or left >= right:
+            raise ValueError(f"Invalid cropping region: top={top}, bottom={bottom}, left={left}, right={right}")
+
+    # Contiguous uncompressed frames are read through a memory map instead of h5py's buffers
+    source = memmap_dataset(dataset)
+    if source is None:
+        source = dataset
+
+    if roi is None:
+        return source[()] if index is None else source[index]
+    if index is None:
+        return source[top:bottom, left:right]
+    return source[index, top:bottom, left:right]
+
+
+def _read_store_frame(store_path, index, roi):
+    import h5py
+
+    with h5py.File(store_path, 'r') as f:
+        if not f['has_frame'][index]:
+            print(f"Warning: Shot {index} in {os.path.basename(store_path)} has no frame.")
+            return None
+        return _read_dataset(f['frames'], roi, index)
+
+
+def read_globals(file_path):
+    # All labscript globals of a shot as a plain dict, empty if the globals group is missing
+    import h5py
+
+    store_path, index = split_shot_path(file_path)
+    if index is not None:
+        return read_store_globals(store_path)[index]
+
+    with h5py.File(file_path, 'r') as f:
+        if 'globals' not in f:
+            return {}
+        return {key: _to_python(value) for key, value in f['globals'].attrs.items()}
+
+
+# Globals of a store are read once per store file and kept, keyed by path and modification time
+_store_globals_cache = {}
+
+
+def read_store_globals(store_path):
+    '''
+    Globals of every shot in a repacked store as a list of dicts.
+    The store keeps them as one column per global, see green_mot/repack.py.
+    '''
+    import h5py
+    import numpy as np
+
+    stat = os.stat(store_path)
+    key = (os.path.abspath(store_path), stat.st_mtime_ns)
+    if key in _store_globals_cache:
+        return _store_globals_cache[key]
+
+    with h5py.File(store_path, 'r') as f:
+        count = f['frames'].shape[0]
+        shots = [{} for _ in range(count)]
+        for name, column in f['globals'].items():
+            values = column[()]
+            present = f['globals_present'][name][()]
+            kind = column.attrs.get('kind', 'float')
+            for i in np.flatnonzero(present):
+                value = values[i]
+                if kind == 'bool':
+                    value = bool(value)
+                elif kind == 'int':
+                    value = int(value)
+                elif kind == 'array':
+                    value = json.loads(value.decode() if isinstance(value, bytes) else value)
+                elif kind == 'str':
+                    value = value.decode() if isinstance(value, bytes) else str(value)
+                else:
+                    value = float(value)
+                shots[i][name] = value
+
+    _store_globals_cache.clear()
+    _store_globals_cache[key] = shots
+    return shots
+
+
+def read_pixel_format(f):
+    # Pixel format of the camera (e.g. 'Mono8') from an open shot file, None if the shot does not record it
+    text = _to_python(f[camera_path].attrs.get('Image Format Control')) if camera_path in f else None
+    if not isinstance(text, str) or '{' not in text:
+        return None
+    # Stored as 'Content-Type: application/json {...}'
+    try:
+        return json.loads(text[text.index('{'):]).get('Pixel Format')
+    except ValueError:
+        return None
+
+
+def _to_python(value):
+    # h5py hands back numpy scalars and bytes, convert them so they can be stored in json and compared easily
+    import numpy as np
+
+    if isinstance(value, bytes):
+        return value.decode()
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    return value
+
+
+def load_roi_stack(file_paths, roi):
+    '''
+    Read the cropped frames of several shots into one (N, H, W) array.
+    Shots without a frame are left out, the second return value lists the paths that were used.
+    '''
+    import numpy as np
+
+    frames = []
+    used_paths = []
+    for file_path in file_paths:
+        frame = read_frame(file_path, roi)
+        if frame is None:
+            continue
+        frames.append(frame)
+        used_paths.append(file_path)
+
+    if not frames:
+        return None, used_paths
+    return np.stack(frames), used_paths
@@ -0,0 +1,121 @@
+'''
+Thumbnail pyramid for browsing folders with many shots
+
+For every shot the full frame is reduced to 1/4 and 1/16 scale by averaging blocks of pixels, and the result is
+cached as an .npz file in the cache folder together with a histogram of the full frame. Browsing a day folder
+after the first pass only reads these small files, the full resolution frame is only loaded when someone zooms
+into a shot. The cache files are named by the content hash of the shot (green_mot/catalog.py), so copies of a shot
+in other folders share one entry and a rewritten shot gets a new one.
+'''
+
+import hashlib
+import os
+
+import numpy as np
+
+from green_mot.catalog import content_hash
+from green_mot.shots import cache_directory, read_frame, shot_stat
+
+# Downsampling factors of the pyramid levels, 1 is the full frame
+pyramid_factors = (4, 16)
+
+thumbnail_directory = os.path.join(cache_directory, 'thumbnails')
+
+
+def downsample(frame, factor):
+    # Average factor x factor blocks, edge pixels that do not fill a whole block are dropped
+    height = frame.shape[0] // factor * factor
+    width = frame.shape[1] // factor * factor
+    blocks = frame[:height, :width].reshape(height // factor, factor, width // factor, factor)
+    return blocks.mean(axis=(1, 3), dtype=np.float32)
+
+
+def build_pyramid(frame, factors=pyramid_factors):
+    '''
+    Return {factor: downsampled frame} for each factor.
+    Each level is computed from the previous one, so the full frame is only read once.
+    '''
+    pyramid = {}
+    level = frame
+    level_factor = 1
+    for factor in sorted(factors):
+        if factor % level_factor != 0:
+            level = frame
+            level_factor = 1
+        level = downsample(level, factor // level_factor)
+        level_factor = factor
+        pyramid[factor] = level
+    return pyramid
+
+
+def thumbnail_key(file_path):
+    # Same for every copy of a shot, changes when the frame or the globals change. A file the catalog could not
+    # read has no content hash and is keyed by its path and modification time
+    digest = content_hash(file_path)
+    if digest is None:
+        stat = shot_stat(file_path)
+        digest = hashlib.sha1(f"{os.path.abspath(file_path)}|{stat.st_mtime_ns}|{stat.st_size}".encode()).hexdigest()
+    return digest
+
+
+def _load_cached(file_path, factors):
+    # The cached arrays of a shot: one entry per pyramid level plus the full frame histogram
+    cache_path = os.path.join(thumbnail_directory, f"{thumbnail_key(file_path)}.npz")
+    names = [f"level_{factor}" for factor in factors] + ['histogram']
+    if os.path.exists(cache_path):
+        with np.load(cache_path) as cached:
+            if all(name in cached for name in names):
+                return {name: cached[name] for name in names}
+
+    frame = read_frame(file_path)
+    if frame is None:
+        return None
+
+    arrays = {f"level_{factor}": level for factor, level in build_pyramid(frame, factors).items()}
+    # Counts of every pixel value of the full frame, small for the 8 bit data in the uint16 frames, and
+    # enough to get the saturated fraction and total counts without decoding the frame again
+    if np.issubdtype(frame.dtype, np.unsignedinteger):
+        arrays['histogram'] = np.bincount(frame.ravel()).astype(np.int64)
+    else:
+        arrays['histogram'] = np.zeros(0, dtype=np.int64)
+    os.makedirs(thumbnail_directory, exist_ok=True)
+
+    # Write to a temporary name first so an interrupted run never leaves a broken cache file behind
+    temporary_path = cache_path + '.tmp.npz'
+    np.savez(temporary_path, **arrays)
+    os.replace(temporary_path, cache_path)
+    return arrays
+
+
+def load_pyramid(file_path, factors=pyramid_factors):
+    '''
+    Return the cached pyramid of a shot as {factor: image}, building and caching it first if needed.
+    Returns None when the shot has no frame.
+    '''
+    arrays = _load_cached(file_path, factors)
+    if arrays is None:
+        return None
+    return {factor: arrays[f"level_{factor}"] for factor in factors}
+
+
+def load_histogram(file_path):
+    # Pixel value counts of the full frame (index = pixel value), None when the shot has no frame
+    arrays = _load_cached(file_path, pyramid_factors)
+    return None if arrays is None else arrays['histogram']
+
+
+def load_thumbnails(file_paths, factor=pyramid_factors[-1]):
+    # One pyramid level for several shots, None for shots without a frame
+    thumbnails = []
+    for file_path in file_paths:
+        pyramid = load_pyramid(file_path)
+        thumbnails.append(None if pyramid is None else pyramid[factor])
+    return thumbnails
+
+
+def mean_thumbnail(file_paths, factor=pyramid_factors[-1]):
+    # Average of one pyramid level over several shots, e.g. a cheap background estimate from the background folder
+    thumbnails = [t for t in load_thumbnails(file_paths, factor) if t is not None]
+    if not thumbnails:
+        return None
+    return np.mean(thumbnails, axis=0, dtype=np.float32)
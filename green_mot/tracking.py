@@ -0,0 +1,194 @@
+'''
+Where the cloud goes: centroid and shape of every shot
+
+moments() takes an (N, H, W) stack and returns the intensity weighted centroid and the second moments (cloud
+widths and tilt) of every frame in one pass, as a few matrix products over the whole stack instead of a loop
+over frames, centroids() the centroids alone for less. register_shifts() measures the sub-pixel displacement of
+every frame against a reference frame with the upsampled cross-correlation of Guizar-Sicairos et al. (Opt. Lett.
+33, 156 (2008)): a coarse FFT cross-correlation over a batch of frames, then a small upsampled DFT around each
+peak, so the cost does not grow with the upsampling factor.
+
+track_folder() runs both over a folder and returns a trajectory table (dict of columns, one row per shot) that
+can be plotted against T_WAIT or written with green_mot.aggregate.write_csv. Positions are in pixels of the full
+camera frame, not of the crop. Run from the repository root with
+    python -m green_mot.tracking <folder> <top> <bottom> <left> <right> [output.csv] [--upsample <factor>]
+'''
+
+import os
+
+import numpy as np
+
+from green_mot.catalog import build_catalog, globals_column
+from green_mot.prefetch import prefetch_batches
+
+
+def moments(stack, background=None):
+    '''
+    Intensity weighted moments of every frame of an (N, H, W) stack, in crop pixel coordinates.
+    background (H, W) or a number is subtracted first and negative pixels are set to zero, so the stray light
+    around the cloud does not pull the centroid towards the middle of the crop.
+    Returns a dict of (N,) arrays: total, centroid_x, centroid_y, sigma_x, sigma_y, sigma_xy (covariance).
+    Frames without positive signal get NaN.
+    '''
+    stack = np.asarray(stack, dtype=np.float64)
+    if stack.ndim == 2:
+        stack = stack[None]
+    if background is not None:
+        stack = np.clip(stack - background, 0, None)
+    _, height, width = stack.shape
+    y = np.arange(height, dtype=np.float64)
+    x = np.arange(width, dtype=np.float64)
+
+    # Projections on both axes carry everything except the cross term, which needs one more product
+    profile_y = stack.sum(axis=2)  # (N, H)
+    row_x = stack @ x  # (N, H), sum over columns of I * x
+    total = profile_y.sum(axis=1)
+    profile_x = stack.sum(axis=1)  # (N, W)
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        weight = np.where(total > 0, 1 / total, np.nan)
+        mean_x = profile_x @ x * weight
+        mean_y = profile_y @ y * weight
+        var_x = profile_x @ (x * x) * weight - mean_x ** 2
+        var_y = profile_y @ (y * y) * weight - mean_y ** 2
+        cov_xy = row_x @ y * weight - mean_x * mean_y
+
+    return {
+        'total': total,
+        'centroid_x': mean_x,
+        'centroid_y': mean_y,
+        'sigma_x': np.sqrt(np.clip(var_x, 0, None)),
+        'sigma_y': np.sqrt(np.clip(var_y, 0, None)),
+        'sigma_xy': cov_xy,
+    }
+
+
+def centroids(stack):
+    '''
+    (N, 2) array of the (y, x) centroid of every frame, the same as moments() without a background but summed
+    in the frames' own integer type when that is exact, without a float64 copy of the stack. NaN for frames
+    without positive signal.
+    '''
+    stack = np.asarray(stack)
+    if stack.ndim == 2:
+        stack = stack[None]
+    _, height, width = stack.shape
+    # int64 sums of integer frames are exact, the projections are then small enough for float64
+    dtype = np.int64 if stack.dtype.kind in 'biu' else np.float64
+    profile_y = stack.sum(axis=2, dtype=dtype).astype(np.float64)
+    profile_x = stack.sum(axis=1, dtype=dtype).astype(np.float64)
+    total = profile_y.sum(axis=1)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        weight = np.where(total > 0, 1 / total, np.nan)
+        return np.column_stack([profile_y @ np.arange(height, dtype=np.float64) * weight,
+                                profile_x @ np.arange(width, dtype=np.float64) * weight])
+
+
+def _upsampled_dft(data, region_size, upsample_factor, offsets):
+    # DFT of data evaluated on a region_size x region_size grid with spacing 1 / upsample_factor, starting at
+    # offsets (row, col), computed as two matrix products instead of a zero padded FFT
+    for n_items, offset in zip(data.shape[::-1], offsets[::-1]):
+        kernel = (np.arange(region_size) - offset)[:, None] * np.fft.fftfreq(n_items, upsample_factor)
+        data = np.tensordot(np.exp(-2j * np.pi * kernel), data, axes=(1, -1))
+    return data
+
+
+def register_shifts(stack, reference, upsample_factor=10, batch_size=32):
+    '''
+    Displacement (dy, dx) in pixels of every frame of an (N, H, W) stack relative to reference (H, W), with a
+    precision of 1 / upsample_factor pixel. Positive dx means the frame moved to the right.
+    Returns an (N, 2) array.
+    '''
+    stack = np.asarray(stack)
+    if stack.ndim == 2:
+        stack = stack[None]
+    shape = np.array(stack.shape[1:])
+    midpoints = np.fix(shape / 2)
+    reference_freq = np.fft.fft2(np.asarray(reference, dtype=np.float32))
+    region_size = int(np.ceil(upsample_factor * 1.5))
+    dft_shift = np.fix(region_size / 2.0)
+
+    shifts = np.zeros((len(stack), 2))
+    for start in range(0, len(stack), batch_size):
+        # Coarse shift of the whole batch with one FFT over the stack
+        image_product = np.fft.fft2(stack[start:start + batch_size].astype(np.float32)) * reference_freq.conj()
+        cross_correlation = np.abs(np.fft.ifft2(image_product))
+        flat_peaks = cross_correlation.reshape(len(image_product), -1).argmax(axis=1)
+        coarse = np.stack(np.unravel_index(flat_peaks, shape), axis=1).astype(np.float64)
+        coarse[coarse > midpoints] -= np.broadcast_to(shape, coarse.shape)[coarse > midpoints]
+
+        for k, product in enumerate(image_product):
+            shift = coarse[k]
+            if upsample_factor > 1:
+                # Refine on a 1.5 x 1.5 pixel region around the coarse peak
+                shift = np.round(shift * upsample_factor) / upsample_factor
+                offsets = dft_shift - shift * upsample_factor
+                upsampled = np.abs(_upsampled_dft(product.conj(), region_size, upsample_factor, offsets))
+                peak = np.array(np.unravel_index(upsampled.argmax(), upsampled.shape), dtype=np.float64)
+                shift = shift + (peak - dft_shift) / upsample_factor
+            shifts[start + k] = shift
+    return shifts
+
+
+def track_folder(folder_path, roi, background=None, upsample_factor=None, reference_index=0, batch_size=64):
+    '''
+    Trajectory table of the cloud in every shot of a folder, in catalog order.
+    Columns: file_path, t_wait, total, centroid_x, centroid_y, sigma_x, sigma_y, sigma_xy and, when
+    upsample_factor is given, shift_x and shift_y relative to the shot at reference_index.
+    background is an (H, W) crop or a number subtracted before the moments.
+    '''
+    top, bottom, left, right = roi
+    catalog = build_catalog(folder_path, recursive=False)
+    t_wait_by_path = dict(zip(catalog['file_path'], globals_column(catalog, 'T_WAIT')))
+    file_paths = [p for p, has_frame in zip(catalog['file_path'], catalog['has_frame']) if has_frame]
+
+    table = {'file_path': [], 't_wait': []}
+    columns = {}
+    stacks = [] if upsample_factor else None
+    for paths, stack, _ in prefetch_batches(file_paths, roi, batch_size=batch_size, with_globals=False):
+        table['file_path'].extend(paths)
+        table['t_wait'].extend(t_wait_by_path[p] for p in paths)
+        for name, values in moments(stack, background).items():
+            columns.setdefault(name, []).append(values)
+        if stacks is not None:
+            stacks.append(stack)
+
+    if not table['file_path']:
+        return None
+    for name, values in columns.items():
+        table[name] = np.concatenate(values)
+    table['t_wait'] = np.asarray(table['t_wait'], dtype=np.float64)
+    table['centroid_x'] += left
+    table['centroid_y'] += top
+
+    if upsample_factor:
+        stack = np.concatenate(stacks)
+        if background is not None:
+            stack = np.clip(stack.astype(np.float32) - background, 0, None)
+        shifts = register_shifts(stack, stack[reference_index], upsample_factor)
+        table['shift_y'] = shifts[:, 0]
+        table['shift_x'] = shifts[:, 1]
+    return table
+
+
+if __name__ == '__main__':
+    import sys
+
+    from green_mot.aggregate import write_csv
+
+    arguments = sys.argv[1:]
+    upsample_factor = None
+    if '--upsample' in arguments:
+        i = arguments.index('--upsample')
+        upsample_factor = int(arguments[i + 1])
+        del arguments[i:i + 2]
+    if len(arguments) not in (5, 6):
+        print("usage: python -m green_mot.tracking <folder> <top> <bottom> <left> <right> [output.csv] "
+              "[--upsample <factor>]")
+        sys.exit(1)
+    trajectory = track_folder(arguments[0], tuple(int(v) for v in arguments[1:5]), upsample_factor=upsample_factor)
+    if trajectory is None:
+        print(f"No frames in {arguments[0]}")
+        sys.exit(1)
+    write_csv(trajectory, arguments[5] if len(arguments) == 6 else
+              f"trajectory_{os.path.basename(os.path.normpath(arguments[0]))}.csv")
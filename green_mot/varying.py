@@ -0,0 +1,161 @@
+'''
+Which globals change between the shots of a folder
+
+labscript stores every global of a shot, but in a folder usually only one or two of them are scanned (T_WAIT,
+B_FINAL, ...), the rest have the same value in every shot. varying_globals() finds the scanned ones from the
+catalog alone, without opening a shot file: the globals of all shots are turned into one column per name in a
+single pass and every column is reduced to its distinct values.
+
+choose_axes() picks the global for the x axis of a metric plot (the one with the most distinct values) and a
+global to split the plot by (the one with the fewest), group_shots() returns the rows of every combination and
+plot_metric() draws a metric that way.
+'''
+
+from operator import itemgetter
+
+import numpy as np
+
+# Floats that only differ in the last digits (-1.3499999999999999 vs -1.35) count as one value
+significant_digits = 12
+
+
+def globals_columns(table):
+    '''
+    Globals of every row of a catalog or results table as columns, {name: (values, present)}.
+    values is a float64 array (NaN where missing) when every value of the global is a number, a list otherwise,
+    present is a boolean mask of the rows that have the global.
+    '''
+    all_globals = table['globals']
+    n = len(all_globals)
+    names = sorted({name for shot_globals in all_globals for name in shot_globals})
+    if not names:
+        return {}
+
+    # One row of values per shot, pulled out with a single itemgetter call per shot (missing globals -> None)
+    fetch = itemgetter(*names) if len(names) > 1 else lambda g: (g[names[0]],)
+    rows = [fetch(shot_globals) if len(shot_globals) == len(names) else
+            tuple(shot_globals.get(name) for name in names) for shot_globals in all_globals]
+    matrix = np.empty((n, len(names)), dtype=object)
+    matrix[:] = rows
+
+    columns = {}
+    for k, name in enumerate(names):
+        values = matrix[:, k]
+        present = np.array([v is not None for v in values], dtype=bool)
+        types = {type(v) for v in values[present]}
+        if types and types <= {int, float, np.int64, np.float64}:
+            column = np.full(n, np.nan)
+            column[present] = values[present].astype(np.float64)
+        else:
+            column = values.tolist()
+        columns[name] = (column, present)
+    return columns
+
+
+def _rounded(values):
+    # Round to significant_digits significant digits
+    exponent = np.floor(np.log10(np.abs(values), where=values != 0, out=np.zeros_like(values)))
+    scale = 10.0 ** (significant_digits - 1 - exponent)
+    return np.round(values * scale) / scale
+
+
+def distinct_values(column, present):
+    # Sorted distinct values of the rows where the global is present
+    if isinstance(column, np.ndarray):
+        return np.unique(_rounded(column[present])).tolist()
+    return sorted({repr(v) for v, p in zip(column, present) if p})
+
+
+def _sort_key(value):
+    # Numbers first in numeric order, then everything else by its text, missing values last
+    if value is None:
+        return (2, 0, '')
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return (0, value, '')
+    return (1, 0, repr(value))
+
+
+def varying_globals(table, columns=None):
+    '''
+    {name: sorted distinct values} of the globals that do not have the same value in every row, ordered by the
+    number of distinct values, most first. A global missing in some rows but not all counts as varying.
+    columns is the result of globals_columns(table) if it was already computed.
+    '''
+    varying = {}
+    n = len(table['globals'])
+    for name, (column, present) in (columns or globals_columns(table)).items():
+        values = distinct_values(column, present)
+        if len(values) > 1 or 0 < present.sum() < n:
+            varying[name] = values
+    return dict(sorted(varying.items(), key=lambda item: (-len(item[1]), item[0])))
+
+
+def constant_globals(table):
+    # {name: value} of the globals every row has with the same value
+    constant = {}
+    n = len(table['globals'])
+    for name, (column, present) in globals_columns(table).items():
+        if present.sum() == n and len(distinct_values(column, present)) == 1:
+            constant[name] = float(column[0]) if isinstance(column, np.ndarray) else column[0]
+    return constant
+
+
+def choose_axes(table, preferred=('T_WAIT',), max_facets=12):
+    '''
+    (x axis global, facet global or None) for plotting a metric of the rows of a table.
+    The x axis is the numeric varying global with the most distinct values, a global in preferred wins if it
+    varies. The facet is the varying global with the fewest distinct values among the rest, if it has at most
+    max_facets of them. Returns (None, None) when no numeric global varies.
+    '''
+    columns = globals_columns(table)
+    varying = varying_globals(table, columns)
+    numeric = [name for name in varying if isinstance(columns[name][0], np.ndarray)]
+    if not numeric:
+        return None, None
+    x_name = next((name for name in preferred if name in numeric), numeric[0])
+
+    facets = [name for name in varying if name != x_name and 1 < len(varying[name]) <= max_facets]
+    facet_name = min(facets, key=lambda name: len(varying[name])) if facets else None
+    return x_name, facet_name
+
+
+def group_shots(table, names):
+    # {tuple of values of the globals in names: row indices}, keys sorted, rows in table order
+    columns = globals_columns(table)
+    n = len(table['globals'])
+    key_columns = []
+    for name in names:
+        column, present = columns.get(name, ([None] * n, np.zeros(n, dtype=bool)))
+        if isinstance(column, np.ndarray):
+            # Rounded, so that values differing in the last digits end up in the same group
+            column = _rounded(np.nan_to_num(column)).tolist()
+        key_columns.append([value if p else None for value, p in zip(column, present)])
+    keys = list(zip(*key_columns)) if names else [()] * n
+    groups = {}
+    for row, key in enumerate(keys):
+        groups.setdefault(key, []).append(row)
+    return {key: np.array(groups[key]) for key in sorted(groups, key=lambda k: [_sort_key(v) for v in k])}
+
+
+def plot_metric(ax, table, values, label, x_name=None, facet_name=None):
+    '''
+    Draw values (one per row of table) against the x axis global, one line per value of the facet global.
+    Both are picked with choose_axes() when not given. Returns (x_name, facet_name).
+    '''
+    if x_name is None:
+        x_name, facet_name = choose_axes(table)
+    if x_name is None:
+        raise ValueError("No global varies between the shots, nothing to put on the x axis")
+    x, _ = globals_columns(table)[x_name]
+    values = np.asarray(values, dtype=np.float64)
+    groups = group_shots(table, [facet_name]) if facet_name else {(None,): np.arange(len(values))}
+    for (facet_value,), rows in groups.items():
+        rows = rows[np.argsort(x[rows])]
+        ax.plot(x[rows], values[rows], marker='o', linestyle='-',
+                label=f"{facet_name} = {facet_value}" if facet_name else None)
+    ax.set_xlabel(x_name)
+    ax.set_ylabel(label)
+    ax.grid(True)
+    if facet_name:
+        ax.legend()
+    return x_name, facet_name
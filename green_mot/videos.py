@@ -0,0 +1,174 @@
+'''
+One video per experiment folder, for a whole batch of folders
+
+video_visualization_mot_frames.py makes the video of one hard coded folder. render_videos() takes folder names or
+glob patterns, renders one video per folder in parallel worker processes and skips the folders whose video is
+already up to date: the catalog signature of the shots and the render settings are stored next to every video in
+cache/videos, a video is only made again when a shot was added or changed, a setting changed or the file is gone.
+
+Every video is streamed: a first pass over the cropped frames builds the brightness scale shared by all frames of
+the folder, the second pass converts each frame and writes it to the video right away, so no folder is held in
+memory. Run from the repository root with
+    python -m green_mot.videos <day folder> <pattern> [<pattern> ...] [--output <folder>] [--force]
+e.g. python -m green_mot.videos 20250123TOF_withBlueMOTBeams 'NoRamp_*V' 'WithRamp_*' --output Videos
+'''
+
+import glob
+import hashlib
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import cv2
+import numpy as np
+
+from green_mot.catalog import build_catalog, globals_column
+from green_mot.compare import draw_label, experiment_label, global_percentile_scale, write_comparison_video
+from green_mot.normalize import apply_lut
+from green_mot.prefetch import PrefetchLoader
+from green_mot.shots import cache_directory, data_directory, natural_sort_key
+
+video_cache_directory = os.path.join(cache_directory, 'videos')
+
+# Bump when the look of the videos changes, so every video is made again
+video_version = 1
+
+default_roi = (350, 1050, 950, 1650)
+
+
+def match_folders(day_folder, patterns):
+    # Folders of a day matching any of the patterns, in natural order, without duplicates
+    if not os.path.isabs(day_folder) and not os.path.isdir(day_folder):
+        day_folder = os.path.join(data_directory, day_folder)
+    folders = []
+    for pattern in patterns:
+        matches = sorted(glob.glob(os.path.join(day_folder, pattern)), key=natural_sort_key)
+        folders.extend(folder for folder in matches if os.path.isdir(folder) and folder not in folders)
+    return folders
+
+
+def video_signature(catalog, settings):
+    # Changes whenever a shot of the folder or a render setting changes
+    return hashlib.sha1(repr((video_version, catalog['file_path'], catalog['mtime'].tolist(),
+                              catalog['size'].tolist(), sorted(settings.items()))).encode()).hexdigest()
+
+
+def _manifest_path(output_path):
+    key = hashlib.sha1(os.path.abspath(output_path).encode()).hexdigest()
+    return os.path.join(video_cache_directory, f"{key}.json")
+
+
+def is_up_to_date(output_path, signature):
+    manifest_path = _manifest_path(output_path)
+    if not os.path.exists(output_path) or not os.path.exists(manifest_path):
+        return False
+    with open(manifest_path) as f:
+        return json.load(f).get('signature') == signature
+
+
+def iter_folder_frames(file_paths, titles, roi, percentiles=(0.5, 99.5), prefetch_depth=4):
+    # Yield (title, BGR frame) for every shot, all frames on the brightness scale of the whole folder. The loader
+    # skips shots without a frame, so the titles are looked up by the path it gives back
+    lut = global_percentile_scale(file_paths, roi, percentiles)
+    title_of = dict(zip(file_paths, titles))
+    for file_path, cropped_image, _ in PrefetchLoader(file_paths, roi, depth=prefetch_depth, with_globals=False):
+        title = title_of[file_path]
+        frame_bgr = cv2.cvtColor(apply_lut(cropped_image, lut), cv2.COLOR_GRAY2BGR)
+        draw_label(frame_bgr, title, 20, 50, 1.0)
+        yield title, frame_bgr
+
+
+def render_folder_video(folder_path, output_path, roi=default_roi, percentiles=(0.5, 99.5), frame_rate=30,
+                        seconds_per_frame=1, prefetch_depth=4, force=False):
+    '''
+    Write the video of one experiment folder unless it is up to date.
+    Returns (output_path, number of frames), the number is None when the video was skipped.
+    '''
+    catalog = build_catalog(folder_path, recursive=False)
+    settings = {'roi': list(roi), 'percentiles': list(percentiles), 'frame_rate': frame_rate,
+                'seconds_per_frame': seconds_per_frame}
+    signature = video_signature(catalog, settings)
+    if not force and is_up_to_date(output_path, signature):
+        return output_path, None
+
+    label = experiment_label(os.path.basename(os.path.normpath(folder_path)))
+    file_paths, titles = [], []
+    for file_path, has_frame, t_wait in zip(catalog['file_path'], catalog['has_frame'],
+                                            globals_column(catalog, 'T_WAIT')):
+        if not has_frame:
+            print(f"Warning: {file_path} has no frame, left out of the video")
+            continue
+        file_paths.append(file_path)
+        titles.append(f"{label} Wait Time: {t_wait * 1e3:.2f} ms" if np.isfinite(t_wait) else "T_WAIT: N/A")
+    if not file_paths:
+        print(f"No frames in {folder_path}. Video was not created.")
+        return output_path, 0
+
+    os.makedirs(os.path.dirname(os.path.abspath(output_path)), exist_ok=True)
+    count = write_comparison_video(iter_folder_frames(file_paths, titles, roi, percentiles, prefetch_depth),
+                                   output_path, frame_rate, seconds_per_frame)
+
+    os.makedirs(video_cache_directory, exist_ok=True)
+    with open(_manifest_path(output_path), 'w') as f:
+        json.dump({'signature': signature, 'folder': os.path.abspath(folder_path), 'settings': settings}, f)
+    return output_path, count
+
+
+def render_videos(folders, output_directory=None, roi=default_roi, percentiles=(0.5, 99.5), frame_rate=30,
+                  seconds_per_frame=1, workers=None, force=False):
+    '''
+    Render the video of every folder in a pool of worker processes, one folder per task.
+    The video of a folder is written to <folder>/<folder name>.mp4, or into output_directory when given.
+    Returns {folder: number of frames written, or None if the video was already up to date}.
+    '''
+    tasks = {}
+    for folder in folders:
+        name = os.path.basename(os.path.normpath(folder))
+        tasks[folder] = os.path.join(output_directory or folder, f"{name}.mp4")
+
+    results = {}
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = {pool.submit(render_folder_video, folder, output_path, roi, percentiles, frame_rate,
+                               seconds_per_frame, force=force): folder
+                   for folder, output_path in tasks.items()}
+        for future in as_completed(futures):
+            folder = futures[future]
+            try:
+                output_path, count = future.result()
+            except Exception as error:
+                print(f"Warning: video of {folder} failed: {type(error).__name__}: {error}")
+                results[folder] = 0
+                continue
+            if count is None:
+                print(f"Up to date: {output_path}")
+            results[folder] = count
+
+    made = sum(1 for count in results.values() if count)
+    skipped = sum(1 for count in results.values() if count is None)
+    print(f"{made} videos written, {skipped} up to date, {len(results) - made - skipped} without frames or failed")
+    return results
+
+
+if __name__ == '__main__':
+    import sys
+
+    arguments = sys.argv[1:]
+    force = '--force' in arguments
+    arguments = [a for a in arguments if a != '--force']
+    output_directory = None
+    if '--output' in arguments:
+        i = arguments.index('--output')
+        output_directory = arguments[i + 1]
+        del arguments[i:i + 2]
+    if len(arguments) < 2:
+        print("usage: python -m green_mot.videos <day folder> <pattern> [<pattern> ...] [--output <folder>] [--force]")
+        print("  --output  folder for the videos, relative to the day folder, default: next to the shots")
+        print("  --force   make every video again even if it is up to date")
+        sys.exit(1)
+
+    folders = match_folders(arguments[0], arguments[1:])
+    if not folders:
+        raise FileNotFoundError(f"No folders match {arguments[1:]} in {arguments[0]}")
+    if output_directory and not os.path.isabs(output_directory):
+        output_directory = os.path.join(os.path.dirname(folders[0]), output_directory)
+    render_videos(folders, output_directory, force=force)
@@ -15,7 +15,6 @@ of the same main folder which I thought was interesting
 
 
 
-import h5py
 import numpy as np
 import os
 import cv2
@@ -25,9 +24,13 @@ import re
 matplotlib.use('TkAgg')
 import matplotlib.pyplot as plt
 
+from green_mot.calibration import counts_to_atoms, scattering_rate, solid_angle_from_na
+from green_mot.mosaic import render_mosaic, show_mosaic
+from green_mot.screening import screen_folder
+from green_mot.shots import list_shot_files, read_frame, shot_folders
+
 # Specify the main directory where subfolders are located
 main_folder_path = "data/20250110_first_data"  # Replace with your directory path
-image_dataset_path = 'images/cam1/after ramp/frame'
 
 # List to store the file paths, folder names, and image data
 file_info = []
@@ -42,6 +45,12 @@ right = 1310
 text_x = 10  # Horizontal position of the text (from the left)
 text_y = 20  # Vertical position of the text (from the bottom)
 
+# Camera and imaging parameters for converting the pixel sums to atom numbers, see green_mot/calibration.py.
+# Leave as None to only plot the raw pixel sums, e.g.
+# calibration = {'camera_gain': 0.5, 'quantum_efficiency': 0.6, 'exposure': 1e-3,
+#                'collection_solid_angle': solid_angle_from_na(0.1), 'scattering_rate': scattering_rate(1.0)}
+calibration = None
+
 
 def parse_folder_name(folder_name):
     # Check for the "background" folder
@@ -67,32 +76,28 @@ def parse_folder_name(folder_name):
     return None  # No valid label
 
 
-# Iterate through the subfolders in the main directory to identify background images
-for subfolder_name in os.listdir(main_folder_path):
-    subfolder_path = os.path.join(main_folder_path, subfolder_name)
-
-    # Check if it is a folder
-    if os.path.isdir(subfolder_path):
-        # Parse the folder name for experiment information
-        parsed_title = parse_folder_name(subfolder_name)
-
-        # If it's a background folder, append the background images to the list
-        if parsed_title == "Background":
-            print(f"Processing background folder: {subfolder_name}")
-            for file_name in os.listdir(subfolder_path):
-                if file_name.endswith(".h5"):  # Check for .h5 files
-                    file_path = os.path.join(subfolder_path, file_name)
-
-                    # Open the .h5 file
-                    with h5py.File(file_path, "r") as h5_file:
-                        # Extract frame data for background
-                        frame_data = None
-                        if image_dataset_path in h5_file:
-                            frame_data = h5_file[image_dataset_path][:]
-
-                            # Append background images to list (ensure it's two background images)
-                            background_images.append(frame_data)
-                            print(f"  Background image added from {file_name}")
+# Iterate through the subfolders in the main directory to identify background images. A subfolder can also be a
+# repacked store (green_mot/repack.py), the shots are listed and read through green_mot.shots
+for subfolder_name, subfolder_path in shot_folders(main_folder_path):
+    # Parse the folder name for experiment information
+    parsed_title = parse_folder_name(subfolder_name)
+
+    # If it's a background folder, append the background images to the list
+    if parsed_title == "Background":
+        print(f"Processing background folder: {subfolder_name}")
+        # Shots that fail screening (green_mot/screening.py) are left out, the reasons are printed
+        screening = screen_folder(subfolder_path)
+        for file_path in list_shot_files(subfolder_path):
+            file_name = os.path.basename(file_path)
+            if not screening.get(file_path, (True, ''))[0]:
+                continue
+
+            # Extract frame data for background, None when the shot has no frame
+            frame_data = read_frame(file_path)
+            if frame_data is not None:
+                # Append background images to list (ensure it's two background images)
+                background_images.append(frame_data)
+                print(f"  Background image added from {file_name}")
 
 # Debugging output to ensure two background images are appended
 print(f"Number of background images found: {len(background_images)}")
@@ -103,70 +108,66 @@ if len(background_images) != 2:
     exit()
 
 # Now, process all other folders (not background folders)
-for subfolder_name in os.listdir(main_folder_path):
-    subfolder_path = os.path.join(main_folder_path, subfolder_name)
-
-    # Check if it is a folder
-    if os.path.isdir(subfolder_path):
-        # Parse the folder name for experiment information
-        parsed_title = parse_folder_name(subfolder_name)
+for subfolder_name, subfolder_path in shot_folders(main_folder_path):
+    # Parse the folder name for experiment information
+    parsed_title = parse_folder_name(subfolder_name)
+
+    # Skip background folders
+    if parsed_title == "Background" or parsed_title is None:
+        continue
+
+    # Look for the shots in the subfolder, leaving out the ones that fail screening
+    screening = screen_folder(subfolder_path)
+    for file_path in list_shot_files(subfolder_path):
+        file_name = os.path.basename(file_path)
+        if not screening.get(file_path, (True, ''))[0]:
+            continue
 
-        # Skip background folders
-        if parsed_title == "Background" or parsed_title is None:
+        # Extract frame data, None when the shot has no frame
+        frame_data = read_frame(file_path)
+        if frame_data is None:
             continue
 
-        # Look for .h5 files in the subfolder
-        for file_name in os.listdir(subfolder_path):
-            if file_name.endswith(".h5"):  # Check for .h5 files
-                file_path = os.path.join(subfolder_path, file_name)
-
-                # Open the .h5 file
-                with h5py.File(file_path, "r") as h5_file:
-                    # Extract frame data
-                    frame_data = None
-                    if image_dataset_path in h5_file:
-                        frame_data = h5_file[image_dataset_path][:]
-
-                        # Apply background subtraction before cropping
-                        print(f"Subtracting backgrounds from {file_name} in folder {subfolder_name}:")
-
-                        # Subtract the first background image (background1)
-                        background1_subtracted = cv2.subtract(frame_data, background_images[0])
-                        print(f"  Background1 subtraction done for {file_name}")
-                        print(f"background_images[0] = { background_images[0]}")
-                        # Subtract the second background image (background2)
-                        background2_subtracted = cv2.subtract(frame_data, background_images[1])
-                        print(f"background_images[0] = {background_images[1]}")
-                        print(f"  Background2 subtraction done for {file_name}")
-
-                        # Combine the results of both subtractions (add the subtracted images)
-                        final_subtracted = cv2.add(background1_subtracted, background2_subtracted)
-                        print(f"  Combined background subtraction done for {file_name}")
-
-                        # Crop the final background-subtracted image (after both background subtractions)
-                        cropped_frame = final_subtracted[top:bottom, left:right]
-
-                        # Extract numeric value from parsed title
-                        if parsed_title:
-                            numeric_value = re.search(r"(\d+)(?:/(\d+))?", parsed_title)
-                            if numeric_value:
-                                if numeric_value.group(2):  # Fraction format like "1/2"
-                                    numeric_value = float(numeric_value.group(1)) / float(numeric_value.group(2))
-                                else:
-                                    numeric_value = float(numeric_value.group(1))
-                            else:
-                                numeric_value = float('inf')  # If there's no numeric value, assign a large number
-                        else:
-                            numeric_value = float('inf')  # If parsed_title is None, assign a large number
-
-                        # Store the cropped image information
-                        file_info.append({
-                            "folder_name": subfolder_name,
-                            "parsed_title": parsed_title,  # Ensure parsed title is included
-                            "file_path": file_path,
-                            "cropped_image": cropped_frame,  # Add cropped image here
-                            "numeric_value": numeric_value  # Add numeric value for sorting
-                        })
+        # Apply background subtraction before cropping
+        print(f"Subtracting backgrounds from {file_name} in folder {subfolder_name}:")
+
+        # Subtract the first background image (background1)
+        background1_subtracted = cv2.subtract(frame_data, background_images[0])
+        print(f"  Background1 subtraction done for {file_name}")
+        print(f"background_images[0] = { background_images[0]}")
+        # Subtract the second background image (background2)
+        background2_subtracted = cv2.subtract(frame_data, background_images[1])
+        print(f"background_images[0] = {background_images[1]}")
+        print(f"  Background2 subtraction done for {file_name}")
+
+        # Combine the results of both subtractions (add the subtracted images)
+        final_subtracted = cv2.add(background1_subtracted, background2_subtracted)
+        print(f"  Combined background subtraction done for {file_name}")
+
+        # Crop the final background-subtracted image (after both background subtractions)
+        cropped_frame = final_subtracted[top:bottom, left:right]
+
+        # Extract numeric value from parsed title
+        if parsed_title:
+            numeric_value = re.search(r"(\d+)(?:/(\d+))?", parsed_title)
+            if numeric_value:
+                if numeric_value.group(2):  # Fraction format like "1/2"
+                    numeric_value = float(numeric_value.group(1)) / float(numeric_value.group(2))
+                else:
+                    numeric_value = float(numeric_value.group(1))
+            else:
+                numeric_value = float('inf')  # If there's no numeric value, assign a large number
+        else:
+            numeric_value = float('inf')  # If parsed_title is None, assign a large number
+
+        # Store the cropped image information
+        file_info.append({
+            "folder_name": subfolder_name,
+            "parsed_title": parsed_title,  # Ensure parsed title is included
+            "file_path": file_path,
+            "cropped_image": cropped_frame,  # Add cropped image here
+            "numeric_value": numeric_value  # Add numeric value for sorting
+        })
 
 # Calculate the sum of pixel values for each image and subtract both background images before calculation
 intensity_info = []
@@ -174,11 +175,9 @@ pixel_sums = []
 times = []
 
 for info in file_info:
-    # Convert cropped image to uint8 if necessary
-    cropped_image = info['cropped_image'].astype(np.uint8)
-
-    # Sum the pixel values for the subtracted image
-    pixel_sum = np.sum(cropped_image)
+    # Sum the pixel values for the subtracted image, in float64 so that nothing wraps around (the combined
+    # subtraction can go above 255, a uint8 cast used to cut those pixels)
+    pixel_sum = np.sum(info['cropped_image'], dtype=np.float64)
 
     # Store the sum and numeric value for plotting later
     pixel_sums.append(pixel_sum)
@@ -199,31 +198,15 @@ file_info_sorted = sorted(file_info, key=lambda x: x['numeric_value'])
 # Number of cropped images to display
 num_images = len(file_info_sorted)
 
-# Determine the grid size for subplots
+# Draw all crops as one mosaic image (green_mot/mosaic.py), a single imshow no matter how many shots there are
 cols = 4  # Number of columns in the grid
-rows = (num_images + cols - 1) // cols  # Calculate the number of rows required
-
-# Create a figure for the subplots
-fig, axes = plt.subplots(rows, cols, figsize=(15, 5 * rows))
-
-# Flatten axes for easy indexing
-axes = axes.flatten()
-
-# Display each cropped image in a subplot
-for i, info in enumerate(file_info_sorted):
-    axes[i].imshow(info['cropped_image'], cmap='gray')
-
-    # Add text to the cropped image at adjustable position
-    axes[i].text(text_x, info['cropped_image'].shape[0] - text_y, info['parsed_title'], color='white', fontsize=12,
-                 ha='left', va='bottom')
-    axes[i].axis('off')  # Hide axes for a cleaner look
-
-# Hide unused subplots
-for j in range(i + 1, len(axes)):
-    axes[j].axis('off')
+crop_height = file_info_sorted[0]['cropped_image'].shape[0]
+mosaic = render_mosaic(np.stack([info['cropped_image'] for info in file_info_sorted]),
+                       [info['parsed_title'] for info in file_info_sorted], cols=cols, normalization='panel',
+                       text_position=(text_x, crop_height - text_y))
+show_mosaic(mosaic)
 
 # Display the plot
-plt.tight_layout()
 plt.show()
 
 # Create a second plot: Sum of pixel values vs. time after background subtraction
@@ -234,3 +217,15 @@ plt.ylabel('Sum of Pixel Values (After Background Subtraction)')
 plt.title('Sum of Pixel Values vs Time (Background1 and Background2 Subtracted)')
 plt.grid(True)
 plt.show()
+
+# Same data as atom numbers, only when the calibration is filled in. These shots do not record the calibration
+# globals, so the config values are used for every shot.
+if calibration is not None:
+    atom_number_values = counts_to_atoms(pixel_sums, **calibration)
+    plt.figure(figsize=(8, 6))
+    plt.scatter(times, atom_number_values, color='green')
+    plt.xlabel('Time (t)')
+    plt.ylabel('Atom number')
+    plt.title('Atom Number vs Time (Background1 and Background2 Subtracted)')
+    plt.grid(True)
+    plt.show()
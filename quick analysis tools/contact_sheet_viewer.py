@@ -0,0 +1,147 @@
+'''
+Contact sheet viewer for quickly browsing all shots of a day folder
+
+The shots are shown as a grid of 1/16 scale thumbnails taken from the thumbnail cache (green_mot/thumbnails.py),
+the first run builds the cache and every run after that only reads the small cached files.
+
+Controls:
+    right / left arrow  -> next / previous page
+    click on a shot     -> opens that shot on its own at 1/4 scale, the full resolution frame is loaded as soon
+                           as you zoom in with the matplotlib zoom tool
+'''
+
+import matplotlib
+matplotlib.use('TkAgg')  # Use TkAgg as the backend
+
+import os
+import sys
+
+import numpy as np
+import matplotlib.pyplot as plt
+
+# Make the green_mot helpers importable when running this tool directly
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from green_mot.shots import data_directory, list_shot_files, read_frame
+from green_mot.thumbnails import load_pyramid
+
+# USER DEFINE PARAMETERS HERE ONLY
+
+data_day_name = '20250123TOF_withBlueMOTBeams'
+experiment_title = ''  # leave empty to browse every experiment of the day
+
+cols = 8  # Number of thumbnails per row
+rows = 5  # Number of rows per page
+
+# Fraction of the frame width that has to be visible before the full resolution frame is loaded
+full_resolution_zoom = 0.25
+
+#=========================================================================
+
+folder_path = os.path.join(data_directory, data_day_name, experiment_title)
+files = list_shot_files(folder_path, recursive=True)
+print(f"Found {len(files)} shots in {folder_path}")
+
+if not files:
+    print("No shots found, nothing to show.")
+    exit()
+
+per_page = cols * rows
+num_pages = (len(files) + per_page - 1) // per_page
+page = 0
+
+
+def build_page(page_index):
+    # Tile the thumbnails of one page into a single image so the page is drawn with one imshow call
+    page_files = files[page_index * per_page:(page_index + 1) * per_page]
+    thumbnails = [None] * len(page_files)
+    for i, file_path in enumerate(page_files):
+        pyramid = load_pyramid(file_path)
+        if pyramid is not None:
+            thumbnails[i] = pyramid[16]
+
+    shape = next((t.shape for t in thumbnails if t is not None), (75, 120))
+    sheet = np.zeros((rows * shape[0], cols * shape[1]), dtype=np.float32)
+    for i, thumbnail in enumerate(thumbnails):
+        if thumbnail is None:
+            continue
+        r, c = divmod(i, cols)
+        sheet[r * shape[0]:(r + 1) * shape[0], c * shape[1]:(c + 1) * shape[1]] = thumbnail
+    return sheet, page_files, shape
+
+
+def show_page():
+    sheet, page_files, shape = build_page(page)
+    ax.clear()
+    ax.imshow(sheet, cmap='gray')
+    for i, file_path in enumerate(page_files):
+        r, c = divmod(i, cols)
+        ax.text(c * shape[1] + 2, r * shape[0] + 2, os.path.relpath(file_path, folder_path),
+                color='yellow', fontsize=5, ha='left', va='top')
+    ax.set_title(f"{data_day_name}/{experiment_title}  page {page + 1}/{num_pages}")
+    ax.axis('off')
+    fig.canvas.draw_idle()
+    return page_files, shape
+
+
+def open_shot(file_path):
+    # Show the 1/4 scale preview right away and swap in the full frame once the view is zoomed in
+    pyramid = load_pyramid(file_path)
+    if pyramid is None:
+        return
+    preview = pyramid[4]
+    full_height, full_width = preview.shape[0] * 4, preview.shape[1] * 4
+
+    shot_fig, shot_ax = plt.subplots(figsize=(10, 6))
+    image = shot_ax.imshow(preview, cmap='gray', extent=(0, full_width, full_height, 0))
+    shot_ax.set_title(f"{os.path.basename(file_path)} (1/4 scale)")
+    state = {'full': False}
+
+    def on_zoom(axis):
+        if state['full']:
+            return
+        x0, x1 = axis.get_xlim()
+        if abs(x1 - x0) > full_resolution_zoom * full_width:
+            return
+        frame = read_frame(file_path)
+        if frame is None:
+            return
+        state['full'] = True
+        image.set_data(frame)
+        image.set_extent((0, frame.shape[1], frame.shape[0], 0))
+        shot_ax.set_title(f"{os.path.basename(file_path)} (full resolution)")
+        shot_fig.canvas.draw_idle()
+
+    shot_ax.callbacks.connect('xlim_changed', on_zoom)
+    shot_fig.show()
+
+
+def on_key(event):
+    global page, page_state
+    if event.key == 'right' and page < num_pages - 1:
+        page += 1
+    elif event.key == 'left' and page > 0:
+        page -= 1
+    else:
+        return
+    page_state = show_page()
+
+
+def on_click(event):
+    if event.inaxes is not ax or event.xdata is None:
+        return
+    page_files, shape = page_state
+    c = int(event.xdata // shape[1])
+    r = int(event.ydata // shape[0])
+    i = r * cols + c
+    if 0 <= c < cols and i < len(page_files):
+        open_shot(page_files[i])
+
+
+fig, ax = plt.subplots(figsize=(15, 9))
+page_state = show_page()
+fig.canvas.mpl_connect('key_press_event', on_key)
+fig.canvas.mpl_connect('button_press_event', on_click)
+
+plt.tight_layout()
+plt.show()
@@ -12,6 +12,13 @@ import os
 import cv2  # OpenCV for video creation
 import matplotlib.pyplot as plt
 import re  # For natural sorting
+import sys
+
+# Make the green_mot helpers importable when running this tool directly
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from green_mot.normalize import StreamingHistogram, apply_lut, build_lut
+from green_mot.prefetch import PrefetchLoader
 
 
 # USER DEFINE PARAMETERS HERE ONLY
@@ -25,6 +32,9 @@ right = 1650  # horizontal width end point (right edge)
 data_day_name = '20250123TOF_withBlueMOTBeams'
 experiment_title = 'WithRamp_9V_6V'
 
+prefetch_depth = 4  # Number of shots read ahead while the current one is processed
+normalization_percentiles = (0.5, 99.5)  # pixel percentiles of the whole folder mapped to black and white
+
 #=====================================================================
 file_titles = []
 frame_list = []  # Store frames for the video
@@ -82,72 +92,68 @@ dataset_path = 'images/cam1/after ramp/frame'
 # Ensure interactive mode is off
 plt.ioff()
 
+# Validate cropping region
+if top >= bottom or left >= right:
+    raise ValueError(f"Invalid cropping region: top={top}, bottom={bottom}, left={left}, right={right}")
+
+# The next shots are read on a background thread while the current frame is converted
+loader = PrefetchLoader([os.path.join(recaptured_mot_folder, f) for f in files], (top, bottom, left, right),
+                        depth=prefetch_depth)
+
+cropped_images = []  # Raw crops, converted to uint8 once the brightness scale of the whole folder is known
+histogram = StreamingHistogram()
+
 # Process each .h5 file
-for filename in files:
-    file_path = os.path.join(recaptured_mot_folder, filename)
-
-    # Open the .h5 file
-    with h5py.File(file_path, 'r') as f:
-        try:
-            # Load image data
-            image_data = f[dataset_path][:]
-            if image_data.size == 0:
-                print(f"Warning: Dataset in {filename} is empty.")
-                continue
-
-                # Validate cropping region
-            if top >= bottom or left >= right:
-                print(f"Warning: Invalid cropping region in {filename}. Skipping...")
-                continue
-
-                # Crop image
-            cropped_image = image_data[top:bottom, left:right]
-
-            # Extract T_WAIT and handle missing values
-            t_wait = f['globals'].attrs.get('T_WAIT', None)
-            if t_wait is not None:
-                t_wait_ms = t_wait * 1e3  # Convert to ms
-                title = f"{experiment_label} Wait Time: {t_wait_ms:.2f} ms"
-                t_wait_list.append(t_wait_ms)  # Store extracted wait time
-            else:
-                title = "T_WAIT: N/A"
-
-            file_titles.append(title)
-
-            # Convert image to uint8 format for video
-            normalized_image = ((cropped_image - np.min(cropped_image)) /
-                                (np.max(cropped_image) - np.min(cropped_image)) * 255).astype(np.uint8)
-
-            # Convert grayscale to BGR format (needed for OpenCV)
-            frame_bgr = cv2.cvtColor(normalized_image, cv2.COLOR_GRAY2BGR)
-
-            # Overlay the title text on the image
-            font = cv2.FONT_HERSHEY_SIMPLEX
-            font_scale = 1
-            font_thickness = 2
-            text_color = (255, 255, 255)  # White text
-            background_color = (0, 0, 0)  # Black background for contrast
-
-            text_size = cv2.getTextSize(title, font, font_scale, font_thickness)[0]
-            text_x = 20
-            text_y = 50  # Position near the top-left corner
-
-            # Draw black rectangle for better text visibility
-            cv2.rectangle(frame_bgr, (text_x - 10, text_y - 30), (text_x + text_size[0] + 10, text_y + 10),
-                          background_color, -1)
-
-            # Put the title text on the frame
-            cv2.putText(frame_bgr, title, (text_x, text_y), font, font_scale, text_color, font_thickness)
-
-            frame_list.append(frame_bgr)  # Store frames for video
-
-            print(f"Processed {filename} with {title}")  # Debugging output
-
-        except KeyError:
-            print(f"Warning: Dataset path '{dataset_path}' not found in {filename}.")
-            continue
-
-        # Generate Video
+for file_path, cropped_image, shot_globals in loader:
+    filename = os.path.basename(file_path)
+
+    # Extract T_WAIT and handle missing values
+    t_wait = shot_globals.get('T_WAIT', None)
+    if t_wait is not None:
+        t_wait_ms = t_wait * 1e3  # Convert to ms
+        title = f"{experiment_label} Wait Time: {t_wait_ms:.2f} ms"
+        t_wait_list.append(t_wait_ms)  # Store extracted wait time
+    else:
+        title = "T_WAIT: N/A"
+
+    file_titles.append(title)
+    cropped_images.append(cropped_image)
+    histogram.update(cropped_image)
+
+    print(f"Processed {filename} with {title}")  # Debugging output
+
+# One brightness scale for every frame, so the cloud fading away is visible in the video
+low, high = histogram.percentiles(normalization_percentiles)
+lut = build_lut(low, high, len(histogram.counts) - 1)
+
+for cropped_image, title in zip(cropped_images, file_titles):
+    # Convert image to uint8 format for video
+    normalized_image = apply_lut(cropped_image, lut)
+
+    # Convert grayscale to BGR format (needed for OpenCV)
+    frame_bgr = cv2.cvtColor(normalized_image, cv2.COLOR_GRAY2BGR)
+
+    # Overlay the title text on the image
+    font = cv2.FONT_HERSHEY_SIMPLEX
+    font_scale = 1
+    font_thickness = 2
+    text_color = (255, 255, 255)  # White text
+    background_color = (0, 0, 0)  # Black background for contrast
+
+    text_size = cv2.getTextSize(title, font, font_scale, font_thickness)[0]
+    text_x = 20
+    text_y = 50  # Position near the top-left corner
+
+    # Draw black rectangle for better text visibility
+    cv2.rectangle(frame_bgr, (text_x - 10, text_y - 30), (text_x + text_size[0] + 10, text_y + 10),
+                  background_color, -1)
+
+    # Put the title text on the frame
+    cv2.putText(frame_bgr, title, (text_x, text_y), font, font_scale, text_color, font_thickness)
+
+    frame_list.append(frame_bgr)  # Store frames for video
+
+# Generate Video
 if frame_list:
     output_video_path = os.path.join(recaptured_mot_folder, f"{folder_name}.mp4")
 
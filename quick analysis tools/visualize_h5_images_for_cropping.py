@@ -7,6 +7,10 @@ It currently loops through the ALL h5 file in a specified directory
 A rectangle appears on the original image for the cropping zone, and to the right is the cropped image.
 
 Its purpose is to be able to quickly find out the crop numbers you need by manually adjusting and using those numbers for other scripts
+
+For dragging the cropping region on the mean image of a folder with live counts instead, run
+    green-mot select-roi <folder> [--pipeline <pipeline.toml>]
+(green_mot/roi_selector.py), which also writes the region into a pipeline file
 '''
 
 import matplotlib
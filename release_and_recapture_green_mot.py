@@ -6,7 +6,6 @@ lifetime of the MOT
 '''
 
 
-import h5py
 import os
 import matplotlib
 import cv2
@@ -14,6 +13,13 @@ matplotlib.use('TkAgg')  # Use TkAgg as the backend
 import matplotlib.pyplot as plt
 import numpy as np
 
+from green_mot.calibration import atom_numbers, scattering_rate, solid_angle_from_na
+from green_mot.catalog import select
+from green_mot.prefetch import PrefetchLoader
+from green_mot.results import ResultsWriter
+from green_mot.screening import screen_folder
+from green_mot.shots import list_shot_files
+
 # Define folder paths
 primary_data_folder = "data/20250114_release_and_recapture_greenMOT/recaptured MOT"
 background_block_main_beams_folder = "data/20250114_release_and_recapture_greenMOT/backgrounds1"
@@ -22,36 +28,75 @@ background_block_diagonal_beams_folder = "data/20250114_release_and_recapture_gr
 # Define the cropping region
 top, bottom, left, right = 400, 850, 910, 1350
 file_titles = []
+shot_files = []  # Primary shot files, in the same order as cropped_images
+shot_globals = []  # Globals of the primary shots
+
+# Camera and imaging parameters for converting the pixel sums to atom numbers, see green_mot/calibration.py.
+# Any of them recorded as a global in the shot files is taken from there instead. Leave as None to only plot the
+# raw pixel sums, e.g.
+# calibration = {'camera_gain': 0.5, 'quantum_efficiency': 0.6, 'exposure': 1e-3,
+#                'collection_solid_angle': solid_angle_from_na(0.1), 'scattering_rate': scattering_rate(1.0)}
+calibration = None
+
+# Number of shots read ahead on a background thread while the current one is processed
+prefetch_depth = 4
+
+# Store the pixel sums (and atom numbers) in every shot file under results/release_and_recapture_green_mot, like
+# lyse does, plus one table of all shots in results/, see green_mot/results.py
+save_results = False
 
-# Get sorted lists of files
-primary_files = sorted([os.path.join(primary_data_folder, f) for f in os.listdir(primary_data_folder) if f.endswith('.h5')])
-bg1_files = sorted([os.path.join(background_block_main_beams_folder, f) for f in os.listdir(background_block_main_beams_folder) if f.endswith('.h5')])
-bg2_files = sorted([os.path.join(background_block_diagonal_beams_folder, f) for f in os.listdir(background_block_diagonal_beams_folder) if f.endswith('.h5')])
+# Get sorted lists of shots, any of the folders can also be a repacked store (green_mot/repack.py)
+primary_files = list_shot_files(primary_data_folder)
+bg1_files = list_shot_files(background_block_main_beams_folder)
+bg2_files = list_shot_files(background_block_diagonal_beams_folder)
 
 cropped_images = []
 
-# Iterate through files
-for primary_file, bg1_file, bg2_file in zip(primary_files, bg1_files, bg2_files):
-    with h5py.File(primary_file, "r") as h5_primary, \
-         h5py.File(bg1_file, "r") as h5_bg1, \
-         h5py.File(bg2_file, "r") as h5_bg2:
+# Only the cropping region is read from each file, the background subtraction is done pixel by pixel so cropping
+# first gives the same result. Shot i of the primary folder is paired with shot i of each background folder before
+# loading, one loader reads all three and the frames are looked up by file path
+roi = (top, bottom, left, right)
+if not len(primary_files) == len(bg1_files) == len(bg2_files):
+    print(f"Warning: {len(primary_files)} primary shots but {len(bg1_files)} and {len(bg2_files)} background "
+          f"shots, only the first {min(len(primary_files), len(bg1_files), len(bg2_files))} are paired")
+shot_triplets = list(zip(primary_files, bg1_files, bg2_files))
+
+# Shots that fail screening (no frame, missing globals, saturated, T_WAIT outlier, see green_mot/screening.py) are
+# left out together with the shots they are paired with, the reasons go into the results table
+screening = {}
+for folder in (primary_data_folder, background_block_main_beams_folder, background_block_diagonal_beams_folder):
+    screening.update(screen_folder(folder))
+excluded_shots = {}  # primary file -> reasons
+for triplet in shot_triplets:
+    reasons = [('' if f == triplet[0] else f"{os.path.basename(os.path.dirname(f))}: ") + screening[f][1]
+               for f in triplet if f in screening and not screening[f][0]]
+    if reasons:
+        excluded_shots[triplet[0]] = '; '.join(reasons)
+shot_triplets = [triplet for triplet in shot_triplets if triplet[0] not in excluded_shots]
+
+loaded = {}
+for file_path, frame, file_globals in PrefetchLoader([f for triplet in shot_triplets for f in triplet], roi,
+                                                     depth=3 * prefetch_depth):
+    loaded[file_path] = (frame, file_globals)
 
-        # Extract frame data
-        primary_data = h5_primary['images/cam1/after ramp/frame'][:]
-        bg1_data = h5_bg1['images/cam1/after ramp/frame'][:]
-        bg2_data = h5_bg2['images/cam1/after ramp/frame'][:]
+# Iterate through files
+for triplet in shot_triplets:
+    missing = [f for f in triplet if f not in loaded]
+    if missing:
+        raise ValueError(f"No frame in {', '.join(missing)}, the shots of {triplet[0]} can not be paired")
+    (primary_data, primary_globals), (bg1_data, _), (bg2_data, _) = (loaded.pop(f) for f in triplet)
 
-        # Combine and subtract backgrounds
-        combined_bg = cv2.add(bg1_data, bg2_data)
-        modified_data = cv2.subtract(primary_data, combined_bg)
+    # Combine and subtract backgrounds
+    combined_bg = cv2.add(bg1_data, bg2_data)
+    cropped_image = cv2.subtract(primary_data, combined_bg)
+    cropped_images.append(cropped_image)
 
-        # Crop the image
-        cropped_image = modified_data[top:bottom, left:right]
-        cropped_images.append(cropped_image)
+    shot_files.append(triplet[0])
+    shot_globals.append(primary_globals)
 
-        # Extract metadata for title
-        t_wait = h5_primary['globals'].attrs.get('T_WAIT', 'N/A')
-        file_titles.append(f"Wait time {t_wait} s")
+    # Extract metadata for title
+    t_wait = primary_globals.get('T_WAIT', 'N/A')
+    file_titles.append(f"Wait time {t_wait} s")
 
 # Extract the T_WAIT values and calculate the sum of pixel intensities for each image
 t_wait_values = []
@@ -63,7 +108,7 @@ for cropped_image, title in zip(cropped_images, file_titles):
     t_wait_values.append(t_wait)
 
     # Calculate the sum of pixel intensities for the cropped image
-    pixel_sum = np.sum(cropped_image)
+    pixel_sum = np.sum(cropped_image, dtype=np.float64)
     pixel_sums.append(pixel_sum)
 
 # Sort data by T_WAIT values for a clean plot
@@ -71,6 +116,22 @@ sorted_indices = np.argsort(t_wait_values)
 t_wait_values = np.array(t_wait_values)[sorted_indices]
 pixel_sums = np.array(pixel_sums)[sorted_indices]
 
+if calibration is not None:
+    # Globals recorded in the shots (e.g. EXPOSURE_TIME) take precedence over the calibration config
+    shot_table = select({'file_path': shot_files, 'globals': shot_globals}, sorted_indices)
+    atom_number_values = atom_numbers(shot_table, pixel_sums, calibration)
+
+if save_results:
+    # Written on a background thread while the plots below are shown
+    results_writer = ResultsWriter('release_and_recapture_green_mot', 'results/release_and_recapture_green_mot.h5')
+    for i, index in enumerate(sorted_indices):
+        values = {'t_wait': t_wait_values[i], 'pixel_sum': pixel_sums[i]}
+        if calibration is not None:
+            values['atom_number'] = atom_number_values[i]
+        results_writer.write(shot_files[index], dict(values, usable=True, reasons=''))
+    for primary_file, reasons in excluded_shots.items():
+        results_writer.write(primary_file, {'usable': False, 'reasons': reasons})
+
 # Plot cropped images
 cols = 4
 num_files = len(cropped_images)
@@ -100,4 +161,14 @@ plt.title('Sum of Pixel Values vs Time (Background1 and Background2 Subtracted)'
 plt.grid(True)
 plt.show()
 
-
+if calibration is not None:
+    plt.figure(figsize=(8, 6))
+    plt.scatter(t_wait_values, atom_number_values, color='green')
+    plt.xlabel('Time (t)')
+    plt.ylabel('Atom number')
+    plt.title('Atom Number vs Time (Background1 and Background2 Subtracted)')
+    plt.grid(True)
+    plt.show()
+
+if save_results:
+    results_writer.close()
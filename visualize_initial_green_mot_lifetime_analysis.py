@@ -1,4 +1,3 @@
-import h5py
 import numpy as np
 import os
 import cv2
@@ -8,9 +7,11 @@ import re
 matplotlib.use('TkAgg')
 import matplotlib.pyplot as plt
 
+from green_mot.mosaic import render_mosaic, show_mosaic
+from green_mot.shots import list_shot_files, read_frame, shot_folders
+
 # Specify the main directory where subfolders are located
 main_folder_path = "data/20250123TOF_withBlueMOTBeams/NoRamp_4V"  # Replace with your directory path
-image_dataset_path = 'images/cam1/after ramp/frame'
 
 # List to store the file paths, folder names, and image data
 file_info = []
@@ -50,68 +51,41 @@ def parse_folder_name(folder_name):
     return "Unknown"
 
 
-# Iterate through the subfolders in the main directory
-for subfolder_name in os.listdir(main_folder_path):
-    subfolder_path = os.path.join(main_folder_path, subfolder_name)
+# Iterate through the subfolders in the main directory, a subfolder can also be a repacked store
+# (green_mot/repack.py), the shots are listed and read through green_mot.shots
+for subfolder_name, subfolder_path in shot_folders(main_folder_path):
+    # Parse the folder name for experiment information
+    parsed_title = parse_folder_name(subfolder_name)
 
-    # Check if it is a folder
-    if os.path.isdir(subfolder_path):
-        # Parse the folder name for experiment information
-        parsed_title = parse_folder_name(subfolder_name)
+    # Skip folders with invalid or unknown titles (like "zeeman")
+    if parsed_title == "Unknown":
+        continue
 
-        # Skip folders with invalid or unknown titles (like "zeeman")
-        if parsed_title == "Unknown":
+    # Look for the shots in the subfolder
+    for file_path in list_shot_files(subfolder_path):
+        # Extract frame data, only the cropping region is read, None when the shot has no frame
+        cropped_frame = read_frame(file_path, (top, bottom, left, right))
+        if cropped_frame is None:
             continue
 
-        # Look for .h5 files in the subfolder
-        for file_name in os.listdir(subfolder_path):
-            if file_name.endswith(".h5"):  # Check for .h5 files
-                file_path = os.path.join(subfolder_path, file_name)
-
-                # Open the .h5 file
-                with h5py.File(file_path, "r") as h5_file:
-                    # Extract frame data
-                    frame_data = None
-                    if image_dataset_path in h5_file:
-                        frame_data = h5_file[image_dataset_path][:]
-
-                        # Apply fixed bounds for cropping
-                        cropped_frame = frame_data[top:bottom, left:right]
-
-                        # Store the cropped image and the folder name
-                        file_info.append({
-                            "folder_name": subfolder_name,
-                            "parsed_title": parsed_title,  # Ensure parsed title is included
-                            "file_path": file_path,
-                            "cropped_image": cropped_frame  # Add cropped image here
-                        })
+        # Store the cropped image and the folder name
+        file_info.append({
+            "folder_name": subfolder_name,
+            "parsed_title": parsed_title,  # Ensure parsed title is included
+            "file_path": file_path,
+            "cropped_image": cropped_frame  # Add cropped image here
+        })
 
 # Number of cropped images to display
 num_images = len(file_info)
 
-# Determine the grid size for subplots
+# Draw all crops as one mosaic image (green_mot/mosaic.py), a single imshow no matter how many shots there are
 cols = 5  # Number of columns in the grid
-rows = (num_images + cols - 1) // cols  # Calculate the number of rows required
-
-# Create a figure for the subplots
-fig, axes = plt.subplots(rows, cols, figsize=(15, 5 * rows))
-
-# Flatten axes for easy indexing
-axes = axes.flatten()
-
-# Display each cropped image in a subplot
-for i, info in enumerate(file_info):
-    axes[i].imshow(info['cropped_image'], cmap='gray')
-
-    # Add text to the cropped image at adjustable position
-    axes[i].text(text_x, info['cropped_image'].shape[0] - text_y, info['parsed_title'], color='white', fontsize=12,
-                 ha='left', va='bottom')
-    axes[i].axis('off')  # Hide axes for a cleaner look
-
-# Hide unused subplots
-for j in range(i + 1, len(axes)):
-    axes[j].axis('off')
+crop_height = file_info[0]['cropped_image'].shape[0]
+mosaic = render_mosaic(np.stack([info['cropped_image'] for info in file_info]),
+                       [info['parsed_title'] for info in file_info], cols=cols, normalization='panel',
+                       text_position=(text_x, crop_height - text_y))
+show_mosaic(mosaic)
 
 # Display the plot
-plt.tight_layout()
 plt.show()